@@ -1,30 +1,58 @@
 # 修改导入语句，添加Response
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_file
+from urllib.parse import urlencode
 import pandas as pd
 import json
 from datetime import datetime, timedelta
 import os
 import time
+import threading
 
 from strategy import PairTradingStrategy
-from backtest import Backtest
+from backtest import Backtest, load_backtest_series
 from execution import ExecutionSystem
 from tca import TCA
+from sweep import run_parameter_sweep, build_param_grid
+from walk_forward import run_walk_forward
+from price_store import get_price_store
+from panel_cache import get_panel_cache
+from result_store import get_result_store, run_fingerprint
+from events import EventBroker, ExecutionEventPublisher, parse_last_event_id, apply_execution_event, empty_execution_state
+from jobs import get_job_manager
+from charts import get_chart_cache, series_payload, CHART_DRAWERS, CHART_MAX_POINTS
 import database as db
-import yfinance as yf
 from config.config import STRATEGY_CONFIG, BACKTEST_CONFIG, FRONTEND_CONFIG
 
 app = Flask(__name__)
 
-# 在app.py中，初始化组件后调用display_pairs_info方法
+# 组件在第一次使用时才创建：导入app不访问网络、不加载行情数据，工作进程可以很快启动
+_components = {}
+_components_lock = threading.Lock()
 
-# 初始化组件
-strategy = PairTradingStrategy()
-# 显示股票对信息
-strategy.display_pairs_info()
-backtest = Backtest(strategy_class=PairTradingStrategy)
-execution_system = ExecutionSystem(strategy=strategy)
-tca = TCA()
+def get_component(name, factory):
+    """获取进程内共享的组件，不存在时用factory创建"""
+    component = _components.get(name)
+    if component is None:
+        with _components_lock:
+            component = _components.get(name)
+            if component is None:
+                component = _components[name] = factory()
+    return component
+
+def get_strategy():
+    return get_component('strategy', PairTradingStrategy)
+
+def get_execution_system():
+    return get_component('execution_system', lambda: ExecutionSystem(strategy=get_strategy()))
+
+def current_execution_equity():
+    """执行系统当天的权益，还没有开始回放时返回None"""
+    execution_system = get_execution_system()
+    return execution_system.equity_curve[-1] if len(execution_system.equity_curve) > 1 else None
+
+# 执行系统的事件流，update_callback发布增量事件，SSE接口订阅
+execution_events = EventBroker(reducer=apply_execution_event, state=empty_execution_state())
+execution_publisher = ExecutionEventPublisher(execution_events, equity_source=current_execution_equity)
 
 # 确保数据库存在
 db.ensure_db_exists()
@@ -60,58 +88,95 @@ def update_strategy_config():
             STRATEGY_CONFIG[key] = value
     
     # 重新初始化策略
-    strategy = PairTradingStrategy(config=STRATEGY_CONFIG)
+    with _components_lock:
+        _components['strategy'] = PairTradingStrategy(config=STRATEGY_CONFIG)
     
     return jsonify({'status': 'success', 'config': STRATEGY_CONFIG})
 
-@app.route('/api/backtest/run', methods=['POST'])
-# 在app.py中找到处理回测结果的路由函数，确保它正确传递计算的指标
+def format_backtest_result(results, run_id=None, cached=False, db_run_id=None):
+    """把回测结果整理成接口返回的格式
 
-@app.route('/run_backtest', methods=['POST'])
-def run_backtest():
-    """运行回测"""
-    data = request.json
-    
+    Args:
+        run_id: 结果缓存中的id，图表读取这次回测的序列
+        cached: 结果是否来自缓存
+        db_run_id: 交易记录和绩效数据在数据库中的run_id，交易成本分析等接口按它查询
+    """
+    # 确保指标是字符串格式，避免前端处理问题
+    metrics = results.get('metrics', {})
+    formatted_metrics = {
+        'total_return': f"{metrics.get('total_return', 0):.2%}",
+        'annual_return': f"{metrics.get('annual_return', 0):.2f}",
+        'sharpe_ratio': f"{metrics.get('sharpe_ratio', 0):.2f}",
+        'max_drawdown': f"{metrics.get('max_drawdown', 0):.2%}",
+        'win_rate': f"{metrics.get('win_rate', 0):.2%}",
+        'profit_loss_ratio': f"{metrics.get('profit_loss_ratio', 0):.2f}",
+        'total_trades': f"{metrics.get('total_trades', 0)}"
+    }
+    
+    # 添加交易记录到响应
+    trades = results.get('trades', [])
+    
+    # 调试信息
+    print(f"回测完成，总交易次数: {formatted_metrics['total_trades']}")
+    print(f"交易记录数量: {len(trades)}")
+    
+    return {
+        'status': 'success',
+        'message': '回测完成（缓存结果）' if cached else '回测完成',
+        'metrics': formatted_metrics,
+        'trades': trades,
+        'run_id': run_id,
+        'db_run_id': db_run_id,
+        'cached': cached,
+        'chart_url': f'/api/charts/backtest.png?run={run_id}' if run_id else '/api/charts/backtest.png'
+    }
+
+def run_backtest_job(data, job=None):
+    """按请求参数运行一次回测，job不为None时报告进度并支持取消
+
+    回测配置、策略配置和价格数据都相同的结果直接从缓存读取，use_cache为false时强制重新计算
+    """
     # 更新回测配置
     config = BACKTEST_CONFIG.copy()
     for key, value in data.items():
         if key in config:
             config[key] = value
+    mode = data.get('mode', 'loop')
+    strategy_config = dict(STRATEGY_CONFIG)
+    
+    store = get_result_store()
+    run_id = run_fingerprint(config, strategy_config, mode)
+    if data.get('use_cache', True):
+        cached = store.load(run_id)
+        if cached is not None:
+            print(f"使用缓存的回测结果: {run_id}")
+            return format_backtest_result(cached, run_id=run_id, cached=True,
+                                          db_run_id=(store.summary(run_id) or {}).get('db_run_id'))
+    
+    # 运行回测，mode可选loop（逐日循环）或vectorized（向量化）
+    backtest = Backtest(strategy_class=PairTradingStrategy, config=config, mode=mode,
+                        strategy_config=strategy_config)
+    if job is not None:
+        backtest.progress_callback = job.progress_callback
+    results = backtest.run()
     
     try:
-        # 运行回测
-        backtest = Backtest(strategy_class=PairTradingStrategy, config=config)
-        results = backtest.run()
-        
-        # 确保将实际计算的指标传递给前端
-        metrics = results['metrics']
-        
-        # 确保指标是字符串格式，避免前端处理问题
-        metrics = results.get('metrics', {})
-        formatted_metrics = {
-            'total_return': f"{metrics.get('total_return', 0):.2%}",
-            'annual_return': f"{metrics.get('annual_return', 0):.2f}",
-            'sharpe_ratio': f"{metrics.get('sharpe_ratio', 0):.2f}",
-            'max_drawdown': f"{metrics.get('max_drawdown', 0):.2%}",
-            'win_rate': f"{metrics.get('win_rate', 0):.2%}",
-            'profit_loss_ratio': f"{metrics.get('profit_loss_ratio', 0):.2f}",
-            'total_trades': f"{metrics.get('total_trades', 0)}"
-        }
-        
-        # 添加交易记录到响应
-        trades = results.get('trades', [])
-        
-        # 调试信息
-        print(f"回测完成，总交易次数: {formatted_metrics['total_trades']}")
-        print(f"交易记录数量: {len(trades)}")
+        store.save(run_id, {'backtest': config, 'strategy': strategy_config, 'mode': mode},
+                   results, backtest.get_series()['dates'], db_run_id=backtest.run_id)
+    except Exception as e:
+        # 缓存写入失败不影响本次回测结果
+        print(f"保存回测结果缓存时出错: {e}")
+        run_id = None
+    return format_backtest_result(results, run_id=run_id, db_run_id=backtest.run_id)
 
-        return jsonify({
-            'status': 'success',
-            'message': '回测完成',
-            'metrics': formatted_metrics,
-            'trades': trades,
-            'chart_url': 'static/backtest_results.png'
-        })
+@app.route('/api/backtest/run', methods=['POST'])
+@app.route('/run_backtest', methods=['POST'])
+def run_backtest():
+    """在请求中同步运行回测，耗时较长的回测请使用/api/backtest/jobs"""
+    data = request.json or {}
+    
+    try:
+        return jsonify(run_backtest_job(data))
         
     except Exception as e:
         import traceback
@@ -122,14 +187,246 @@ def run_backtest():
             'message': f'回测过程中发生错误: {str(e)}'
         })
 
+@app.route('/api/backtest/jobs', methods=['POST'])
+def submit_backtest_job():
+    """提交后台回测任务，立即返回任务id"""
+    data = request.get_json(silent=True) or {}
+    try:
+        job = get_job_manager().submit('backtest', run_backtest_job, data)
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    
+    return jsonify({'status': 'success', 'job_id': job.id, 'job': job.summary(),
+                    'events_url': f'/api/backtest/jobs/{job.id}/events'})
+
+@app.route('/api/backtest/jobs', methods=['GET'])
+def list_backtest_jobs():
+    """列出所有回测任务"""
+    return jsonify({'status': 'success', 'jobs': get_job_manager().list_jobs()})
+
+@app.route('/api/backtest/jobs/<job_id>', methods=['GET'])
+def get_backtest_job(job_id):
+    """查询回测任务的状态，完成后包含回测结果"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'任务不存在: {job_id}'})
+    
+    response = {'status': 'success', 'job': job.summary()}
+    if job.status == 'completed':
+        response['result'] = job.result
+    return jsonify(response)
+
+@app.route('/api/backtest/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_backtest_job(job_id):
+    """取消排队中或运行中的回测任务"""
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'任务不存在: {job_id}'})
+    return jsonify({'status': 'success', 'job': job.summary()})
+
+@app.route('/api/backtest/jobs/<job_id>/events')
+def backtest_job_events(job_id):
+    """回测任务的进度流，任务结束后关闭连接，支持Last-Event-ID断点续传"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'任务不存在: {job_id}'})
+    
+    last_event_id = parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    return Response(job.events.stream(last_event_id, closed=lambda: job.finished), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/runs', methods=['GET'])
+def list_runs():
+    """最近的回测和执行记录，kind可选backtest或execution"""
+    kind = request.args.get('kind')
+    if kind is not None and kind not in db.RUN_KINDS:
+        return jsonify({'status': 'error', 'message': f'不支持的运行类型: {kind}，可选 {list(db.RUN_KINDS)}'})
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'limit必须是整数'})
+    
+    return jsonify({'status': 'success', 'runs': db.list_runs(kind=kind, limit=limit)})
+
+@app.route('/api/runs/purge', methods=['POST'])
+def purge_runs():
+    """删除旧运行的交易记录和绩效数据：指定run_ids时删除这些运行，否则只保留最近keep次"""
+    data = request.get_json(silent=True) or {}
+    
+    if data.get('run_ids'):
+        deleted = db.purge_runs(data['run_ids'])
+        return jsonify({'status': 'success', 'run_ids': data['run_ids'], **deleted})
+    
+    try:
+        keep = int(data.get('keep', 10))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'keep必须是整数'})
+    return jsonify({'status': 'success', **db.purge_old_runs(keep)})
+
+@app.route('/api/backtest/results', methods=['GET'])
+def list_backtest_results():
+    """列出缓存的回测结果摘要，最近使用的在前"""
+    store = get_result_store()
+    return jsonify({'status': 'success', 'runs': store.list_runs(), 'stats': store.stats()})
+
+@app.route('/api/backtest/results/compare', methods=['GET'])
+def compare_backtest_results():
+    """比较多个缓存结果的参数和指标，ids为逗号分隔的结果id"""
+    run_ids = [run_id for run_id in request.args.get('ids', '').split(',') if run_id]
+    if len(run_ids) < 2:
+        return jsonify({'status': 'error', 'message': '至少需要两个回测结果id'})
+
+    try:
+        comparison = get_result_store().compare(run_ids)
+    except KeyError as e:
+        return jsonify({'status': 'error', 'message': f'回测结果不存在: {e.args[0]}'})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+    return jsonify({'status': 'success', **comparison})
+
+@app.route('/api/backtest/results/<run_id>', methods=['GET', 'DELETE'])
+def backtest_result(run_id):
+    """读取或删除一个缓存的回测结果"""
+    store = get_result_store()
+    try:
+        if request.method == 'DELETE':
+            return jsonify({'status': 'success', 'deleted': store.delete(run_id)})
+        results = store.load(run_id)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+    if results is None:
+        return jsonify({'status': 'error', 'message': f'回测结果不存在: {run_id}'})
+    summary = store.summary(run_id) or {}
+    return jsonify({**format_backtest_result(results, run_id=run_id, cached=True, db_run_id=summary.get('db_run_id')),
+                    'summary': summary})
+
+def request_backtest_config(data):
+    """用请求参数覆盖BACKTEST_CONFIG中的同名项"""
+    config = BACKTEST_CONFIG.copy()
+    for key, value in data.items():
+        if key in config:
+            config[key] = value
+    return config
+
+def run_sweep_job(data, job=None):
+    """按请求参数运行参数扫描，job不为None时报告进度并支持取消"""
+    results = run_parameter_sweep(
+        data.get('params', {}),
+        backtest_config=request_backtest_config(data),
+        mode=data.get('mode', 'vectorized'),
+        max_workers=data.get('max_workers'),
+        rank_by=data.get('rank_by', 'sharpe_ratio'),
+        progress_callback=job.progress_callback if job is not None else None
+    )
+
+    # 只返回前top_n组结果
+    top_n = data.get('top_n')
+    if top_n:
+        results['results'] = results['results'][:int(top_n)]
+    return results
+
+def run_walk_forward_job(data, job=None):
+    """按请求参数运行滚动优化，start_date和end_date为整个滚动优化的区间"""
+    return run_walk_forward(
+        data.get('params', {}),
+        in_sample_days=int(data.get('in_sample_days', 252)),
+        out_of_sample_days=int(data.get('out_of_sample_days', 63)),
+        step_days=data.get('step_days'),
+        backtest_config=request_backtest_config(data),
+        mode=data.get('mode', 'vectorized'),
+        max_workers=data.get('max_workers'),
+        rank_by=data.get('rank_by', 'sharpe_ratio'),
+        progress_callback=job.progress_callback if job is not None else None
+    )
+
+def submit_grid_job(kind, target, data):
+    """检查参数范围后提交参数扫描类的后台任务，立即返回任务id"""
+    try:
+        # 参数名错误时直接返回，不进入任务队列
+        build_param_grid(data.get('params', {}))
+        job = get_job_manager().submit(kind, target, data)
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+
+    return jsonify({'status': 'success', 'job_id': job.id, 'job': job.summary(),
+                    'events_url': f'/api/backtest/jobs/{job.id}/events'})
+
+@app.route('/api/backtest/sweep', methods=['POST'])
+def run_backtest_sweep():
+    """提交参数扫描后台任务，通过/api/backtest/jobs/<job_id>查询进度和按指标排序的结果表"""
+    return submit_grid_job('sweep', run_sweep_job, request.get_json(silent=True) or {})
+
+@app.route('/api/backtest/walk_forward', methods=['POST'])
+def run_backtest_walk_forward():
+    """提交滚动优化后台任务，完成后的结果包含每个窗口的最优参数和样本外表现"""
+    return submit_grid_job('walk_forward', run_walk_forward_job, request.get_json(silent=True) or {})
+
+@app.route('/api/pairs/universe', methods=['GET'])
+def get_pair_universe():
+    """获取最近一次股票对扫描的结果"""
+    top_n = request.args.get('top_n', type=int)
+    universe = db.get_pair_universe(top_n=top_n)
+
+    if universe.empty:
+        return jsonify({
+            'status': 'error',
+            'message': '没有股票对扫描结果，请先运行 python pair_scanner.py'
+        })
+
+    return jsonify({
+        'status': 'success',
+        'scan_time': universe['scan_time'].iloc[0],
+        'pairs': universe.to_dict('records')
+    })
+
+# 数据覆盖报告的缓存时间（秒）
+COVERAGE_CACHE_SECONDS = 3600
+
+def get_coverage_job(refresh=False):
+    """股票对数据覆盖报告的后台任务，结束后COVERAGE_CACHE_SECONDS秒内复用结果"""
+    with _components_lock:
+        job = _components.get('coverage_job')
+        expired = job is not None and job.finished and (
+            job.status != 'completed' or time.time() - job.finished_at > COVERAGE_CACHE_SECONDS)
+        if job is None or expired or (refresh and job.finished):
+            job = get_job_manager().submit('coverage', lambda params, job: get_strategy().get_pairs_coverage(), {})
+            _components['coverage_job'] = job
+    return job
+
+@app.route('/api/pairs/coverage', methods=['GET'])
+def get_pairs_coverage():
+    """股票对最近3年的数据覆盖情况，第一次请求时在后台生成"""
+    try:
+        job = get_coverage_job(refresh=request.args.get('refresh') == '1')
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    
+    response = {'status': 'success', 'job': job.summary()}
+    if job.status == 'completed':
+        response['pairs'] = job.result
+    return jsonify(response)
+
+@app.route('/api/market_data/cache', methods=['GET', 'POST'])
+def market_data_cache():
+    """进程内价格面板缓存的使用情况，POST时清空缓存（其他进程修改了stock_data后使用）"""
+    cache = get_panel_cache()
+    if request.method == 'POST':
+        cache.invalidate()
+    return jsonify({'status': 'success', 'cache': cache.stats()})
+
 @app.route('/api/backtest/metrics', methods=['GET'])
 def get_backtest_metrics():
     """获取回测指标"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    run_id = resolve_run_id(request.args)
     
     # 获取绩效数据
-    performance = db.get_performance_data(start_date, end_date)
+    performance = db.get_performance_data(start_date, end_date, run_id=run_id)
     
     if performance.empty:
         return jsonify({
@@ -153,7 +450,7 @@ def get_backtest_metrics():
     sharpe_ratio = performance.iloc[-1]['sharpe']
     
     # 获取交易记录
-    trades = db.get_trades(start_date, end_date)
+    trades = db.get_trades(start_date, end_date, run_id=run_id)
     
     # 计算胜率
     profitable_trades = trades[trades['pnl'] > 0]
@@ -167,6 +464,7 @@ def get_backtest_metrics():
     
     return jsonify({
         'status': 'success',
+        'run_id': run_id,
         'metrics': {
             'total_return': total_return,
             'annual_return': annual_return,
@@ -183,20 +481,16 @@ def get_backtest_metrics():
 @app.route('/api/execution/start', methods=['POST'])
 def start_execution():
     """启动执行系统"""
-    def update_callback(progress, date_str, metrics, trades):
-        # 将更新推送到全局变量，供SSE接口使用
-        global execution_progress, execution_date, execution_metrics, execution_trades
-        execution_progress = progress
-        execution_date = date_str
-        execution_metrics = metrics
-        execution_trades = trades[-10:] if len(trades) > 10 else trades  # 只保留最近10条交易记录
-
     # 获取当前日期和3个月前的日期作为默认范围
     end_date = datetime.now().strftime('%Y-%m-%d')
     start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
 
-    # 启动执行系统
-    result = execution_system.start(update_callback=update_callback)
+    # 启动执行系统，可以指定回放模式和倍速
+    data = request.get_json(silent=True) or {}
+    if not get_execution_system().running:
+        execution_publisher.start()
+    result = get_execution_system().start(update_callback=execution_publisher,
+                                    replay_mode=data.get('replay_mode'), speed=data.get('speed'))
 
     # 添加日期范围到结果中
     if result.get('status') == 'success':
@@ -208,77 +502,140 @@ def start_execution():
 @app.route('/api/execution/stop', methods=['POST'])
 def stop_execution():
     """停止执行系统"""
-    result = execution_system.stop()
+    result = get_execution_system().stop()
     return jsonify(result)
 
+@app.route('/api/execution/pause', methods=['POST'])
+def pause_execution():
+    """暂停回放"""
+    return jsonify(get_execution_system().pause())
+
+@app.route('/api/execution/resume', methods=['POST'])
+def resume_execution():
+    """恢复回放"""
+    return jsonify(get_execution_system().resume())
+
+@app.route('/api/execution/step', methods=['POST'])
+def step_execution():
+    """暂停状态下推进若干个交易日"""
+    data = request.get_json(silent=True) or {}
+    try:
+        days = int(data.get('days', 1))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'days必须是整数'})
+    return jsonify(get_execution_system().step(days))
+
+@app.route('/api/execution/clock', methods=['GET', 'POST'])
+def execution_clock():
+    """查询或切换回放模式"""
+    if request.method == 'GET':
+        return jsonify({'status': 'success', 'clock': get_execution_system().clock.status()})
+    
+    data = request.get_json(silent=True) or {}
+    if 'mode' not in data:
+        return jsonify({'status': 'error', 'message': '缺少参数mode'})
+    return jsonify(get_execution_system().set_replay_mode(data['mode'], data.get('speed')))
+
 @app.route('/api/execution/status', methods=['GET'])
 def get_execution_status():
     """获取执行系统状态"""
-    status = execution_system.get_status()
+    status = get_execution_system().get_status()
     
     # 添加图表URL
     if status.get('running', False):
         # 添加时间戳参数以避免浏览器缓存
-        status['chart_url'] = f"static/execution_results.png?t={int(time.time())}"
+        status['chart_url'] = f"/api/charts/execution.png?t={int(time.time())}"
     
     return jsonify(status)
 
 # 添加SSE接口，用于实时更新
 @app.route('/api/execution/progress')
 def execution_progress_stream():
-    """执行系统进度流"""
-    def generate():
-        global execution_progress, execution_date, execution_metrics, execution_trades
-        
-        # 确保static目录存在
-        static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-        chart_path = os.path.join(static_dir, 'execution_results.png')
-        
-        # 如果图表不存在，创建一个空白图表
-        if not os.path.exists(chart_path):
-            try:
-                import matplotlib.pyplot as plt
-                plt.figure(figsize=(10, 6))
-                plt.title('策略权益曲线 (等待数据...)')
-                plt.xlabel('交易日')
-                plt.ylabel('权益')
-                plt.grid(True)
-                plt.savefig(chart_path)
-                plt.close()
-                print(f"初始空白图表已创建: {chart_path}")
-            except Exception as e:
-                print(f"创建初始空白图表失败: {e}")
-        
-        while True:
-            # 构建事件数据
-            data = {
-                'progress': execution_progress,
-                'date': execution_date,
-                'metrics': execution_metrics,
-                'trades': execution_trades,
-                'chart_url': f"static/execution_results.png?t={int(time.time())}"  # 添加时间戳避免缓存
-            }
-            
-            # 发送事件
-            yield f"data: {json.dumps(data)}\n\n"
-            
-            # 暂停一下，避免过多请求
-            time.sleep(0.5)
+    """执行系统事件流
+
+    新连接先收到snapshot事件（当前完整状态），之后只收到增量事件：
+    reset、progress、equity、metrics、trade。断线重连时浏览器会带上Last-Event-ID，
+    也可以用last_event_id查询参数指定，从断开处继续接收
+    """
+    last_event_id = parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    return Response(execution_events.stream(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 各序列降采样时用于选取极值点的列
+SERIES_KEYS = {'backtest': 'equity', 'execution': 'equity', 'costs': 'total_cost'}
+
+def resolve_run_id(args, kind='backtest'):
+    """请求参数中的run_id，没有指定时为最近一次运行（kind为None时不区分回测和执行），
+    run_id=all时返回None，读取所有运行的数据"""
+    run_id = args.get('run_id')
+    if run_id == 'all':
+        return None
+    if run_id:
+        return run_id
+    return db.get_latest_run_id(kind)
+
+def load_series(name, args):
+    """读取回测、执行系统或交易成本的序列"""
+    if name == 'backtest':
+        if args.get('run'):
+            series = get_result_store().get_series(args['run'])
+            if series is None:
+                raise ValueError(f"回测结果 {args['run']} 不存在或已被删除")
+            return series
+        return load_backtest_series(args.get('run_id'))
+    if name == 'execution':
+        return get_execution_system().get_series()
+    
+    tca_instance = TCA(start_date=args.get('start_date'), end_date=args.get('end_date'),
+                       run_id=resolve_run_id(args))
+    tca_instance.load_trades()
+    tca_instance.analyze_trades()
+    return tca_instance.get_cost_series()
+
+@app.route('/api/series/<name>', methods=['GET'])
+def get_series(name):
+    """以JSON返回权益、回撤或交易成本序列，max_points指定最多返回的点数"""
+    if name not in SERIES_KEYS:
+        return jsonify({'status': 'error', 'message': f'不支持的序列: {name}，可选 {list(SERIES_KEYS)}'})
+    
+    try:
+        max_points = int(request.args['max_points']) if 'max_points' in request.args else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'max_points必须是整数'})
+    if max_points is not None and max_points < 3:
+        return jsonify({'status': 'error', 'message': 'max_points至少为3'})
     
-    return Response(generate(), mimetype='text/event-stream')
+    try:
+        payload = series_payload(load_series(name, request.args), max_points, key=SERIES_KEYS[name])
+    except Exception as e:
+        print(f"读取序列 {name} 时出错: {e}")
+        return jsonify({'status': 'error', 'message': f'读取序列时出错: {str(e)}'})
+    
+    return jsonify({'status': 'success', 'name': name, **payload})
 
-# 初始化全局变量
-execution_progress = 0
-execution_date = None
-execution_metrics = None
-execution_trades = []
+@app.route('/api/charts/<name>.png', methods=['GET'])
+def get_chart(name):
+    """按需渲染图表，同样的数据直接返回缓存的图片"""
+    if name not in CHART_DRAWERS:
+        return jsonify({'status': 'error', 'message': f'不支持的图表: {name}，可选 {list(CHART_DRAWERS)}'})
+    
+    try:
+        payload = series_payload(load_series(name, request.args), CHART_MAX_POINTS, key=SERIES_KEYS[name])
+        path, digest = get_chart_cache().render(name, payload)
+    except Exception as e:
+        print(f"生成图表 {name} 时出错: {e}")
+        return jsonify({'status': 'error', 'message': f'生成图表时出错: {str(e)}'})
+    
+    return send_file(path, mimetype='image/png', etag=digest, conditional=True, max_age=0)
 
 @app.route('/api/positions', methods=['GET'])
 def get_positions():
     """获取当前持仓"""
     positions = []
     
-    for pair_id, position in strategy.positions.items():
+    for pair_id, position in get_strategy().positions.items():
         positions.append({
             'pair_id': pair_id,
             'type': position['type'],
@@ -294,13 +651,13 @@ def get_positions():
 
 @app.route('/api/trades', methods=['GET'])
 def get_trades():
-    """获取交易记录"""
+    """获取交易记录，run_id指定回测或执行（默认最近一次，all为全部）"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     status = request.args.get('status')
     
-    # 获取交易记录
-    trades = db.get_trades(start_date, end_date, status)
+    # 获取交易记录，默认只读取最近一次回测或执行的记录
+    trades = db.get_trades(start_date, end_date, status, run_id=resolve_run_id(request.args, kind=None))
     
     # 确保返回的是列表
     if trades is None or trades.empty:
@@ -323,11 +680,11 @@ def get_trades():
 
 @app.route('/api/performance', methods=['GET'])
 def get_performance():
-    """获取策略表现"""
+    """获取策略表现，run_id指定回测或执行（默认最近一次，all为全部）"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    performance = db.get_performance_data(start_date, end_date)
+    performance = db.get_performance_data(start_date, end_date, run_id=resolve_run_id(request.args, kind=None))
     
     return jsonify(performance.to_dict('records'))
 
@@ -341,8 +698,11 @@ def run_tca():
     end_date = data.get('end_date')
     
     try:
-        # 运行交易成本分析
-        tca_instance = TCA(start_date=start_date, end_date=end_date)
+        # 运行交易成本分析，默认只分析最近一次回测的交易；
+        # streaming未指定时交易记录较多才分块汇总
+        run_id = resolve_run_id(data)
+        tca_instance = TCA(start_date=start_date, end_date=end_date, run_id=run_id,
+                           streaming=data.get('streaming'))
         
         # 设置进度回调函数
         def progress_callback(progress, message, status=None):
@@ -353,6 +713,11 @@ def run_tca():
         # 运行分析
         results = tca_instance.run()
         
+        # 图表在浏览器请求时按需生成
+        query = urlencode({key: value for key, value in
+                           (('start_date', start_date), ('end_date', end_date), ('run_id', run_id)) if value})
+        chart_url = '/api/charts/costs.png' + (f'?{query}' if query else '')
+        
         # 确保指标是字符串格式，避免前端处理问题
         metrics = results.get('metrics', {})
         formatted_metrics = {
@@ -375,7 +740,9 @@ def run_tca():
             'message': results.get('message', '交易成本分析完成'),
             'metrics': formatted_metrics,
             'trade_details': results.get('trade_details', []),
-            'chart_url': results.get('chart_url', 'static/tca_analysis.png')
+            'streaming': results.get('streaming', False),
+            'run_id': run_id,
+            'chart_url': chart_url
         })
         
     except Exception as e:
@@ -391,17 +758,8 @@ def run_tca():
 def get_latest_backtest():
     """获取最近一次回测的日期范围"""
     try:
-        # 从数据库获取最近一次回测信息
-        conn = db.get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT start_date, end_date FROM backtest_info 
-            ORDER BY timestamp DESC LIMIT 1
-        """)
-        
-        result = cursor.fetchone()
-        conn.close()
+        # 从数据库获取最近一次回测信息（不包括执行系统的运行）
+        result = db.get_latest_backtest_info()
         
         if result:
             # 将日期格式化为前端需要的格式
@@ -418,7 +776,8 @@ def get_latest_backtest():
             return jsonify({
                 'status': 'success',
                 'start_date': start_date,
-                'end_date': end_date
+                'end_date': end_date,
+                'run_id': result['run_id']
             })
         else:
             # 如果没有回测记录，返回空值
@@ -438,16 +797,11 @@ def get_latest_backtest():
             'end_date': None
         })
         
-# 在导入部分添加
-from strategy import PairTradingStrategy
-import database as db
-import yfinance as yf
-from datetime import datetime, timedelta
-import pandas as pd
-
 # 添加初始化数据的函数
 def initialize_stock_data():
     """在应用启动时加载历史股票数据到数据库"""
+    import yfinance as yf
+    
     print("正在初始化股票数据...")
     
     # 创建策略实例以获取股票对
@@ -513,53 +867,20 @@ def initialize_stock_data():
             df = df.reset_index()
             df['date'] = df['Date'].dt.strftime('%Y%m%d')
             
-            # 批量保存到数据库
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            for _, row in df.iterrows():
-                try:
-                    # 检查是否已存在该记录
-                    cursor.execute(
-                        "SELECT id FROM stock_data WHERE code = ? AND date = ?",
-                        (code, row['date'])
-                    )
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        # 更新现有记录
-                        cursor.execute(
-                            """
-                            UPDATE stock_data 
-                            SET open = ?, high = ?, low = ?, close = ?, volume = ?
-                            WHERE code = ? AND date = ?
-                            """,
-                            (float(row['Open']), float(row['High']), float(row['Low']), 
-                             float(row['Close']), float(row['Volume']) if not pd.isna(row['Volume']) else 0,
-                             code, row['date'])
-                        )
-                    else:
-                        # 插入新记录
-                        cursor.execute(
-                            """
-                            INSERT INTO stock_data (code, date, open, high, low, close, volume)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (code, row['date'], float(row['Open']), float(row['High']), 
-                             float(row['Low']), float(row['Close']), 
-                             float(row['Volume']) if not pd.isna(row['Volume']) else 0)
-                        )
-                except Exception as e:
-                    print(f"保存行数据时出错: {e}")
-            
-            conn.commit()
-            conn.close()
+            # 批量保存到数据库，同时追加到列式价格缓存
+            get_price_store().save_stock_data(df, code=code)
             
             print(f"成功加载 {code} 的 {len(df)} 条历史数据")
             
         except Exception as e:
             print(f"加载 {code} 数据时出错: {e}")
     
+    # 缓存不存在或被其他途径的写入弄过期时重建
+    try:
+        get_price_store().refresh()
+    except Exception as e:
+        print(f"重建列式价格缓存时出错: {e}")
+    
     print("股票数据初始化完成")
 
 # 在app.py的主函数中调用初始化函数
@@ -567,6 +888,9 @@ if __name__ == '__main__':
     # 初始化股票数据
     initialize_stock_data()
     
+    # 在后台生成数据覆盖报告，可通过/api/pairs/coverage查看
+    get_coverage_job()
+    
     # 启动Flask应用
     app.run(debug=True)
     
@@ -1,27 +1,80 @@
 import pandas as pd
 import numpy as np
+import time
+from collections import deque
 from datetime import datetime, timedelta
-import matplotlib
-# 设置Matplotlib使用非交互式后端，避免线程问题
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from strategy import PairTradingStrategy
+from strategy import PairTradingStrategy, MarketData, RollingZScore, batch_rolling_zscores
 from config.config import BACKTEST_CONFIG
 import database as db
+from journal import get_journal, JournalWriteError
+from metrics import RunningMetrics
+from panel_cache import get_price_panel
+from charts import get_chart_cache, series_payload, drawdown_series, CHART_MAX_POINTS
+
+# 最大持仓天数（自然日），超过后强制平仓
+MAX_HOLD_DAYS = 20
+# 平仓的z-score阈值
+EXIT_Z_SCORE = 0.5
+
+# 回测引擎模式：loop为逐日循环的参考实现，vectorized为基于数组运算的实现
+BACKTEST_MODES = ('loop', 'vectorized')
+
+def _next_true_index(mask):
+    """返回每个位置及其之后第一个为True的下标，不存在时为len(mask)
+
+    返回数组比mask多一个元素，方便用len(mask)作为下标查询
+    """
+    n = len(mask)
+    index = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(index[::-1])[::-1], n)
+
+def _spread_return(position_type, entry_price1, entry_price2, price1, price2):
+    """计算配对持仓的收益率，与PairTradingStrategy.check_stop_loss的计算方式相同，支持数组"""
+    if position_type == 'long_short':
+        # 做多stock1，做空stock2
+        return (price1 / entry_price1 - 1) + (1 - price2 / entry_price2)
+    # 做空stock1，做多stock2
+    return (1 - price1 / entry_price1) + (price2 / entry_price2 - 1)
 
 class Backtest:
-    def __init__(self, strategy_class=PairTradingStrategy, config=None):
+    def __init__(self, strategy_class=PairTradingStrategy, config=None, mode='loop',
+                 strategy_config=None, save_results=True):
+        """初始化回测
+
+        Args:
+            strategy_class: 策略类
+            config: 回测配置，默认使用BACKTEST_CONFIG。可选的exit_threshold和stop_loss
+                    分别覆盖平仓的z-score阈值（默认EXIT_Z_SCORE）和止损比例（默认不止损）
+            mode: 回测引擎模式，loop或vectorized
+            strategy_config: 策略配置，默认使用STRATEGY_CONFIG
+            save_results: 是否把交易记录、绩效数据写入数据库，参数扫描时关闭
+        """
+        if mode not in BACKTEST_MODES:
+            raise ValueError(f"不支持的回测模式: {mode}，可选值为 {BACKTEST_MODES}")
+        self.mode = mode
+        self.save_results = save_results
+
         self.config = config or BACKTEST_CONFIG
         self.initial_capital = self.config['initial_capital']
         self.start_date = self.config['start_date']
         self.end_date = self.config['end_date']
         self.commission_rate = self.config['commission_rate']
         self.slippage = self.config['slippage']
-        
-        self.strategy = strategy_class()
+        self.exit_threshold = self.config.get('exit_threshold', EXIT_Z_SCORE)
+        self.stop_loss = self.config.get('stop_loss')
+
+        self.strategy = strategy_class(config=strategy_config) if strategy_config else strategy_class()
+
+        # 外部提供的价格面板，设置后load_data不再查询数据库
+        self.shared_panel = None
+        # 多次回测共享的股票对统计量缓存
+        self.pair_stats_cache = None
+        # 本次回测在数据库中的run_id，run()开始时生成
+        self.run_id = None
         self.equity = self.initial_capital
         self.positions = {}
         self.trades = []
+        self.running_metrics = RunningMetrics(self.initial_capital)
         self.daily_returns = []
         self.daily_equity = []
         
@@ -45,7 +98,7 @@ class Backtest:
             self.progress_callback(20, "计算股票对统计数据...")
         
         # 计算股票对的统计数据
-        self.strategy.calculate_pair_stats(self.data)
+        self.strategy.calculate_pair_stats(self.data, stats_cache=self.pair_stats_cache)
         
         # 初始化回测结果
         self.equity_curve = [self.initial_capital]
@@ -53,15 +106,21 @@ class Backtest:
         self.drawdowns = []
         self.positions = {} 
         self.trades = []
+        self.zscore_trackers = {}
+        self.running_metrics = RunningMetrics(self.initial_capital)
 
-        # 保存回测配置信息
+        # 保存回测配置信息，交易记录和绩效数据都带上这次回测的run_id
+        self.run_id = db.new_run_id('backtest')
         backtest_info = {
             'start_date': self.start_date,
             'end_date': self.end_date,
             'initial_capital': self.initial_capital,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'run_id': self.run_id,
+            'kind': 'backtest'
         }
-        db.save_backtest_info(backtest_info)
+        if self.save_results:
+            db.save_backtest_info(backtest_info)
                 
         # 报告进度：开始回测
         if hasattr(self, 'progress_callback') and self.progress_callback:
@@ -71,55 +130,61 @@ class Backtest:
         trading_days = sorted(self.data.keys())
         total_days = len(trading_days)
         
-        # 遍历每个交易日
-        for i, date_str in enumerate(trading_days):
-            # 生成交易信号 - 使用我们自己的方法而不是策略的方法
-            signals = self.generate_signals_for_date(date_str)
+        if self.mode == 'vectorized':
+            # 使用数组运算一次性完成整个日期区间的回测
+            self.run_vectorized(trading_days)
+        else:
+            # 遍历每个交易日
+            for i, date_str in enumerate(trading_days):
+                # 生成交易信号 - 使用我们自己的方法而不是策略的方法
+                signals = self.generate_signals_for_date(date_str)
+            
+                # 调试信息：打印生成的信号
+                if signals:
+                    print(f"日期 {date_str} 生成了 {len(signals)} 个交易信号")
+                    for signal in signals:
+                        print(f"  信号详情: {signal}")
             
-            # 调试信息：打印生成的信号
-            if signals:
-                print(f"日期 {date_str} 生成了 {len(signals)} 个交易信号")
+                # 执行交易
                 for signal in signals:
-                    print(f"  信号详情: {signal}")
-            
-            # 执行交易
-            for signal in signals:
-                # 确保信号包含必要的字段
-                if 'action' not in signal or 'pair_id' not in signal:
-                    print(f"警告: 信号缺少必要字段: {signal}")
-                    continue
+                    # 确保信号包含必要的字段
+                    if 'action' not in signal or 'pair_id' not in signal:
+                        print(f"警告: 信号缺少必要字段: {signal}")
+                        continue
                     
-                # 执行交易
-                self.execute_trade(signal, date_str)
+                    # 执行交易
+                    self.execute_trade(signal, date_str)
             
-            # 更新持仓价值
-            self.update_portfolio_value(date_str)
+                # 更新持仓价值
+                self.update_portfolio_value(date_str)
             
-            # 计算回报和回撤
-            self.calculate_returns_and_drawdowns()
+                # 计算回报和回撤
+                self.calculate_returns_and_drawdowns()
             
-            # 保存每日绩效
-            self.save_daily_performance(date_str)
+                # 保存每日绩效
+                if self.save_results:
+                    self.save_daily_performance(date_str)
             
-            # 更新进度
-            if hasattr(self, 'progress_callback') and self.progress_callback and total_days > 0:
-                progress = 30 + int(60 * (i + 1) / total_days)  # 30%-90%的进度用于回测
-                self.progress_callback(progress, f"回测进度: {i+1}/{total_days} 天")
+                # 更新进度
+                if hasattr(self, 'progress_callback') and self.progress_callback and total_days > 0:
+                    progress = 30 + int(60 * (i + 1) / total_days)  # 30%-90%的进度用于回测
+                    self.progress_callback(progress, f"回测进度: {i+1}/{total_days} 天")
         
         # 报告进度：计算回测指标
         if hasattr(self, 'progress_callback') and self.progress_callback:
             self.progress_callback(90, "计算回测指标...")
         
+        # 等待交易记录和绩效数据写入数据库，回测返回后即可查询；有记录没有写入时回测不算完成
+        if self.save_results:
+            journal = get_journal()
+            journal.flush(run_id=self.run_id)
+            dropped = journal.dropped(self.run_id)
+            if dropped:
+                raise JournalWriteError(f"回测 {self.run_id} 有 {dropped} 条交易记录和绩效数据没有写入数据库")
+
         # 计算回测指标
         self.calculate_metrics()
         
-        # 报告进度：回测完成
-        if hasattr(self, 'progress_callback') and self.progress_callback:
-            self.progress_callback(95, "生成回测图表...")
-        
-        # 绘制回测结果图表
-        self.plot_results()
-        
         # 报告进度：全部完成
         if hasattr(self, 'progress_callback') and self.progress_callback:
             self.progress_callback(100, "回测完成", "completed")
@@ -143,23 +208,13 @@ class Backtest:
             stock2_code = position['stock2_code']
             
             # 获取当前价格
-            if date_str not in self.data or stock1_code not in self.data[date_str] or stock2_code not in self.data[date_str]:
+            stock1_price = self.data.close(date_str, stock1_code)
+            stock2_price = self.data.close(date_str, stock2_code)
+            if stock1_price is None or stock2_price is None:
                 continue
-                
-            stock1_price = self.data[date_str][stock1_code]['close']
-            stock2_price = self.data[date_str][stock2_code]['close']
             
             # 计算当前z-score
-            # 获取历史数据
-            lookback_start = (datetime.strptime(date_str, '%Y%m%d') - timedelta(days=self.strategy.lookback_period * 2)).strftime('%Y%m%d')
-            stock1_data = db.get_stock_data(stock1_code, lookback_start, date_str)
-            stock2_data = db.get_stock_data(stock2_code, lookback_start, date_str)
-            
-            if stock1_data.empty or stock2_data.empty or len(stock1_data) < self.strategy.lookback_period or len(stock2_data) < self.strategy.lookback_period:
-                continue
-                
-            # 计算z-score
-            z_score, _, _ = self.strategy.calculate_spread(stock1_data, stock2_data)
+            z_score, _, _ = self.get_pair_zscore(stock1_code, stock2_code, date_str)
             
             if z_score is None:
                 continue
@@ -167,9 +222,13 @@ class Backtest:
             # 检查是否应该平仓
             # 添加强制平仓条件：持仓超过一定天数
             days_held = (datetime.strptime(date_str, '%Y%m%d') - datetime.strptime(position['open_time'], '%Y%m%d')).days
-            max_hold_days = 20  # 设置最大持仓天数
-            
-            if days_held >= max_hold_days:
+
+            # 设置了止损比例时，持仓收益低于止损线也强制平仓
+            stop_loss_hit = self.stop_loss is not None and _spread_return(
+                position['type'], position['stock1_price'], position['stock2_price'],
+                stock1_price, stock2_price) < -self.stop_loss
+
+            if days_held >= MAX_HOLD_DAYS or stop_loss_hit:
                 # 强制平仓
                 signals.append({
                     'pair_id': pair_id,
@@ -186,7 +245,7 @@ class Backtest:
                 continue
                 
             # 根据z-score平仓
-            if position['type'] == 'long_short' and z_score > -0.5:  # 修改平仓阈值，使其更容易触发
+            if position['type'] == 'long_short' and z_score > -self.exit_threshold:  # 修改平仓阈值，使其更容易触发
                 # 做多stock1/做空stock2的仓位，当z-score回归到阈值以上时平仓
                 signals.append({
                     'pair_id': pair_id,
@@ -201,7 +260,7 @@ class Backtest:
                 })
                 print(f"生成平仓信号 - 对: {pair_id}, z-score={z_score:.4f}")
             
-            elif position['type'] == 'short_long' and z_score < 0.5:  # 修改平仓阈值，使其更容易触发
+            elif position['type'] == 'short_long' and z_score < self.exit_threshold:  # 修改平仓阈值，使其更容易触发
                 # 做空stock1/做多stock2的仓位，当z-score回归到阈值以下时平仓
                 signals.append({
                     'pair_id': pair_id,
@@ -225,16 +284,8 @@ class Backtest:
             if pair_id in self.positions:
                 continue
                 
-            # 获取历史数据
-            lookback_start = (datetime.strptime(date_str, '%Y%m%d') - timedelta(days=self.strategy.lookback_period * 2)).strftime('%Y%m%d')
-            stock1_data = db.get_stock_data(stock1_code, lookback_start, date_str)
-            stock2_data = db.get_stock_data(stock2_code, lookback_start, date_str)
-            
-            if stock1_data.empty or stock2_data.empty or len(stock1_data) < self.strategy.lookback_period or len(stock2_data) < self.strategy.lookback_period:
-                continue
-            
             # 计算价差
-            z_score, price1, price2 = self.strategy.calculate_spread(stock1_data, stock2_data)
+            z_score, price1, price2 = self.get_pair_zscore(stock1_code, stock2_code, date_str)
             
             if z_score is None:
                 continue
@@ -282,7 +333,7 @@ class Backtest:
             position_type = signal['position_type']
             
             # 计算交易数量
-            position_size = self.equity * 0.1  # 使用10%的资金开仓
+            position_size = self.equity * self.strategy.position_size  # 默认使用10%的资金开仓
             quantity = position_size / (stock1_price + stock2_price)
             
             # 计算交易成本
@@ -303,29 +354,15 @@ class Backtest:
             }
             
             # 记录交易
-            trade = {
-                'timestamp': date_str,
-                'pair_id': pair_id,
-                'action': 'open',
-                'position_type': position_type,
-                'long_code': stock1_code if position_type == 'long_short' else stock2_code,
-                'short_code': stock2_code if position_type == 'long_short' else stock1_code,
-                'long_price': stock1_price if position_type == 'long_short' else stock2_price,
-                'short_price': stock2_price if position_type == 'long_short' else stock1_price,
-                'quantity': quantity,
-                'commission': commission,
-                'status': 'open',
-                # 添加TCA所需的字段
-                'open_price_long': stock1_price if position_type == 'long_short' else stock2_price,
-                'open_price_short': stock2_price if position_type == 'long_short' else stock1_price,
-                'close_price_long': 0.0,  # 开仓时收盘价为0
-                'close_price_short': 0.0  # 开仓时收盘价为0
-            }
+            trade = self._open_trade_record(pair_id, position_type, stock1_code, stock2_code,
+                                            stock1_price, stock2_price, quantity, commission, date_str)
             
             self.trades.append(trade)
+            self.running_metrics.record_trade(trade.get('pnl', 0))
             
             # 保存交易记录到数据库
-            db.save_trade(trade)
+            if self.save_results:
+                get_journal().record_trade(trade, self.run_id)
             
             print(f"开仓: {position_type} 对 {pair_id}, 数量: {quantity:.2f}, 成本: {commission:.2f}")
             
@@ -358,42 +395,69 @@ class Backtest:
             self.equity += pnl - commission
             
             # 记录交易
-            trade = {
-                'timestamp': date_str,
-                'pair_id': pair_id,
-                'action': 'close',
-                'position_type': position_type,
-                'long_code': position['stock1_code'] if position_type == 'long_short' else position['stock2_code'],
-                'short_code': position['stock2_code'] if position_type == 'long_short' else position['stock1_code'],
-                'long_price': stock1_price if position_type == 'long_short' else stock2_price,
-                'short_price': stock2_price if position_type == 'long_short' else stock1_price,
-                'quantity': quantity,
-                'pnl': pnl,
-                'commission': commission,
-                'net_pnl': pnl - commission,
-                'status': 'closed',
-                # 添加TCA所需的字段
-                'open_price_long': position['stock1_price'] if position_type == 'long_short' else position['stock2_price'],
-                'open_price_short': position['stock2_price'] if position_type == 'long_short' else position['stock1_price'],
-                'close_price_long': stock1_price if position_type == 'long_short' else stock2_price,
-                'close_price_short': stock2_price if position_type == 'long_short' else stock1_price
-            }
+            trade = self._close_trade_record(pair_id, position, stock1_price, stock2_price,
+                                             pnl, commission, date_str)
             
             self.trades.append(trade)
+            self.running_metrics.record_trade(trade.get('pnl', 0))
             
             # 保存交易记录到数据库
-            db.save_trade(trade)
+            if self.save_results:
+                get_journal().record_trade(trade, self.run_id)
             
             # 删除持仓
             del self.positions[pair_id]
             
             print(f"平仓: {position_type} 对 {pair_id}, 数量: {quantity:.2f}, 盈亏: {pnl:.2f}, 成本: {commission:.2f}")
     
+    def _open_trade_record(self, pair_id, position_type, stock1_code, stock2_code,
+                           stock1_price, stock2_price, quantity, commission, date_str):
+        """构建开仓交易记录"""
+        return {
+            'timestamp': date_str,
+            'pair_id': pair_id,
+            'action': 'open',
+            'position_type': position_type,
+            'long_code': stock1_code if position_type == 'long_short' else stock2_code,
+            'short_code': stock2_code if position_type == 'long_short' else stock1_code,
+            'long_price': stock1_price if position_type == 'long_short' else stock2_price,
+            'short_price': stock2_price if position_type == 'long_short' else stock1_price,
+            'quantity': quantity,
+            'commission': commission,
+            'status': 'open',
+            # 添加TCA所需的字段
+            'open_price_long': stock1_price if position_type == 'long_short' else stock2_price,
+            'open_price_short': stock2_price if position_type == 'long_short' else stock1_price,
+            'close_price_long': 0.0,  # 开仓时收盘价为0
+            'close_price_short': 0.0  # 开仓时收盘价为0
+        }
+
+    def _close_trade_record(self, pair_id, position, stock1_price, stock2_price, pnl, commission, date_str):
+        """构建平仓交易记录"""
+        position_type = position['type']
+        return {
+            'timestamp': date_str,
+            'pair_id': pair_id,
+            'action': 'close',
+            'position_type': position_type,
+            'long_code': position['stock1_code'] if position_type == 'long_short' else position['stock2_code'],
+            'short_code': position['stock2_code'] if position_type == 'long_short' else position['stock1_code'],
+            'long_price': stock1_price if position_type == 'long_short' else stock2_price,
+            'short_price': stock2_price if position_type == 'long_short' else stock1_price,
+            'quantity': position['quantity'],
+            'pnl': pnl,
+            'commission': commission,
+            'net_pnl': pnl - commission,
+            'status': 'closed',
+            # 添加TCA所需的字段
+            'open_price_long': position['stock1_price'] if position_type == 'long_short' else position['stock2_price'],
+            'open_price_short': position['stock2_price'] if position_type == 'long_short' else position['stock1_price'],
+            'close_price_long': stock1_price if position_type == 'long_short' else stock2_price,
+            'close_price_short': stock2_price if position_type == 'long_short' else stock1_price
+        }
+
     def update_portfolio_value(self, date_str):
         """更新投资组合价值"""
-        # 获取当前日期的市场数据
-        current_data = self.data[date_str]
-        
         # 计算持仓价值
         portfolio_value = self.equity
         
@@ -402,14 +466,12 @@ class Backtest:
             stock1_code = position['stock1_code']
             stock2_code = position['stock2_code']
             
-            # 检查股票数据是否存在
-            if stock1_code not in current_data or stock2_code not in current_data:
+            # 获取当前价格，股票数据不存在时跳过
+            stock1_price = self.data.close(date_str, stock1_code)
+            stock2_price = self.data.close(date_str, stock2_code)
+            if stock1_price is None or stock2_price is None:
                 continue
             
-            # 获取当前价格
-            stock1_price = current_data[stock1_code]['close']
-            stock2_price = current_data[stock2_code]['close']
-            
             # 计算持仓价值变化
             if position['type'] == 'long_short':  # 修正：使用正确的持仓类型
                 # 做多stock1，做空stock2
@@ -452,43 +514,298 @@ class Backtest:
     
     def calculate_returns_and_drawdowns(self):
         """计算回报和回撤"""
-        """计算回报和回撤"""
-        # 计算每日回报
+        # 计算每日回报和回撤，峰值和最大回撤由running_metrics增量维护
         if len(self.equity_curve) > 1:
-            daily_return = (self.equity_curve[-1] / self.equity_curve[-2]) - 1
+            daily_return, drawdown = self.running_metrics.update_equity(self.equity_curve[-1])
             self.returns.append(daily_return)
-            
-            # 计算累计回报
-            cumulative_return = (self.equity_curve[-1] / self.initial_capital) - 1
-            
-            # 计算最大回撤
-            peak = max(self.equity_curve)
-            drawdown = (peak - self.equity_curve[-1]) / peak if peak > 0 else 0
             self.drawdowns.append(drawdown)
     
     def save_daily_performance(self, date_str):
         """保存每日绩效数据"""
-        # 计算夏普比率
-        if len(self.returns) > 0:
-            avg_return = sum(self.returns) / len(self.returns)
-            std_return = np.std(self.returns) if len(self.returns) > 1 else 0
-            sharpe = avg_return / std_return if std_return > 0 else 0
-        else:
-            sharpe = 0
-        
-        # 计算最大回撤
-        max_drawdown = max(self.drawdowns) if self.drawdowns else 0
-        
-        # 保存到数据库
+        # 夏普比率和最大回撤都取自增量维护的累加器
+        metrics = self.running_metrics
         performance_data = {
             'date': date_str,
             'equity': self.equity,
-            'return': self.returns[-1] if self.returns else 0,  # 这里使用'return'作为键
-            'drawdown': max_drawdown,
-            'sharpe': sharpe
+            'return': metrics.last_return if metrics.last_return is not None else 0,  # 这里使用'return'作为键
+            'drawdown': metrics.max_drawdown,
+            'sharpe': metrics.sharpe(),
+            'run_id': self.run_id
         }
         
-        db.save_performance_data(performance_data)
+        get_journal().record_performance(performance_data)
+
+    def calculate_zscore_matrix(self, trading_days):
+        """计算所有股票对在每个交易日的z-score
+
+        结果与逐日调用get_pair_zscore一致，回溯数据不足的位置为NaN
+
+        Returns:
+            numpy.ndarray: 形状为 (股票对数量, 交易日数量) 的z-score矩阵
+        """
+        lookback = self.strategy.lookback_period
+        rows = np.array([self.date_index[date] for date in trading_days], dtype=int)
+
+        # 每个交易日回溯窗口在价格面板中的起始行
+        lookback_starts = [(datetime.strptime(date, '%Y%m%d') - timedelta(days=lookback * 2)).strftime('%Y%m%d')
+                           for date in trading_days]
+        starts = np.searchsorted(self.panel_dates, lookback_starts, side='left')
+
+        # 有效价格数量的前缀和，用于判断任意窗口内的数据是否充足
+        valid_panel = ~np.isnan(self.close_panel)
+        valid_counts = np.vstack([np.zeros((1, valid_panel.shape[1]), dtype=int), np.cumsum(valid_panel, axis=0)])
+
+        z_matrix = np.full((len(self.strategy.pairs), len(trading_days)), np.nan)
+        pair_ids, index1, index2 = self.strategy.pair_index_arrays(self.symbol_index)
+        if len(pair_ids) == 0:
+            return z_matrix
+
+        # 所有股票对的滚动z-score一次算出，只在两只股票都有价格的日期上滚动，有缓存时直接复用
+        if self.pair_stats_cache is not None:
+            rolling = self.pair_stats_cache.rolling_zscores(index1, index2, lookback)
+        else:
+            rolling = batch_rolling_zscores(self.close_panel, index1, index2, lookback, skip_missing=True)
+
+        # 两只股票各自的有效数据都要达到回溯期长度，形状为 (交易日数量, 股票对数量)
+        enough = (valid_counts[rows + 1][:, index1] - valid_counts[starts][:, index1] >= lookback) & \
+                 (valid_counts[rows + 1][:, index2] - valid_counts[starts][:, index2] >= lookback)
+
+        # 窗口内的共同有效数据也要达到回溯期长度
+        both_valid = valid_panel[:, index1] & valid_panel[:, index2]
+        both_counts = np.vstack([np.zeros((1, len(pair_ids)), dtype=int), np.cumsum(both_valid, axis=0)])
+        enough &= both_counts[rows + 1] - both_counts[starts] >= lookback
+
+        # 缺失的日期沿用最后一个共同有效日期的z-score
+        z_matrix[pair_ids] = np.where(enough.T, rolling['z_score'][:, rows], np.nan)
+
+        return z_matrix
+
+    def find_position_events(self, z_scores, ordinals, prices1, prices2):
+        """根据单个股票对的z-score序列找出所有持仓区间
+
+        开平仓条件与generate_signals_for_date相同，且不依赖资金，因此可以预先计算
+
+        Args:
+            z_scores: 每个交易日的z-score，无法计算的日期为NaN
+            ordinals: 每个交易日的序数日期，用于计算持仓天数
+            prices1: 每个交易日stock1的收盘价
+            prices2: 每个交易日stock2的收盘价
+
+        Returns:
+            list: (开仓下标, 平仓下标, 持仓类型) 的列表，持有到回测结束的平仓下标为None
+        """
+        n = len(z_scores)
+        valid = ~np.isnan(z_scores)
+        entry_threshold = self.strategy.entry_threshold
+
+        next_open = _next_true_index(valid & (np.abs(z_scores) > entry_threshold))
+        next_valid = _next_true_index(valid)
+        next_exit = {
+            'long_short': _next_true_index(valid & (z_scores > -self.exit_threshold)),
+            'short_long': _next_true_index(valid & (z_scores < self.exit_threshold))
+        }
+
+        events = []
+        day = 0
+        while day < n:
+            open_idx = next_open[day]
+            if open_idx >= n:
+                break
+
+            position_type = 'short_long' if z_scores[open_idx] > entry_threshold else 'long_short'
+
+            # 开仓后的下一个交易日才开始检查平仓，z-score回归或持仓超过最大天数时平仓
+            hold_idx = int(np.searchsorted(ordinals, ordinals[open_idx] + MAX_HOLD_DAYS, side='left'))
+            close_idx = min(next_exit[position_type][open_idx + 1], next_valid[max(hold_idx, open_idx + 1)])
+
+            # 止损只需要在开仓到上面的平仓日之间查找
+            if self.stop_loss is not None:
+                window = slice(open_idx + 1, close_idx)
+                returns = _spread_return(position_type, prices1[open_idx], prices2[open_idx],
+                                         prices1[window], prices2[window])
+                stop_days = np.flatnonzero(valid[window] & (returns < -self.stop_loss))
+                if len(stop_days) > 0:
+                    close_idx = open_idx + 1 + stop_days[0]
+
+            if close_idx >= n:
+                events.append((open_idx, None, position_type))
+                break
+
+            events.append((open_idx, close_idx, position_type))
+
+            # 平仓当天不会再开仓
+            day = close_idx + 1
+
+        return events
+
+    def run_vectorized(self, trading_days):
+        """向量化回测引擎
+
+        先用数组运算得到所有股票对的z-score矩阵和持仓区间，再只在有交易的日期推进资金，
+        其余日期的权益通过累加浮动盈亏一次性算出。交易记录和权益曲线与逐日循环的引擎一致。
+        """
+        n_days = len(trading_days)
+        if n_days == 0:
+            return
+
+        rows = np.array([self.date_index[date] for date in trading_days], dtype=int)
+        ordinals = np.array([datetime.strptime(date, '%Y%m%d').toordinal() for date in trading_days])
+
+        z_matrix = self.calculate_zscore_matrix(trading_days)
+
+        if self.progress_callback:
+            self.progress_callback(50, "计算持仓区间...")
+
+        # 收集所有股票对的持仓区间
+        holdings = []
+        for k, (stock1_code, stock2_code) in enumerate(self.strategy.pairs):
+            if np.isnan(z_matrix[k]).all():
+                continue
+
+            prices1 = self.close_panel[rows, self.symbol_index[stock1_code]]
+            prices2 = self.close_panel[rows, self.symbol_index[stock2_code]]
+
+            for open_idx, close_idx, position_type in self.find_position_events(z_matrix[k], ordinals, prices1, prices2):
+                holdings.append({
+                    'pair_index': k,
+                    'pair_id': f"{stock1_code}_{stock2_code}",
+                    'stock1_code': stock1_code,
+                    'stock2_code': stock2_code,
+                    'prices1': prices1,
+                    'prices2': prices2,
+                    'open_idx': open_idx,
+                    'close_idx': close_idx,
+                    'type': position_type
+                })
+
+        # 同一天内先按建仓顺序平仓，再按股票对顺序开仓
+        holdings.sort(key=lambda h: (h['open_idx'], h['pair_index']))
+        opens_by_day = {}
+        closes_by_day = {}
+        for holding in holdings:
+            opens_by_day.setdefault(holding['open_idx'], []).append(holding)
+            if holding['close_idx'] is not None:
+                closes_by_day.setdefault(holding['close_idx'], []).append(holding)
+
+        if self.progress_callback:
+            self.progress_callback(70, "计算权益曲线...")
+
+        # 每日所有持仓的浮动盈亏合计
+        unrealized = np.zeros(n_days)
+        equity_curve = np.empty(n_days)
+        equity = self.initial_capital
+        cursor = 0
+
+        for day in sorted(set(opens_by_day) | set(closes_by_day)):
+            # 没有交易的日期，权益只累加浮动盈亏
+            if day > cursor:
+                equity_curve[cursor:day] = equity + np.cumsum(unrealized[cursor:day])
+                equity = equity_curve[day - 1]
+
+            date_str = trading_days[day]
+
+            for holding in closes_by_day.get(day, []):
+                position = holding['position']
+                quantity = position['quantity']
+                stock1_price = holding['prices1'][day]
+                stock2_price = holding['prices2'][day]
+
+                # 计算盈亏
+                if position['type'] == 'long_short':
+                    pnl = ((stock1_price - stock2_price) - (position['stock1_price'] - position['stock2_price'])) * quantity
+                else:
+                    pnl = ((stock2_price - stock1_price) - (position['stock2_price'] - position['stock1_price'])) * quantity
+
+                commission = (stock1_price + stock2_price) * quantity * self.commission_rate
+                equity += pnl - commission
+
+                self.trades.append(self._close_trade_record(holding['pair_id'], position, stock1_price, stock2_price,
+                                                            pnl, commission, date_str))
+
+            for holding in opens_by_day.get(day, []):
+                position_type = holding['type']
+                stock1_price = holding['prices1'][day]
+                stock2_price = holding['prices2'][day]
+
+                # 默认使用10%的资金开仓
+                quantity = equity * self.strategy.position_size / (stock1_price + stock2_price)
+                commission = (stock1_price + stock2_price) * quantity * self.commission_rate
+                equity -= commission
+
+                holding['position'] = {
+                    'stock1_code': holding['stock1_code'],
+                    'stock2_code': holding['stock2_code'],
+                    'stock1_price': stock1_price,
+                    'stock2_price': stock2_price,
+                    'quantity': quantity,
+                    'type': position_type,
+                    'open_time': date_str
+                }
+
+                self.trades.append(self._open_trade_record(holding['pair_id'], position_type,
+                                                           holding['stock1_code'], holding['stock2_code'],
+                                                           stock1_price, stock2_price, quantity, commission, date_str))
+
+                # 持仓期间（不含平仓日）每天的浮动盈亏
+                end = holding['close_idx'] if holding['close_idx'] is not None else n_days
+                spread_change = (holding['prices1'][day:end] - holding['prices2'][day:end]) - (stock1_price - stock2_price)
+                if position_type == 'long_short':
+                    unrealized[day:end] += spread_change * quantity
+                else:
+                    unrealized[day:end] -= spread_change * quantity
+
+            equity += unrealized[day]
+            equity_curve[day] = equity
+            cursor = day + 1
+
+        if cursor < n_days:
+            equity_curve[cursor:] = equity + np.cumsum(unrealized[cursor:])
+
+        # 回测结束时仍持有的仓位
+        self.positions = {h['pair_id']: h['position'] for h in holdings if h['close_idx'] is None}
+        self.equity = equity_curve[-1]
+
+        # 计算回报和回撤
+        self.equity_curve = [self.initial_capital] + equity_curve.tolist()
+        curve = np.array(self.equity_curve)
+        returns = curve[1:] / curve[:-1] - 1
+        peaks = np.maximum.accumulate(curve)[1:]
+        drawdowns = np.where(peaks > 0, (peaks - curve[1:]) / np.where(peaks > 0, peaks, 1), 0)
+        self.returns = returns.tolist()
+        self.drawdowns = drawdowns.tolist()
+
+        # 累加器与逐日循环的引擎保持一致，供calculate_metrics使用
+        for equity in self.equity_curve[1:]:
+            self.running_metrics.update_equity(equity)
+        for trade in self.trades:
+            self.running_metrics.record_trade(trade.get('pnl', 0))
+
+        if not self.save_results:
+            return
+
+        if self.progress_callback:
+            self.progress_callback(80, "保存交易记录和绩效数据...")
+
+        # 保存交易记录到数据库
+        journal = get_journal()
+        for trade in self.trades:
+            journal.record_trade(trade, self.run_id)
+
+        # 保存每日绩效，夏普比率和最大回撤都按截至当天的数据计算
+        returns_series = pd.Series(returns)
+        std_returns = returns_series.expanding().std(ddof=0)
+        sharpe = (returns_series.expanding().mean() / std_returns).where(std_returns > 0, 0)
+        max_drawdowns = np.maximum.accumulate(drawdowns)
+
+        for i, date_str in enumerate(trading_days):
+            journal.record_performance({
+                'date': date_str,
+                'equity': equity_curve[i],
+                'return': returns[i],
+                'drawdown': max_drawdowns[i],
+                'sharpe': sharpe.iloc[i],
+                'run_id': self.run_id
+            })
 
     def calculate_metrics(self):
         """计算回测指标"""
@@ -511,29 +828,16 @@ class Backtest:
         else:
             annual_return = 0
         
-        # 计算夏普比率
-        if len(self.returns) > 1:
-            daily_returns = np.array(self.returns)
-            sharpe_ratio = np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252) if np.std(daily_returns) > 0 else 0
-        else:
-            sharpe_ratio = 0
-        
-        # 计算最大回撤
-        max_drawdown = max(self.drawdowns) if self.drawdowns else 0
-        
-        # 计算胜率和盈亏比
-        win_trades = [t for t in self.trades if t.get('pnl', 0) > 0]
-        loss_trades = [t for t in self.trades if t.get('pnl', 0) < 0]
+        # 夏普比率、最大回撤、胜率和盈亏比取自增量维护的累加器
+        metrics = self.running_metrics
+        sharpe_ratio = metrics.sharpe(252) if metrics.return_count > 1 else 0
+        max_drawdown = metrics.max_drawdown
         
         # 修复：总交易次数应该是self.trades的长度，而不是胜利和亏损交易的总和
         # 因为可能有pnl为0的交易
-        total_trades = len(self.trades)
-        win_rate = len(win_trades) / total_trades if total_trades > 0 else 0
-        
-        avg_win = sum(t.get('pnl', 0) for t in win_trades) / len(win_trades) if win_trades else 0
-        avg_loss = sum(t.get('pnl', 0) for t in loss_trades) / len(loss_trades) if loss_trades else 0
-        
-        profit_loss_ratio = abs(avg_win / avg_loss) if avg_loss != 0 else 0
+        total_trades = metrics.trade_count
+        win_rate = metrics.win_rate()
+        profit_loss_ratio = metrics.profit_loss_ratio()
         
         # 打印指标
         print(f"总回报率: {total_return:.2%}")
@@ -560,177 +864,241 @@ class Backtest:
     def load_data(self):
         """加载回测数据"""
         self.data = {}
-        
+
+        if self.shared_panel is not None:
+            # 已经提供了价格面板时直接使用
+            panel_dates, self.symbol_index, self.close_panel = self.shared_panel
+            self.panel_dates = np.asarray(panel_dates)
+            self.date_index = {date: i for i, date in enumerate(self.panel_dates)}
+            self.field_panels = {'close': self.close_panel}
+        else:
+            self.load_price_panel()
+
+        self.load_data_from_panel()
+
+    def load_price_panel(self):
+        """加载回测区间（含回溯期）的价格并构建价格面板"""
         # 获取回测日期范围
         start_date = self.start_date
         end_date = self.end_date
         
         print(f"加载回测数据: {start_date} 至 {end_date}")
         
-        # 获取所有股票代码
-        stock_codes = []
-        for pair in self.strategy.pairs:
-            stock_codes.extend(pair)
-        
-        # 去重
-        stock_codes = list(set(stock_codes))
-        
-        # 加载每只股票的数据
-        stock_data = {}
+        # 获取所有股票代码并去重
+        stock_codes = sorted({code for pair in self.strategy.pairs for code in pair})
+
+        # 回溯窗口需要用到回测开始日期之前的数据
+        panel_start = (datetime.strptime(start_date, '%Y%m%d') - timedelta(days=self.strategy.lookback_period * 2)).strftime('%Y%m%d')
+
+        # 优先使用标准化的代码，找不到数据时使用原始代码
+        aliases = {code: [self.strategy.standardize_stock_code(code), code] for code in stock_codes}
+        # 同一进程内加载过相同区间时直接复用只读面板，否则读取列式价格缓存（过期时回退到SQLite）
+        panel = get_price_panel(stock_codes, panel_start, end_date, fields=db.PRICE_FIELDS, aliases=aliases)
+
         for code in stock_codes:
-            # 标准化股票代码
-            std_code = self.strategy.standardize_stock_code(code)
-            print(f"加载股票 {code} (标准化为 {std_code}) 的数据")
-            
-            # 尝试使用标准化的代码获取数据
-            data = db.get_stock_data(std_code, start_date, end_date)
-            
-            # 如果获取不到，尝试使用原始代码
-            if data.empty:
-                print(f"使用标准化代码 {std_code} 未找到数据，尝试使用原始代码 {code}")
-                data = db.get_stock_data(code, start_date, end_date)
-            
-            if data.empty:
+            if code not in panel['resolved']:
                 print(f"警告: 无法获取股票 {code} 的数据")
-                continue
-            
-            # 打印前几行数据用于调试
-            print(f"股票 {code} 的前3行数据:")
-            print(data.head(3))
-            
-            stock_data[code] = data
-        
-        # 确定共同的交易日
-        common_dates = None
-        for code, data in stock_data.items():
-            dates = set(data['date'].unique())
-            if common_dates is None:
-                common_dates = dates
-            else:
-                common_dates = common_dates.intersection(dates)
-        
-        if not common_dates or len(common_dates) == 0:
+
+        # 日期和股票代码都映射为整数下标，回测过程中不再逐日查询数据库
+        self.panel_dates = panel['dates']
+        self.date_index = {date: i for i, date in enumerate(self.panel_dates)}
+        self.symbol_index = panel['symbol_index']
+        self.field_panels = panel['fields']
+        self.close_panel = self.field_panels['close']
+
+        print(f"价格面板构建完成: {len(self.panel_dates)} 个日期 × {len(self.symbol_index)} 只股票")
+
+    def set_price_panel(self, panel_dates, symbol_index, close_panel, stats_cache=None):
+        """使用外部提供的价格面板，load_data时不再查询数据库
+
+        用于参数扫描等场景，多个回测共享同一份只读面板。面板需要覆盖回测区间以及之前的回溯期
+
+        Args:
+            stats_cache: 基于同一面板的PairStatsCache，可选
+        """
+        self.shared_panel = (panel_dates, symbol_index, close_panel)
+        self.pair_stats_cache = stats_cache
+
+    def load_data_from_panel(self):
+        """从价格面板构建回测区间内每个共同交易日的数据"""
+        # 回测区间内有数据的股票
+        stock_codes = sorted({code for pair in self.strategy.pairs for code in pair if code in self.symbol_index})
+        in_range = (self.panel_dates >= self.start_date) & (self.panel_dates <= self.end_date)
+        columns = [self.symbol_index[code] for code in stock_codes]
+        valid = ~np.isnan(self.close_panel[:, columns])
+        loaded = valid[in_range].any(axis=0)
+        stock_codes = [code for code, has_data in zip(stock_codes, loaded) if has_data]
+        columns = [self.symbol_index[code] for code in stock_codes]
+
+        # 共同的交易日：所有股票都有价格的日期
+        common_rows = np.flatnonzero(in_range & valid[:, loaded].all(axis=1)) if stock_codes else []
+        if len(common_rows) == 0:
             print("错误: 没有找到共同的交易日")
             return
-        
-        # 即使数据不足3年，也继续进行回测
-        print(f"找到 {len(common_dates)} 个共同交易日")
-        
-        # 按日期组织数据
-        for date in common_dates:
-            date_data = {}
-            for code, data in stock_data.items():
-                date_df = data[data['date'] == date]
-                if not date_df.empty:
-                    date_data[code] = date_df.iloc[0].to_dict()
-            
-            if date_data:
-                self.data[date] = date_data
-        
-        # 打印第一个日期的数据结构用于调试
-        if self.data:
-            first_date = sorted(self.data.keys())[0]
-            print(f"第一个日期 {first_date} 的数据结构:")
-            for code in self.data[first_date]:
-                print(f"  - {code}")
-    
+
+        print(f"找到 {len(common_rows)} 个共同交易日")
+
+        # 只保留共同交易日和回测用到的股票，按整数下标访问
+        rows = np.ix_(common_rows, columns)
+        self.data = MarketData(self.panel_dates[common_rows], stock_codes,
+                               {field: panel[rows] for field, panel in self.field_panels.items()})
+
+    def get_pair_zscore(self, stock1_code, stock2_code, date_str):
+        """用增量滚动统计量计算股票对截至指定日期的z-score
+
+        每个股票对维护一个RollingZScore，按价格面板的日期顺序逐条加入两只股票都有价格的比率，
+        每个交易日的计算量与回溯期长度无关。回溯窗口为截至该日期lookback_period*2个自然日内的价格，
+        两只股票各自的有效数据都要达到回溯期长度，z-score基于最近lookback_period个两只股票都有价格的比率
+
+        Returns:
+            tuple: (z-score, stock1价格, stock2价格)，数据不足时返回(None, None, None)
+        """
+        if stock1_code not in self.symbol_index or stock2_code not in self.symbol_index or date_str not in self.date_index:
+            return None, None, None
+
+        lookback = self.strategy.lookback_period
+        lookback_start = (datetime.strptime(date_str, '%Y%m%d') - timedelta(days=lookback * 2)).strftime('%Y%m%d')
+        start = int(np.searchsorted(self.panel_dates, lookback_start, side='left'))
+        end = self.date_index[date_str] + 1
+
+        # 日期倒退时重新开始累积
+        tracker = self.zscore_trackers.get((stock1_code, stock2_code))
+        if tracker is None or tracker['next_row'] > end:
+            tracker = {'zscore': RollingZScore(lookback), 'rows': deque(maxlen=lookback), 'next_row': start}
+            self.zscore_trackers[(stock1_code, stock2_code)] = tracker
+
+        j1 = self.symbol_index[stock1_code]
+        j2 = self.symbol_index[stock2_code]
+        for row in range(tracker['next_row'], end):
+            price1 = self.close_panel[row, j1]
+            price2 = self.close_panel[row, j2]
+            if np.isnan(price1) or np.isnan(price2):
+                continue
+            tracker['zscore'].update(price1 / price2)
+            tracker['rows'].append(row)
+        tracker['next_row'] = end
+
+        # 窗口内的共同有效数据都要落在回溯窗口内
+        rows = tracker['rows']
+        if len(rows) < lookback or rows[0] < start:
+            return None, None, None
+
+        z_score = tracker['zscore'].zscore
+        if z_score is None:
+            return None, None, None
+
+        return z_score, self.close_panel[rows[-1], j1], self.close_panel[rows[-1], j2]
+
+    def get_series(self):
+        """回测的日期、权益、每日回报和回撤序列，与交易日一一对应"""
+        dates = sorted(self.data.keys())
+        return {
+            'dates': dates,
+            'equity': self.equity_curve[1:len(dates) + 1],
+            'returns': self.returns[:len(dates)],
+            'drawdown': self.drawdowns[:len(dates)]
+        }
+
     def plot_results(self):
-        """绘制回测结果图表"""
+        """绘制回测结果图表，返回图表文件路径"""
         if not hasattr(self, 'equity_curve') or len(self.equity_curve) == 0:
             print("没有回测数据可供绘图")
             return
         
-        # 设置中文字体
-        import matplotlib.font_manager as fm
-        # 尝试使用系统中常见的中文字体
-        try:
-            # 尝试使用微软雅黑
-            plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS', 'sans-serif']
-            plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
-        except:
-            print("警告: 无法设置中文字体，图表中的中文可能无法正确显示")
-        
-        # 创建图表
-        fig, axes = plt.subplots(3, 1, figsize=(12, 18), gridspec_kw={'height_ratios': [3, 1, 1]})
-        
-        # 绘制权益曲线
-        dates = list(sorted(self.data.keys()))
-        
-        # 确保日期和权益曲线长度一致
-        print(f"日期数量: {len(dates)}, 权益曲线数据点: {len(self.equity_curve)}")
-        
-        # 如果权益曲线比日期多一个点（初始资金），则去掉第一个点
-        equity_curve_plot = self.equity_curve
-        if len(self.equity_curve) == len(dates) + 1:
-            print("权益曲线比日期多一个点，去掉第一个点（初始资金）")
-            equity_curve_plot = self.equity_curve[1:]
-        
-        # 如果权益曲线比日期少，则截取日期
-        if len(equity_curve_plot) < len(dates):
-            print(f"权益曲线比日期少，截取日期列表 ({len(dates)} -> {len(equity_curve_plot)})")
-            dates = dates[:len(equity_curve_plot)]
-        
-        # 转换日期格式
-        formatted_dates = [datetime.strptime(date, '%Y%m%d') for date in dates]
-        
-        # 确保长度一致
-        if len(formatted_dates) != len(equity_curve_plot):
-            print(f"警告: 日期和权益曲线长度不一致: {len(formatted_dates)} vs {len(equity_curve_plot)}")
-            # 取两者中较短的长度
-            min_len = min(len(formatted_dates), len(equity_curve_plot))
-            formatted_dates = formatted_dates[:min_len]
-            equity_curve_plot = equity_curve_plot[:min_len]
-        
-        # 绘制权益曲线
-        axes[0].plot(formatted_dates, equity_curve_plot, label='权益曲线')
-        axes[0].set_title('回测权益曲线')
-        axes[0].set_ylabel('资金')
-        axes[0].legend()
-        axes[0].grid(True)
-        
-        # 绘制每日回报
-        if self.returns and len(formatted_dates) == len(self.returns):
-            axes[1].plot(formatted_dates, self.returns, label='每日回报', color='green')
-            axes[1].axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            axes[1].set_title('每日回报')
-            axes[1].set_ylabel('回报率')
-            axes[1].legend()
-            axes[1].grid(True)
-        elif self.returns:
-            # 如果长度不一致，截取较短的部分
-            min_len = min(len(formatted_dates), len(self.returns))
-            axes[1].plot(formatted_dates[:min_len], self.returns[:min_len], label='每日回报', color='green')
-            axes[1].axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            axes[1].set_title('每日回报')
-            axes[1].set_ylabel('回报率')
-            axes[1].legend()
-            axes[1].grid(True)
-        
-        # 绘制回撤
-        if self.drawdowns and len(formatted_dates) == len(self.drawdowns):
-            axes[2].fill_between(formatted_dates, self.drawdowns, 0, color='red', alpha=0.3, label='回撤')
-            axes[2].set_title('回撤')
-            axes[2].set_ylabel('回撤率')
-            axes[2].set_xlabel('日期')
-            axes[2].legend()
-            axes[2].grid(True)
-        elif self.drawdowns:
-            # 如果长度不一致，截取较短的部分
-            min_len = min(len(formatted_dates), len(self.drawdowns))
-            axes[2].fill_between(formatted_dates[:min_len], self.drawdowns[:min_len], 0, color='red', alpha=0.3, label='回撤')
-            axes[2].set_title('回撤')
-            axes[2].set_ylabel('回撤率')
-            axes[2].set_xlabel('日期')
-            axes[2].legend()
-            axes[2].grid(True)
-        
-        # 调整布局
-        plt.tight_layout()
-        
-        # 保存图表
-        plt.savefig('d:\\硕士\\MFE5210 Algorithmic Trading Basics\\hedge_trading_system\\static\\backtest_results.png')
-        
-        # 关闭图表
-        plt.close()
-        
-        return 'static/backtest_results.png'
\ No newline at end of file
+        path, _ = get_chart_cache().render('backtest', series_payload(self.get_series(), CHART_MAX_POINTS))
+        return path
+
+
+def load_backtest_series(run_id=None):
+    """从数据库读取一次回测（默认最近一次）的权益、每日回报和回撤序列
+
+    回测结束后图表和/api/series接口都从这里取数据，回测过程中不再绘图
+    """
+    if run_id is None:
+        info = db.get_latest_backtest_info()
+        if info is None:
+            return {'dates': [], 'equity': [], 'returns': [], 'drawdown': []}
+        run_id = info['run_id']
+
+    # 只读取这次回测的绩效数据
+    performance = db.get_performance_data(run_id=run_id)
+    if performance.empty:
+        return {'dates': [], 'equity': [], 'returns': [], 'drawdown': []}
+
+    performance = performance.sort_values('date')
+    equity = performance['equity'].to_numpy(dtype=float)
+    return {
+        'dates': performance['date'].astype(str).tolist(),
+        'equity': equity.tolist(),
+        'returns': performance['returns'].to_numpy(dtype=float).tolist(),
+        'drawdown': drawdown_series(equity).tolist()
+    }
+
+
+def compare_backtest_modes(config=None, rtol=1e-9):
+    """分别用逐日循环和向量化两种模式运行回测，校验交易记录和权益曲线是否一致
+
+    两次回测都不写入数据库（save_results=False），只读取价格数据，可以随时运行：
+        python backtest.py
+
+    Args:
+        config: 回测配置，默认使用BACKTEST_CONFIG
+        rtol: 浮点数比较的相对误差
+
+    Returns:
+        dict: 校验结果、不一致的地方以及两种模式的耗时
+    """
+    results = {}
+    elapsed = {}
+    for mode in BACKTEST_MODES:
+        backtest = Backtest(strategy_class=PairTradingStrategy, config=config, mode=mode, save_results=False)
+        start = time.time()
+        results[mode] = backtest.run()
+        elapsed[mode] = time.time() - start
+
+    loop_result = results['loop']
+    vectorized_result = results['vectorized']
+    mismatches = []
+
+    # 比较权益曲线
+    if len(loop_result['equity_curve']) != len(vectorized_result['equity_curve']):
+        mismatches.append(f"权益曲线长度不一致: {len(loop_result['equity_curve'])} vs {len(vectorized_result['equity_curve'])}")
+    elif not np.allclose(loop_result['equity_curve'], vectorized_result['equity_curve'], rtol=rtol, atol=0):
+        mismatches.append("权益曲线数值不一致")
+
+    # 逐笔比较交易记录
+    if len(loop_result['trades']) != len(vectorized_result['trades']):
+        mismatches.append(f"交易数量不一致: {len(loop_result['trades'])} vs {len(vectorized_result['trades'])}")
+
+    for i, (loop_trade, vectorized_trade) in enumerate(zip(loop_result['trades'], vectorized_result['trades'])):
+        if loop_trade.keys() != vectorized_trade.keys():
+            mismatches.append(f"第{i}笔交易字段不一致")
+            continue
+        for key, value in loop_trade.items():
+            other = vectorized_trade[key]
+            if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                if not np.isclose(value, other, rtol=rtol, atol=0):
+                    mismatches.append(f"第{i}笔交易的{key}不一致: {value} vs {other}")
+            elif value != other:
+                mismatches.append(f"第{i}笔交易的{key}不一致: {value} vs {other}")
+
+    print(f"逐日循环耗时: {elapsed['loop']:.2f}秒, 向量化耗时: {elapsed['vectorized']:.2f}秒")
+    if mismatches:
+        print(f"两种回测模式结果不一致，共 {len(mismatches)} 处差异")
+    else:
+        print("两种回测模式的交易记录和权益曲线一致")
+
+    return {
+        'identical': not mismatches,
+        'mismatches': mismatches,
+        'elapsed': elapsed
+    }
+
+
+if __name__ == '__main__':
+    # 校验两种回测模式的结果一致，不一致时以非零状态退出
+    report = compare_backtest_modes()
+    for mismatch in report['mismatches'][:20]:
+        print(f"  {mismatch}")
+    if not report['identical']:
+        raise SystemExit(1)
@@ -0,0 +1,297 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime
+
+# 渲染好的图表缓存目录，文件名包含数据的哈希值
+CHART_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'charts')
+
+# 缓存最多保留的图表文件数，超过时删除最早生成的
+MAX_CHART_FILES = 64
+
+# 图表最多绘制的数据点数，超过时先降采样（图片宽度有限，更多的点看不出区别）
+CHART_MAX_POINTS = 2000
+
+
+_plt = None
+
+
+def _pyplot():
+    """第一次绘图时才导入matplotlib，导入本模块不加载绘图库"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        # 设置Matplotlib使用非交互式后端，避免线程问题
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        plt.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS', 'DejaVu Sans']
+        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        _plt = plt
+    return _plt
+
+
+def drawdown_series(equity):
+    """由权益序列计算每天相对历史峰值的回撤"""
+    equity = np.asarray(equity, dtype=float)
+    if len(equity) == 0:
+        return equity
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, (peaks - equity) / peaks, 0.0)
+    return drawdowns
+
+
+def downsample(series, max_points, key):
+    """按区间保留极值点的降采样
+
+    把序列分成(max_points-2)/2个区间，每个区间保留key列的最小值和最大值所在的点，
+    再加上首尾两个点，回撤的谷底和权益的高点都不会丢失。所有列使用相同的下标
+
+    Args:
+        series: {'dates': [...], 列名: [...]}，各列长度相同
+        max_points: 最多保留的点数，为None或不超过时原样返回
+        key: 用于选取极值点的列
+
+    Returns:
+        dict: 与series结构相同
+    """
+    n = len(series['dates'])
+    if not max_points or n <= max_points or n < 3:
+        return series
+
+    values = np.asarray(series[key], dtype=float)
+    buckets = max((max_points - 2) // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+
+    keep = {0, n - 1}
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        window = values[lo:hi]
+        if np.isnan(window).all():
+            keep.add(lo)
+            continue
+        keep.add(lo + int(np.nanargmin(window)))
+        keep.add(lo + int(np.nanargmax(window)))
+    index = sorted(keep)
+
+    return {name: [column[i] for i in index] for name, column in series.items()}
+
+
+def series_payload(series, max_points=None, key='equity'):
+    """把序列整理成接口返回的JSON结构，max_points不为None时按key列降采样
+
+    Returns:
+        dict: {'dates': [...], 'series': {列名: [...]}, 'points': 返回的点数, 'total_points': 原始点数}
+    """
+    total = len(series['dates'])
+    series = downsample(series, max_points, key)
+
+    def clean(value):
+        value = float(value)
+        return None if np.isnan(value) or np.isinf(value) else value
+
+    return {
+        'dates': [str(date) for date in series['dates']],
+        'series': {name: [clean(value) for value in column]
+                   for name, column in series.items() if name != 'dates'},
+        'points': len(series['dates']),
+        'total_points': total
+    }
+
+
+def _parse_dates(dates):
+    """YYYYMMDD或YYYY-MM-DD字符串转为datetime，无法解析时返回下标"""
+    parsed = []
+    for date in dates:
+        text = str(date).replace('-', '')[:8]
+        try:
+            parsed.append(datetime.strptime(text, '%Y%m%d'))
+        except ValueError:
+            return list(range(len(dates)))
+    return parsed
+
+
+def draw_equity_chart(series, path):
+    """执行系统的权益曲线"""
+    plt = _pyplot()
+    plt.figure(figsize=(10, 6))
+    if series['dates']:
+        plt.plot(_parse_dates(series['dates']), series['equity'])
+        plt.title('策略权益曲线')
+    else:
+        plt.title('策略权益曲线 (等待数据...)')
+    plt.xlabel('交易日')
+    plt.ylabel('权益')
+    plt.grid(True)
+    plt.savefig(path)
+    plt.close()
+
+
+def draw_backtest_chart(series, path):
+    """回测的权益曲线、每日回报和回撤"""
+    plt = _pyplot()
+    fig, axes = plt.subplots(3, 1, figsize=(12, 18), gridspec_kw={'height_ratios': [3, 1, 1]})
+    dates = _parse_dates(series['dates'])
+
+    # 绘制权益曲线
+    axes[0].plot(dates, series['equity'], label='权益曲线')
+    axes[0].set_title('回测权益曲线')
+    axes[0].set_ylabel('资金')
+    axes[0].legend()
+    axes[0].grid(True)
+
+    # 绘制每日回报
+    axes[1].plot(dates, series['returns'], label='每日回报', color='green')
+    axes[1].axhline(y=0, color='r', linestyle='-', alpha=0.3)
+    axes[1].set_title('每日回报')
+    axes[1].set_ylabel('回报率')
+    axes[1].legend()
+    axes[1].grid(True)
+
+    # 绘制回撤
+    axes[2].fill_between(dates, series['drawdown'], 0, color='red', alpha=0.3, label='回撤')
+    axes[2].set_title('回撤')
+    axes[2].set_ylabel('回撤率')
+    axes[2].set_xlabel('日期')
+    axes[2].legend()
+    axes[2].grid(True)
+
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close(fig)
+
+
+def draw_cost_chart(series, path):
+    """交易成本分析：每日交易量和总成本、成本比例、成本构成"""
+    plt = _pyplot()
+    if not series['dates']:
+        # 创建一个简单的图表，显示没有数据
+        plt.figure(figsize=(10, 6))
+        plt.text(0.5, 0.5, '没有足够的数据生成图表',
+                 horizontalalignment='center', verticalalignment='center',
+                 fontsize=14)
+        plt.tight_layout()
+        plt.savefig(path)
+        plt.close()
+        return
+
+    dates = _parse_dates(series['dates'])
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 15))
+
+    # 绘制交易量和总成本
+    ax1.bar(dates, series['volume'], alpha=0.7, label='交易量')
+    ax1_twin = ax1.twinx()
+    ax1_twin.plot(dates, series['total_cost'], 'r-', label='总成本')
+    ax1.set_title('每日交易量和总成本')
+    ax1.set_ylabel('交易量')
+    ax1_twin.set_ylabel('成本')
+    ax1.legend(loc='upper left')
+    ax1_twin.legend(loc='upper right')
+
+    # 绘制成本比例
+    ax2.plot(dates, series['cost_ratio'], 'g-', label='成本比例 (%)')
+    ax2.set_title('每日交易成本比例')
+    ax2.set_ylabel('成本比例 (%)')
+    ax2.legend()
+
+    # 绘制成本构成
+    ax3.stackplot(dates,
+                  series['commission'],
+                  series['slippage'],
+                  series['market_impact'],
+                  series['timing_cost'],
+                  labels=['佣金', '滑点', '市场冲击', '时机成本'])
+    ax3.set_title('成本构成')
+    ax3.set_ylabel('成本')
+    ax3.legend()
+
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close(fig)
+
+
+# 图表名称 -> 绘图函数
+CHART_DRAWERS = {
+    'execution': draw_equity_chart,
+    'backtest': draw_backtest_chart,
+    'costs': draw_cost_chart
+}
+
+
+class ChartCache:
+    """按数据哈希缓存的PNG渲染器
+
+    同样的数据只渲染一次，之后直接返回已有的文件；数据变化后哈希随之变化，
+    旧文件在超过max_files时按生成时间删除。渲染在请求图表时才进行，
+    回测、执行和成本分析的主流程不再绘图
+    """
+
+    def __init__(self, root=CHART_DIR, max_files=MAX_CHART_FILES):
+        self.root = root
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+
+    @staticmethod
+    def data_hash(name, series):
+        payload = json.dumps(series, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha1(name.encode('utf-8') + b'\0' + payload).hexdigest()[:16]
+
+    def render(self, name, series):
+        """返回图表文件路径和数据哈希，没有缓存时先渲染
+
+        Args:
+            name: 图表名称，见CHART_DRAWERS
+            series: series_payload的结果
+        """
+        if name not in CHART_DRAWERS:
+            raise ValueError(f"不支持的图表: {name}，可选 {list(CHART_DRAWERS)}")
+
+        digest = self.data_hash(name, series)
+        path = os.path.join(self.root, f'{name}-{digest}.png')
+
+        # matplotlib的pyplot接口不是线程安全的，渲染串行进行
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                return path, digest
+
+            os.makedirs(self.root, exist_ok=True)
+            data = {'dates': series['dates']}
+            data.update({column: np.array(values, dtype=float) for column, values in series['series'].items()})
+            tmp_path = path + '.tmp.png'
+            CHART_DRAWERS[name](data, tmp_path)
+            os.replace(tmp_path, path)
+            self.renders += 1
+            self._evict()
+
+        return path, digest
+
+    def _evict(self):
+        files = [os.path.join(self.root, f) for f in os.listdir(self.root) if f.endswith('.png')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    """获取进程内共享的图表缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChartCache()
+    return _cache
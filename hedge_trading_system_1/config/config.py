@@ -14,6 +14,9 @@ BACKTEST_CONFIG = {
 EXECUTION_CONFIG = {
     "update_interval": 60,  # 更新间隔（秒）
     "max_order_size": 100000,  # 最大订单大小
+    "replay_mode": "realtime",  # 回放模式：realtime、speed（倍速）、fast（不等待）
+    "replay_speed": 60,  # speed模式下的回放倍速
+    "seconds_per_day": 1.0,  # realtime模式下每个交易日的秒数
 }
 
 # 前端配置
@@ -42,4 +45,51 @@ STRATEGY_CONFIG = {
     'min_threshold': 0.8,            # 最小阈值
     'max_threshold': 2.0,            # 最大阈值
     'volatility_lookback': 20        # 波动性计算回溯期
-}
\ No newline at end of file
+}
+
+# 股票对扫描配置
+SCANNER_CONFIG = {
+    'min_observations': 250,         # 最少的有效交易日数量
+    'min_correlation': 0.7,          # 收益率相关系数下限
+    'max_pairs_per_symbol': 20,      # 每只股票最多保留的候选股票对数量
+    'adf_lags': 1,                   # ADF检验的滞后阶数
+    'significance': '5%',            # 协整检验的显著性水平：1%、5%、10%
+    'min_half_life': 1,              # 最短半衰期（交易日）
+    'max_half_life': 60,             # 最长半衰期（交易日）
+    'chunk_size': 500,               # 每个工作进程任务的股票对数量
+}
+
+# 交易记录和绩效数据写入配置
+JOURNAL_CONFIG = {
+    'durability': 'async',           # async: 后台线程批量写入；sync: 每条记录立即写入
+    'max_queue': 10000,              # 队列最多缓存的记录数，队列满时写入方等待
+    'batch_size': 500,               # 每个事务最多写入的记录数
+    'flush_interval': 0.5,           # 两次提交之间的最长间隔（秒）
+    'retries': 3,                    # 数据库被锁等OperationalError时整批重试的次数
+    'retry_delay': 1.0,              # 第一次重试前等待的秒数，之后每次加倍
+}
+
+# 后台回测任务配置
+JOB_CONFIG = {
+    'max_workers': 2,                # 同时运行的回测任务数
+    'max_pending': 20,               # 排队和运行中的任务总数上限，超过时拒绝提交
+    'keep_finished': 100,            # 保留的已结束任务数，超过时删除最早结束的
+}
+
+# 进程内价格面板缓存配置
+PANEL_CACHE_CONFIG = {
+    'max_bytes': 512 * 1024 * 1024,  # 缓存的价格数组总字节数上限
+    'max_entries': 32,               # 缓存的价格面板数量上限
+}
+
+# 回测结果缓存配置
+RESULT_STORE_CONFIG = {
+    'max_bytes': 256 * 1024 * 1024,  # 缓存文件占用的磁盘空间上限，超过时删除最久未使用的结果
+}
+
+# 交易成本分析配置
+TCA_CONFIG = {
+    'chunk_size': 50000,             # 流式分析每次从数据库读取的交易记录数
+    'stream_threshold': 200000,      # 交易记录数超过时自动使用流式分析
+    'detail_limit': 1000,            # 流式分析返回的交易明细条数（最近的交易）
+}
@@ -1,9 +1,130 @@
 import sqlite3
 import os
+import time
+import threading
+import weakref
+import uuid
+from datetime import datetime
 import pandas as pd
 from config.config import DATABASE_PATH
 import numpy as np
 
+# 交易数据库文件
+HEDGE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'hedge_trading.db')
+
+# 每个连接建立时设置的PRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # 读写互不阻塞
+    "PRAGMA synchronous=NORMAL",      # WAL模式下足够安全，减少fsync
+    "PRAGMA cache_size=-65536",       # 64MB页缓存
+    "PRAGMA mmap_size=268435456",     # 256MB内存映射
+    "PRAGMA temp_store=MEMORY",
+)
+
+class ManagedConnection(sqlite3.Connection):
+    """由ConnectionManager管理的长连接
+
+    调用方仍然可以像以前一样在用完后调用close()，此时只回滚未提交的事务，连接保留给当前线程继续使用
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def shutdown(self):
+        """真正关闭连接"""
+        sqlite3.Connection.close(self)
+
+class ConnectionManager:
+    """为每个线程提供长期复用的SQLite连接
+
+    - 每个线程按(数据库文件, row_factory)各持有一个连接，不会被多个线程同时使用
+    - 线程结束后连接放回空闲池，交给之后的线程（例如Flask的请求线程）继续使用
+    - 每个数据库文件的表结构只在进程内第一次连接时初始化一次
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._bootstrapped = set()
+        self._connections = []
+
+    def get(self, db_path, row_factory=None, bootstrap=None):
+        """获取当前线程的连接
+
+        Args:
+            db_path: 数据库文件路径
+            row_factory: 连接的row_factory
+            bootstrap: 第一次连接该数据库时调用的表结构初始化函数，参数为连接
+        """
+        db_path = os.path.abspath(db_path)
+        connections = self._local.__dict__.setdefault('connections', {})
+        key = (db_path, row_factory)
+
+        conn = connections.get(key)
+        if conn is None:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                conn = self._connect(db_path, bootstrap)
+                conn.row_factory = row_factory
+            connections[key] = conn
+            # 线程结束时把连接放回空闲池
+            weakref.finalize(threading.current_thread(), self._release, key, conn)
+
+        return conn
+
+    def _connect(self, db_path, bootstrap):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        # 连接只在一个线程内使用，关闭检查是为了线程结束后能交给其他线程
+        conn = sqlite3.connect(db_path, timeout=30, factory=ManagedConnection, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+        with self._lock:
+            if bootstrap is not None and db_path not in self._bootstrapped:
+                bootstrap(conn)
+                conn.commit()
+                self._bootstrapped.add(db_path)
+            self._connections.append(conn)
+
+        return conn
+
+    def _release(self, key, conn):
+        with self._lock:
+            # close_all()已经关闭的连接或fork前继承的连接不再放回空闲池
+            if not any(c is conn for c in self._connections):
+                return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def _reset_after_fork(self):
+        """子进程不能复用父进程的连接：保留引用但不再使用，也不关闭"""
+        self._inherited = self._connections
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._connections = []
+
+    def close_all(self):
+        """关闭所有连接，用于进程退出或测试"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = {}
+            self._bootstrapped = set()
+        self._local = threading.local()
+        for conn in connections:
+            conn.shutdown()
+
+connection_manager = ConnectionManager()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=connection_manager._reset_after_fork)
+
 def reset_database():
     """重置数据库，删除所有表并重新创建"""
     conn = get_db_connection()
@@ -16,34 +137,30 @@ def reset_database():
     # 删除所有表
     for table in tables:
         cursor.execute(f"DROP TABLE IF EXISTS {table[0]}")
+    # 索引随表一起删除，重建表后需要重新创建
+    cursor.execute("PRAGMA user_version = 0")
     
     conn.commit()
-    conn.close()
     
     print("数据库已重置")
     
-    # 重新创建必要的表
+    # 重新创建必要的表（连接是复用的，不会再次自动初始化表结构）
+    create_tables(conn)
+    conn.close()
+    bump_stock_data_version()
     ensure_db_exists()
 
 # 添加数据库连接函数
 def get_db_connection():
-    """获取数据库连接"""
-    # 确保数据库目录存在
-    db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-    
-    # 连接到数据库文件
-    db_path = os.path.join(db_dir, 'hedge_trading.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
-    return conn
+    """获取当前线程的数据库连接，查询结果可以通过列名访问"""
+    return connection_manager.get(HEDGE_DB_PATH, row_factory=sqlite3.Row, bootstrap=create_tables)
     
 def ensure_db_exists():
     """确保数据库文件存在，如果不存在则创建"""
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DATABASE_PATH)
+    connection_manager.get(DATABASE_PATH, bootstrap=create_default_tables)
+
+def create_default_tables(conn):
+    """创建DATABASE_PATH数据库中的表"""
     cursor = conn.cursor()
     
     # 创建股票数据表
@@ -102,51 +219,198 @@ def ensure_db_exists():
     )
     ''')
     
+    # 索引定义包含run_id，两个数据库的表结构保持一致
+    cursor.execute(BACKTEST_INFO_TABLE_SQL)
+    migrate_run_scope(cursor)
+    
+    apply_schema_indexes(conn)
     conn.commit()
-    conn.close()
+
+# stock_data在本进程内的写入版本号，每次写入后加1，进程内的行情面板缓存据此判断是否过期
+_stock_data_version = 0
+_stock_data_version_lock = threading.Lock()
+
+def get_stock_data_version():
+    """stock_data的写入版本号，只反映本进程内的写入"""
+    return _stock_data_version
+
+def bump_stock_data_version():
+    """stock_data发生变化后调用，使已缓存的行情面板失效"""
+    global _stock_data_version
+    with _stock_data_version_lock:
+        _stock_data_version += 1
+        return _stock_data_version
+
+# stock_data的持久化修订号加1，与写入放在同一个事务中
+STOCK_DATA_REVISION_SQL = """
+INSERT INTO data_revisions (name, revision) VALUES ('stock_data', 1)
+ON CONFLICT(name) DO UPDATE SET revision = revision + 1
+"""
+
+# 按(code, date)插入或更新股票数据
+STOCK_DATA_UPSERT_SQL = """
+INSERT INTO stock_data (code, date, open, high, low, close, volume)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(code, date) DO UPDATE SET
+    open = excluded.open,
+    high = excluded.high,
+    low = excluded.low,
+    close = excluded.close,
+    volume = excluded.volume
+"""
 
 def save_stock_data(data):
-    """保存股票数据到数据库"""
+    """保存股票数据到数据库
+    
+    Args:
+        data: 单条股票数据字典；传入DataFrame时按批量方式写入
+    """
+    if isinstance(data, pd.DataFrame):
+        return save_stock_data_bulk(data)
+    
     conn = get_connection()
     cursor = conn.cursor()
     
-    # 检查是否已存在该记录
-    cursor.execute(
-        "SELECT id FROM stock_data WHERE code = ? AND date = ?",
-        (data['code'], data['date'])
-    )
-    result = cursor.fetchone()
-    
     try:
-        if result:
-            # 更新现有记录
-            cursor.execute(
-                """
-                UPDATE stock_data 
-                SET open = ?, high = ?, low = ?, close = ?, volume = ?
-                WHERE code = ? AND date = ?
-                """,
-                (data['open'], data['high'], data['low'], data['close'], data['volume'], 
-                 data['code'], data['date'])
-            )
-        else:
-            # 插入新记录
-            cursor.execute(
-                """
-                INSERT INTO stock_data (code, date, open, high, low, close, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (data['code'], data['date'], data['open'], data['high'], data['low'], 
-                 data['close'], data['volume'])
-            )
-        
+        cursor.execute(
+            STOCK_DATA_UPSERT_SQL,
+            (data['code'], data['date'], data['open'], data['high'], data['low'], 
+             data['close'], data['volume'])
+        )
+        cursor.execute(STOCK_DATA_REVISION_SQL)
         conn.commit()
+        bump_stock_data_version()
     except Exception as e:
         print(f"保存股票数据时出错: {e}")
         print(f"数据: {data}")
     finally:
         conn.close()
 
+def stock_data_rows(data, code=None):
+    """把DataFrame或数组字典转换为stock_data的参数行
+    
+    兼容yfinance的大写列名；没有date列时使用Date列或索引，日期统一为YYYYMMDD字符串。
+    价格缺失写入NULL，成交量缺失写入0
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    columns = {
+        'Date': 'date',
+        'Open': 'open',
+        'High': 'high',
+        'Low': 'low',
+        'Close': 'close',
+        'Volume': 'volume'
+    }
+    df = df.rename(columns={k: v for k, v in columns.items() if k in df.columns and v not in df.columns})
+    
+    if 'date' in df.columns:
+        dates = df['date']
+    else:
+        dates = pd.Series(df.index, index=df.index)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = dates.dt.strftime('%Y%m%d')
+    dates = dates.astype(str).str.replace('-', '', regex=False).tolist()
+    
+    if 'code' in df.columns:
+        codes = df['code'].astype(str).tolist()
+    elif code is not None:
+        codes = [code] * len(df)
+    else:
+        raise ValueError("缺少股票代码：数据中没有code列且没有指定code")
+    
+    columns = []
+    for column in ('open', 'high', 'low', 'close'):
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64) if column in df.columns \
+            else np.full(len(df), np.nan)
+        columns.append(np.where(np.isnan(values), None, values).tolist())
+    
+    volumes = pd.to_numeric(df['volume'], errors='coerce').fillna(0) if 'volume' in df.columns \
+        else pd.Series(0.0, index=df.index)
+    columns.append(volumes.astype(float).tolist())
+    
+    return list(zip(codes, dates, *columns))
+
+def save_stock_data_bulk(data, code=None, fingerprints=False):
+    """在一个事务中批量插入或更新股票数据
+    
+    Args:
+        data: DataFrame或列名到数组的字典，需包含date(或Date/索引)、open、high、low、close、volume
+        code: 数据中没有code列时使用的股票代码
+        fingerprints: 是否在写入事务内读取写入前后的get_stock_data_fingerprint()，
+                      两次读取之间不会有其他写入，用于判断外部缓存是否只差这一次写入
+        
+    Returns:
+        dict: 写入的行数、耗时和每秒行数；fingerprints为True且有写入时
+              还包含previous_fingerprint和fingerprint
+    """
+    start_time = time.time()
+    rows = stock_data_rows(data, code)
+    if not rows:
+        return {'rows': 0, 'elapsed': 0.0, 'rows_per_sec': 0.0}
+    
+    result = {}
+    conn = get_connection()
+    try:
+        with conn:
+            if fingerprints:
+                # 立即取得写锁，其他写入方只能在本次提交之后写入
+                conn.execute("BEGIN IMMEDIATE")
+                result['previous_fingerprint'] = read_stock_data_fingerprint(conn)
+            conn.executemany(STOCK_DATA_UPSERT_SQL, rows)
+            conn.execute(STOCK_DATA_REVISION_SQL)
+            if fingerprints:
+                result['fingerprint'] = read_stock_data_fingerprint(conn)
+    finally:
+        conn.close()
+        bump_stock_data_version()
+    
+    elapsed = time.time() - start_time
+    rows_per_sec = len(rows) / elapsed if elapsed > 0 else float('inf')
+    print(f"批量写入股票数据 {len(rows)} 条，耗时 {elapsed:.3f} 秒，{rows_per_sec:.0f} 条/秒")
+    
+    return {'rows': len(rows), 'elapsed': elapsed, 'rows_per_sec': rows_per_sec, **result}
+
+def get_stock_data_signature():
+    """stock_data表内容的简要标识，用于判断外部缓存是否过期
+
+    Returns:
+        tuple: (行数, 最大日期, 最大id)
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT COUNT(*), MAX(date), MAX(id) FROM stock_data").fetchone()
+    conn.close()
+    return tuple(row)
+
+def get_stock_data_fingerprint():
+    """stock_data内容的持久化标识，跨进程、跨重启保持一致，用于磁盘上的结果缓存
+
+    修订号反映原地更新的价格，表标识反映不经过本模块的写入
+
+    Returns:
+        tuple: (修订号, 行数, 最大日期, 最大id)
+    """
+    conn = get_connection()
+    try:
+        return read_stock_data_fingerprint(conn)
+    finally:
+        conn.close()
+
+def read_stock_data_fingerprint(conn):
+    """用指定的连接读取get_stock_data_fingerprint()，可以在调用方的事务内使用"""
+    row = conn.execute("SELECT revision FROM data_revisions WHERE name = 'stock_data'").fetchone()
+    signature = conn.execute("SELECT COUNT(*), MAX(date), MAX(id) FROM stock_data").fetchone()
+    return (row[0] if row else 0,) + tuple(signature)
+
+def get_stock_data_revision():
+    """stock_data的持久化修订号，本模块的每次写入（包括其他进程）都在同一个事务中加1
+
+    只读取一行，适合在每次读取缓存时检查
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT revision FROM data_revisions WHERE name = 'stock_data'").fetchone()
+    conn.close()
+    return row[0] if row else 0
+
 def get_stock_data(code, start_date, end_date):
     """从数据库获取股票数据"""
     conn = get_connection()
@@ -163,56 +427,22 @@ def get_stock_data(code, start_date, end_date):
     conn.close()
     return df
 
-def save_trade(trade_data):
-    """保存交易记录到数据库"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 检查trades表是否存在
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='trades'")
-    table_exists = cursor.fetchone()
-    
-    if table_exists:
-        # 检查表结构
-        cursor.execute("PRAGMA table_info(trades)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # 如果表结构不匹配，则删除旧表
-        required_columns = ['position_type', 'long_code', 'short_code', 'open_price_long', 
-                           'open_price_short', 'close_price_long', 'close_price_short']
-        if not all(col in columns for col in required_columns):
-            print("trades表结构不匹配，重新创建表...")
-            cursor.execute("DROP TABLE trades")
-            table_exists = None
-    
-    # 创建或重新创建trades表
-    if not table_exists:
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trades (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            pair_id TEXT,
-            action TEXT,
-            position_type TEXT,
-            long_code TEXT,
-            short_code TEXT,
-            open_price_long REAL,
-            open_price_short REAL,
-            close_price_long REAL,
-            close_price_short REAL,
-            quantity REAL,
-            pnl REAL,
-            commission REAL,
-            net_pnl REAL,
-            volume REAL,
-            slippage REAL,
-            market_impact REAL,
-            timing_cost REAL,
-            total_cost REAL,
-            status TEXT
-        )
-        ''')
-    
+TRADE_INSERT_SQL = '''
+INSERT INTO trades (
+    run_id, timestamp, pair_id, action, position_type, long_code, short_code,
+    open_price_long, open_price_short, close_price_long, close_price_short,
+    quantity, pnl, commission, net_pnl, volume, slippage, market_impact, timing_cost, total_cost, status
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def prepare_trade_row(trade_data, run_id=''):
+    """补全交易记录的成本字段，返回写入trades表的一行数据
+
+    成本字段会直接写回trade_data，与同步写入时的行为一致
+
+    Args:
+        run_id: 交易记录所属的回测或执行，见new_run_id
+    """
     # 计算交易量
     if 'volume' not in trade_data:
         if trade_data['action'] == 'open':
@@ -237,17 +467,8 @@ def save_trade(trade_data):
     if 'total_cost' not in trade_data:
         trade_data['total_cost'] = trade_data['commission'] + trade_data['slippage'] + trade_data['market_impact'] + trade_data['timing_cost']
     
-    # 准备SQL语句 - 修改：添加status列
-    sql = '''
-    INSERT INTO trades (
-        timestamp, pair_id, action, position_type, long_code, short_code,
-        open_price_long, open_price_short, close_price_long, close_price_short,
-        quantity, pnl, commission, net_pnl, volume, slippage, market_impact, timing_cost, total_cost, status
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    '''
-    
-    # 准备数据
-    data = (
+    return (
+        run_id or '',
         trade_data.get('timestamp', ''),
         trade_data.get('pair_id', ''),
         trade_data.get('action', ''),
@@ -269,32 +490,52 @@ def save_trade(trade_data):
         trade_data.get('total_cost', 0.0),
         trade_data.get('status', 'open')  # 添加status字段
     )
-    
-    # 执行SQL
-    cursor.execute(sql, data)
+
+def save_trade(trade_data, run_id=''):
+    """保存交易记录到数据库"""
+    # trades表结构在连接初始化时检查（见create_tables）
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(TRADE_INSERT_SQL, prepare_trade_row(trade_data, run_id))
     conn.commit()
     conn.close()
 
+# backtest_info、trades和performance按run_id区分每一次回测或执行
+BACKTEST_INFO_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS backtest_info (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    start_date TEXT,
+    end_date TEXT,
+    initial_capital REAL,
+    timestamp TEXT,
+    run_id TEXT NOT NULL DEFAULT '',
+    kind TEXT NOT NULL DEFAULT 'backtest'
+)
+'''
+
+# run_id的种类：backtest为回测，execution为执行系统的回放
+RUN_KINDS = ('backtest', 'execution')
+
+def new_run_id(kind='backtest'):
+    """生成新的run_id，按生成时间排序"""
+    if kind not in RUN_KINDS:
+        raise ValueError(f"不支持的运行类型: {kind}，可选 {RUN_KINDS}")
+    return f"{kind}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+
 def save_backtest_info(backtest_info):
-    """保存回测信息到数据库"""
+    """保存回测信息到数据库
+
+    Args:
+        backtest_info: 包含start_date、end_date、initial_capital、timestamp，
+                       以及这次运行的run_id和kind（backtest或execution）
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 确保backtest_info表存在
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS backtest_info (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        start_date TEXT,
-        end_date TEXT,
-        initial_capital REAL,
-        timestamp TEXT
-    )
-    ''')
-    
     # 准备SQL语句
     sql = '''
-    INSERT INTO backtest_info (start_date, end_date, initial_capital, timestamp)
-    VALUES (?, ?, ?, ?)
+    INSERT INTO backtest_info (start_date, end_date, initial_capital, timestamp, run_id, kind)
+    VALUES (?, ?, ?, ?, ?, ?)
     '''
     
     # 准备数据
@@ -302,7 +543,9 @@ def save_backtest_info(backtest_info):
         backtest_info.get('start_date', ''),
         backtest_info.get('end_date', ''),
         backtest_info.get('initial_capital', 0.0),
-        backtest_info.get('timestamp', '')
+        backtest_info.get('timestamp', ''),
+        backtest_info.get('run_id', ''),
+        backtest_info.get('kind', 'backtest')
     )
     
     # 执行SQL
@@ -310,6 +553,100 @@ def save_backtest_info(backtest_info):
     conn.commit()
     conn.close()
 
+def get_latest_backtest_info(kind='backtest'):
+    """获取最近一次回测（或执行）的信息，日期统一为YYYYMMDD，没有记录时返回None
+
+    Args:
+        kind: 运行类型，为None时不区分
+    """
+    conn = get_db_connection()
+    query = "SELECT start_date, end_date, initial_capital, timestamp, run_id, kind FROM backtest_info"
+    params = []
+    if kind is not None:
+        query += " WHERE kind = ?"
+        params.append(kind)
+    query += " ORDER BY id DESC LIMIT 1"
+    row = conn.execute(query, params).fetchone()
+    conn.close()
+    
+    if row is None:
+        return None
+    return {
+        'start_date': str(row['start_date']).replace('-', ''),
+        'end_date': str(row['end_date']).replace('-', ''),
+        'initial_capital': row['initial_capital'],
+        'timestamp': row['timestamp'],
+        'run_id': row['run_id'],
+        'kind': row['kind']
+    }
+
+def get_latest_run_id(kind='backtest'):
+    """最近一次回测（或执行）的run_id，没有记录时返回None"""
+    info = get_latest_backtest_info(kind)
+    return info['run_id'] if info else None
+
+def list_runs(kind=None, limit=100):
+    """最近的回测和执行记录，最新的在前，包含每次运行的交易记录数和绩效天数"""
+    conn = get_db_connection()
+    query = "SELECT run_id, kind, start_date, end_date, initial_capital, timestamp FROM backtest_info"
+    params = []
+    if kind is not None:
+        query += " WHERE kind = ?"
+        params.append(kind)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    runs = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    # 每个run_id的计数都走(run_id, ...)索引，不扫描其他运行的数据
+    for run in runs:
+        run['trades'] = conn.execute("SELECT COUNT(*) FROM trades WHERE run_id = ?", (run['run_id'],)).fetchone()[0]
+        run['performance_days'] = conn.execute(
+            "SELECT COUNT(*) FROM performance WHERE run_id = ?", (run['run_id'],)).fetchone()[0]
+    conn.close()
+    return runs
+
+def purge_runs(run_ids):
+    """在一个事务中删除指定运行的交易记录、绩效数据和运行信息
+
+    Returns:
+        dict: 各表删除的行数
+    """
+    run_ids = list(dict.fromkeys(run_ids))
+    deleted = {'trades': 0, 'performance': 0, 'backtest_info': 0}
+    if not run_ids:
+        return deleted
+
+    conn = get_connection()
+    try:
+        with conn:
+            for table in deleted:
+                # 分批删除，避免超过SQLite的参数个数限制
+                for i in range(0, len(run_ids), 500):
+                    batch = run_ids[i:i + 500]
+                    cursor = conn.execute(
+                        f"DELETE FROM {table} WHERE run_id IN ({','.join('?' * len(batch))})", batch)
+                    deleted[table] += cursor.rowcount
+    finally:
+        conn.close()
+    return deleted
+
+def purge_old_runs(keep=10):
+    """只保留最近keep次运行的数据，其余运行和没有run_id的旧数据全部删除
+
+    Returns:
+        dict: 删除的run_id列表和各表删除的行数
+    """
+    conn = get_connection()
+    run_ids = [row[0] for row in conn.execute("SELECT run_id FROM backtest_info ORDER BY id DESC")]
+    conn.close()
+
+    kept = set(run_ids[:max(keep, 0)])
+    purged = [run_id for run_id in dict.fromkeys(run_ids) if run_id not in kept]
+    if '' not in kept:
+        purged.append('')
+    deleted = purge_runs(purged)
+    return {'run_ids': [run_id for run_id in purged if run_id], **deleted}
+
 def get_trades(start_date=None, end_date=None):
     """从数据库获取交易记录"""
     conn = get_db_connection()
@@ -341,27 +678,9 @@ def get_trades(start_date=None, end_date=None):
     
     return df
 
-def get_latest_backtest_info():
-    """获取最新的回测信息"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 查询最新的回测信息
-    cursor.execute("SELECT * FROM backtest_info ORDER BY id DESC LIMIT 1")
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        # 将结果转换为字典
-        columns = [desc[0] for desc in cursor.description]
-        backtest_info = dict(zip(columns, result))
-        return backtest_info
-    
-    return None
-
 def update_trade_status(trade_id, status, pnl=None):
     """更新交易状态"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = connection_manager.get(DATABASE_PATH, bootstrap=create_default_tables)
     cursor = conn.cursor()
     
     if pnl is not None:
@@ -374,7 +693,7 @@ def update_trade_status(trade_id, status, pnl=None):
 
 def save_performance(performance_data):
     """保存策略表现数据"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = connection_manager.get(DATABASE_PATH, bootstrap=create_default_tables)
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -391,12 +710,13 @@ def save_performance(performance_data):
     conn.commit()
     conn.close()
 
-def get_performance_data(start_date=None, end_date=None):
+def get_performance_data(start_date=None, end_date=None, run_id=None):
     """获取绩效数据
     
     Args:
         start_date: 开始日期，格式为YYYYMMDD
         end_date: 结束日期，格式为YYYYMMDD
+        run_id: 只读取这次运行的数据，为None时读取所有运行
         
     Returns:
         pandas.DataFrame: 绩效数据
@@ -404,20 +724,23 @@ def get_performance_data(start_date=None, end_date=None):
     conn = get_connection()
     
     query = "SELECT * FROM performance"
+    conditions = []
     params = []
     
-    if start_date or end_date:
-        query += " WHERE"
-        
-        if start_date:
-            query += " date >= ?"
-            params.append(start_date)
-            
-        if end_date:
-            if start_date:
-                query += " AND"
-            query += " date <= ?"
-            params.append(end_date)
+    if run_id is not None:
+        conditions.append("run_id = ?")
+        params.append(run_id)
+    
+    if start_date:
+        conditions.append("date >= ?")
+        params.append(start_date)
+    
+    if end_date:
+        conditions.append("date <= ?")
+        params.append(end_date)
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
     
     query += " ORDER BY date"
     
@@ -426,22 +749,15 @@ def get_performance_data(start_date=None, end_date=None):
     
     return df
 
-def get_trades(start_date=None, end_date=None, status=None):
-    """获取交易记录"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 检查trades表是否存在
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='trades'")
-    if not cursor.fetchone():
-        print("警告: trades表不存在")
-        return pd.DataFrame()
-    
-    # 构建查询
-    query = "SELECT * FROM trades"
+def _trade_filter(start_date=None, end_date=None, status=None, run_id=None):
+    """交易记录查询的WHERE子句和参数"""
     conditions = []
     params = []
     
+    if run_id is not None:
+        conditions.append("run_id = ?")
+        params.append(run_id)
+    
     if start_date:
         conditions.append("timestamp >= ?")
         params.append(start_date)
@@ -454,11 +770,39 @@ def get_trades(start_date=None, end_date=None, status=None):
         conditions.append("status = ?")
         params.append(status)
     
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, params
+
+
+def _trades_table_exists(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='trades'")
+    return cursor.fetchone() is not None
+
+
+def get_trades(start_date=None, end_date=None, status=None, run_id=None, limit=None):
+    """获取交易记录
+    
+    Args:
+        run_id: 只读取这次运行的交易记录，为None时读取所有运行
+        limit: 最多返回的记录数，按时间从新到旧
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # 检查trades表是否存在
+    if not _trades_table_exists(cursor):
+        print("警告: trades表不存在")
+        return pd.DataFrame()
+    
+    # 构建查询
+    where, params = _trade_filter(start_date, end_date, status, run_id)
+    query = "SELECT * FROM trades" + where
     
     # 添加排序
     query += " ORDER BY timestamp DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(int(limit))
     
     # 执行查询
     cursor.execute(query, params)
@@ -477,29 +821,70 @@ def get_trades(start_date=None, end_date=None, status=None):
     return df
 
 
-import sqlite3
-import os
+def count_trades(start_date=None, end_date=None, status=None, run_id=None):
+    """符合条件的交易记录数，参数与get_trades相同"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _trades_table_exists(cursor):
+        return 0
+    where, params = _trade_filter(start_date, end_date, status, run_id)
+    cursor.execute("SELECT COUNT(*) FROM trades" + where, params)
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
 
-def get_connection():
-    """获取数据库连接"""
-    # 使用与get_db_connection相同的数据库路径
-    db_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
+
+def iter_trades(start_date=None, end_date=None, status=None, run_id=None, columns=None, chunk_size=50000):
+    """分块读取交易记录，每次返回不超过chunk_size行的DataFrame
     
-    # 连接到数据库文件
-    db_path = os.path.join(db_dir, 'hedge_trading.db')
-    conn = sqlite3.connect(db_path)
+    用cursor.fetchmany逐块读取，内存占用只与chunk_size有关，不随交易记录数增长。
+    不排序，记录按表中的存储顺序返回
     
-    # 创建必要的表
-    create_tables(conn)
+    Args:
+        columns: 只读取这些列，为None时读取所有列
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if not _trades_table_exists(cursor):
+        print("警告: trades表不存在")
+        return
     
-    return conn
+    where, params = _trade_filter(start_date, end_date, status, run_id)
+    select = ", ".join(columns) if columns else "*"
+    cursor.execute(f"SELECT {select} FROM trades" + where, params)
+    names = [column[0] for column in cursor.description]
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame([tuple(row) for row in rows], columns=names)
+    finally:
+        cursor.close()
+        conn.close()
+
+import sqlite3
+import os
+
+def get_connection():
+    """获取当前线程的数据库连接，与get_db_connection使用相同的数据库文件"""
+    return connection_manager.get(HEDGE_DB_PATH, bootstrap=create_tables)
 
 def create_tables(conn):
-    """创建必要的数据库表"""
+    """创建必要的数据库表，每个进程第一次连接时执行一次"""
     cursor = conn.cursor()
     
+    # 旧版本的trades表结构不匹配时删除后重建
+    cursor.execute("PRAGMA table_info(trades)")
+    columns = [column[1] for column in cursor.fetchall()]
+    required_columns = ['position_type', 'long_code', 'short_code', 'open_price_long', 
+                       'open_price_short', 'close_price_long', 'close_price_short']
+    if columns and not all(col in columns for col in required_columns):
+        print("trades表结构不匹配，重新创建表...")
+        cursor.execute("DROP TABLE trades")
+        # 索引随表一起删除，需要重新创建
+        cursor.execute("PRAGMA user_version = 0")
+    
     # 创建股票数据表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS stock_data (
@@ -538,25 +923,177 @@ def create_tables(conn):
         market_impact REAL,
         timing_cost REAL,
         total_cost REAL,
-        status TEXT
+        status TEXT,
+        run_id TEXT NOT NULL DEFAULT ''
     )
     ''')
     
-    # 创建绩效表
+    # 创建绩效表和回测信息表
+    cursor.execute(PERFORMANCE_TABLE_SQL)
+    cursor.execute(BACKTEST_INFO_TABLE_SQL)
+    migrate_run_scope(cursor)
+    
+    # 数据修订号，stock_data每次写入时在同一个事务中加1
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS performance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date TEXT NOT NULL,
-        equity REAL,
-        returns REAL,
-        drawdown REAL,
-        sharpe REAL,
-        UNIQUE(date)
+    CREATE TABLE IF NOT EXISTS data_revisions (
+        name TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL
     )
     ''')
     
+    apply_schema_indexes(conn)
+    conn.commit()
+
+def migrate_run_scope(cursor):
+    """为旧的trades、performance和backtest_info表加上run_id列
+
+    旧数据的run_id为空字符串。旧的performance表以date为唯一键，需要重建为(run_id, date)
+    """
+    def columns(table):
+        return [column[1] for column in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    if 'run_id' not in columns('trades'):
+        cursor.execute("ALTER TABLE trades ADD COLUMN run_id TEXT NOT NULL DEFAULT ''")
+
+    info_columns = columns('backtest_info')
+    if 'run_id' not in info_columns:
+        cursor.execute("ALTER TABLE backtest_info ADD COLUMN run_id TEXT NOT NULL DEFAULT ''")
+    if 'kind' not in info_columns:
+        cursor.execute("ALTER TABLE backtest_info ADD COLUMN kind TEXT NOT NULL DEFAULT 'backtest'")
+
+    if 'run_id' not in columns('performance'):
+        print("performance表没有run_id列，重建表...")
+        cursor.execute("ALTER TABLE performance RENAME TO performance_old")
+        cursor.execute(PERFORMANCE_TABLE_SQL)
+        # 旧表可能有重复日期，按id顺序写入，保留每个日期最后一条
+        cursor.execute("""
+            INSERT OR REPLACE INTO performance (run_id, date, equity, returns, drawdown, sharpe)
+            SELECT '', date, equity, returns, drawdown, sharpe FROM performance_old
+            WHERE date IS NOT NULL ORDER BY id
+        """)
+        cursor.execute("DROP TABLE performance_old")
+        # 索引随旧表一起删除，需要重新创建
+        cursor.execute("PRAGMA user_version = 0")
+
+# 按版本号递增的索引定义，已应用的版本记录在数据库的PRAGMA user_version中
+SCHEMA_INDEXES = [
+    (1, [
+        # get_trades: 按状态筛选并按时间倒序
+        "CREATE INDEX IF NOT EXISTS idx_trades_status_timestamp ON trades (status, timestamp)",
+        # get_trades: 只按时间范围筛选
+        "CREATE INDEX IF NOT EXISTS idx_trades_timestamp ON trades (timestamp)",
+        # update_trade: 按股票对、开仓时间和动作查找
+        "CREATE INDEX IF NOT EXISTS idx_trades_pair_timestamp_action ON trades (pair_id, timestamp, action)",
+        # get_performance_data: 按日期范围扫描（旧的performance表没有UNIQUE(date)）
+        "CREATE INDEX IF NOT EXISTS idx_performance_date ON performance (date)",
+    ]),
+    (2, [
+        # 按run_id读取一次运行的交易记录，以及按run_id批量删除
+        "CREATE INDEX IF NOT EXISTS idx_trades_run_timestamp ON trades (run_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_run_status_timestamp ON trades (run_id, status, timestamp)",
+        # update_trade: 在一次运行中按股票对、开仓时间和动作查找
+        "CREATE INDEX IF NOT EXISTS idx_trades_run_pair_timestamp_action ON trades (run_id, pair_id, timestamp, action)",
+        # performance的UNIQUE(run_id, date)已经覆盖按run_id读取和删除
+        "CREATE INDEX IF NOT EXISTS idx_backtest_info_run ON backtest_info (run_id)",
+        "CREATE INDEX IF NOT EXISTS idx_backtest_info_kind ON backtest_info (kind, id)",
+    ]),
+]
+
+def apply_schema_indexes(conn):
+    """创建尚未应用的索引版本，并更新数据库的user_version"""
+    cursor = conn.cursor()
+    current = cursor.execute("PRAGMA user_version").fetchone()[0]
+    
+    for version, statements in SCHEMA_INDEXES:
+        if version <= current:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        # PRAGMA不支持参数绑定，version是代码中的整数常量
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+        print(f"数据库索引已更新到版本 {version}")
+    
     conn.commit()
 
+# 需要走索引的高频查询，用于EXPLAIN QUERY PLAN检查
+HOT_QUERIES = {
+    'get_trades_by_status': (
+        "SELECT * FROM trades WHERE status = ? ORDER BY timestamp DESC", ('open',)),
+    'get_trades_by_range': (
+        "SELECT * FROM trades WHERE timestamp >= ? AND timestamp <= ? ORDER BY timestamp DESC",
+        ('20220101', '20221231')),
+    'get_trades_by_range_and_status': (
+        "SELECT * FROM trades WHERE timestamp >= ? AND timestamp <= ? AND status = ? ORDER BY timestamp DESC",
+        ('20220101', '20221231', 'closed')),
+    'update_trade_lookup': (
+        "SELECT id FROM trades WHERE run_id = ? AND pair_id = ? AND timestamp = ? AND action = ?",
+        ('', '601318.SH-601601.SH', '20220104', 'open')),
+    'get_performance_by_range': (
+        "SELECT * FROM performance WHERE date >= ? AND date <= ? ORDER BY date",
+        ('20220101', '20221231')),
+    'get_trades_by_run': (
+        "SELECT * FROM trades WHERE run_id = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp DESC",
+        ('', '20220101', '20221231')),
+    'get_trades_by_run_and_status': (
+        "SELECT * FROM trades WHERE run_id = ? AND status = ? ORDER BY timestamp DESC", ('', 'closed')),
+    'get_performance_by_run': (
+        "SELECT * FROM performance WHERE run_id = ? AND date >= ? AND date <= ? ORDER BY date",
+        ('', '20220101', '20221231')),
+    'purge_trades_by_run': (
+        "DELETE FROM trades WHERE run_id IN (?)", ('',)),
+}
+
+def check_query_plans(conn=None):
+    """用EXPLAIN QUERY PLAN检查高频查询是否都走了索引
+
+    Returns:
+        dict: 查询名称到 {'plan': 查询计划列表, 'full_scan': 是否全表扫描} 的字典
+    """
+    conn = conn or get_connection()
+    results = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+        plan = [row[-1] for row in rows]
+        # 全表扫描的计划形如 "SCAN trades"，走索引时为 "SEARCH ... USING INDEX" 或 "SCAN ... USING INDEX"
+        full_scan = any(step.startswith('SCAN') and 'USING' not in step for step in plan)
+        results[name] = {'plan': plan, 'full_scan': full_scan}
+    return results
+
+PERFORMANCE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS performance (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL,
+    equity REAL,
+    returns REAL,
+    drawdown REAL,
+    sharpe REAL,
+    UNIQUE(run_id, date)
+)
+'''
+
+# 按(run_id, date)插入或更新一天的绩效数据
+PERFORMANCE_UPSERT_SQL = '''
+INSERT INTO performance (run_id, date, equity, returns, drawdown, sharpe)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(run_id, date) DO UPDATE SET
+    equity = excluded.equity,
+    returns = excluded.returns,
+    drawdown = excluded.drawdown,
+    sharpe = excluded.sharpe
+'''
+
+def write_performance_row(cursor, data):
+    """在当前事务中写入一天的绩效数据，同一次运行已有该日期的记录时更新
+
+    Args:
+        data: 包含date, equity, return, drawdown, sharpe，以及所属运行的run_id
+    """
+    cursor.execute(
+        PERFORMANCE_UPSERT_SQL,
+        (data.get('run_id', ''), data['date'], data['equity'], data['return'], data['drawdown'], data['sharpe'])
+    )
+
 def save_performance_data(data):
     """保存绩效数据到数据库
     
@@ -567,21 +1104,23 @@ def save_performance_data(data):
     cursor = conn.cursor()
     
     # 确保performance表存在
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS performance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        date TEXT,
-        equity REAL,
-        returns REAL,
-        drawdown REAL,
-        sharpe REAL
-    )
-    ''')
+    cursor.execute(PERFORMANCE_TABLE_SQL)
+    write_performance_row(cursor, data)
     
-    # 检查是否已存在该日期的记录
+    conn.commit()
+    conn.close()
+
+def write_trade_update(cursor, trade_data, run_id=''):
+    """在当前事务中写入平仓后的交易记录：更新这次运行中对应的开仓记录，找不到时插入新记录
+
+    Args:
+        trade_data: 包含pair_id, timestamp, action以及平仓价格、pnl、commission、status、close_time
+        run_id: 交易记录所属的运行，只在这次运行的记录中查找
+    """
+    # 检查交易记录是否存在
     cursor.execute(
-        "SELECT id FROM performance WHERE date = ?",
-        (data['date'],)
+        "SELECT id FROM trades WHERE run_id = ? AND pair_id = ? AND timestamp = ? AND action = ?",
+        (run_id or '', trade_data['pair_id'], trade_data['timestamp'], trade_data['action'])
     )
     result = cursor.fetchone()
     
@@ -589,74 +1128,236 @@ def save_performance_data(data):
         # 更新现有记录
         cursor.execute(
             """
-            UPDATE performance 
-            SET equity = ?, returns = ?, drawdown = ?, sharpe = ?
-            WHERE date = ?
+            UPDATE trades SET 
+            close_price_long = ?, 
+            close_price_short = ?, 
+            pnl = ?, 
+            commission = ?, 
+            status = ?, 
+            close_time = ?
+            WHERE id = ?
             """,
-            (data['equity'], data['return'], data['drawdown'], data['sharpe'], data['date'])
+            (
+                trade_data['close_price_long'],
+                trade_data['close_price_short'],
+                trade_data['pnl'],
+                trade_data['commission'],
+                trade_data['status'],
+                trade_data.get('close_time', ''),
+                result[0]
+            )
         )
     else:
-        # 插入新记录
-        cursor.execute(
-            """
-            INSERT INTO performance (date, equity, returns, drawdown, sharpe)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (data['date'], data['equity'], data['return'], data['drawdown'], data['sharpe'])
-        )
-    
-    conn.commit()
-    conn.close()
-
-# 确保在导入模块时创建数据库和表
-if __name__ == "__main__":
-    conn = get_connection()
-    conn.close()
+        # 如果记录不存在，创建新记录
+        cursor.execute(TRADE_INSERT_SQL, prepare_trade_row(trade_data, run_id))
 
-def update_trade(trade_data):
-    """更新交易记录"""
+def update_trade(trade_data, run_id=''):
+    """更新交易记录
+    
+    Args:
+        run_id: 交易记录所属的运行，只在这次运行的记录中查找
+    """
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # 检查交易记录是否存在
-        cursor.execute(
-            "SELECT id FROM trades WHERE pair_id = ? AND timestamp = ? AND action = ?",
-            (trade_data['pair_id'], trade_data['timestamp'], trade_data['action'])
-        )
-        result = cursor.fetchone()
-        
-        if result:
-            # 更新现有记录
-            trade_id = result[0]
-            cursor.execute(
-                """
-                UPDATE trades SET 
-                close_price_long = ?, 
-                close_price_short = ?, 
-                pnl = ?, 
-                commission = ?, 
-                status = ?, 
-                close_time = ?
-                WHERE id = ?
-                """,
-                (
-                    trade_data['close_price_long'],
-                    trade_data['close_price_short'],
-                    trade_data['pnl'],
-                    trade_data['commission'],
-                    trade_data['status'],
-                    trade_data.get('close_time', ''),
-                    trade_id
-                )
-            )
-        else:
-            # 如果记录不存在，创建新记录
-            save_trade(trade_data)
-            
+        write_trade_update(cursor, trade_data, run_id)
         conn.commit()
         conn.close()
         return True
     except Exception as e:
         print(f"更新交易记录时出错: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def get_close_prices(start_date, end_date, codes=None):
+    """获取日期区间内股票的收盘价
+
+    Args:
+        codes: 股票代码列表，为None时返回所有股票
+
+    Returns:
+        DataFrame: 包含code、date、close列
+    """
+    conn = get_connection()
+
+    query = "SELECT code, date, close FROM stock_data WHERE date >= ? AND date <= ?"
+    params = [start_date, end_date]
+    if codes is not None:
+        query += f" AND code IN ({','.join('?' * len(codes))})"
+        params.extend(codes)
+    query += " ORDER BY date"
+
+    df = pd.read_sql_query(query, conn, params=params)
+
+    conn.close()
+    return df
+
+# get_price_panel可以读取的stock_data列
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+def code_aliases(code):
+    """股票代码在数据库中可能的写法，按优先级排列（上交所代码可能写成.SH或.SS）"""
+    aliases = [code]
+    if code.endswith('.SH'):
+        aliases.append(code[:-3] + '.SS')
+    elif code.endswith('.SS'):
+        aliases.append(code[:-3] + '.SH')
+    return aliases
+
+def get_price_panel(codes, start_date, end_date, fields=('close',), aliases=None):
+    """用一次查询加载多只股票的价格，并转换为 日期×股票 的矩阵
+
+    每只股票的各种代码写法一起放入 code IN (...) 查询，按优先级取第一个有数据的写法
+
+    Args:
+        codes: 股票代码列表
+        start_date: 开始日期，格式为YYYYMMDD
+        end_date: 结束日期，格式为YYYYMMDD
+        fields: 需要的价格字段，取值见PRICE_FIELDS
+        aliases: 股票代码到候选写法列表的字典，默认使用code_aliases
+
+    Returns:
+        dict: dates为日期数组，symbol_index为股票代码到列下标的字典（只包含有数据的股票），
+            fields为字段名到矩阵的字典（缺失值为NaN），resolved为股票代码到数据库中实际写法的字典
+    """
+    fields = list(fields)
+    unknown = [field for field in fields if field not in PRICE_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的价格字段: {unknown}，可选 {PRICE_FIELDS}")
+
+    codes = list(dict.fromkeys(codes))
+    candidates = {code: (aliases or {}).get(code) or code_aliases(code) for code in codes}
+    db_codes = list(dict.fromkeys(alias for names in candidates.values() for alias in names))
+
+    conn = get_connection()
+    rows = []
+    if db_codes:
+        query = (f"SELECT code, date, {', '.join(fields)} FROM stock_data "
+                 f"WHERE code IN ({','.join('?' * len(db_codes))}) AND date >= ? AND date <= ?")
+        rows = conn.execute(query, [*db_codes, start_date, end_date]).fetchall()
+    conn.close()
+
+    # 每只股票取第一个有数据的代码写法
+    found = {row[0] for row in rows}
+    resolved = {}
+    for code in codes:
+        for alias in candidates[code]:
+            if alias in found:
+                resolved[code] = alias
+                break
+
+    symbol_index = {code: j for j, code in enumerate(resolved)}
+    column_of = {alias: symbol_index[code] for code, alias in resolved.items()}
+    rows = [row for row in rows if row[0] in column_of]
+
+    dates, date_rows = np.unique(np.array([row[1] for row in rows], dtype=object).astype(str), return_inverse=True)
+    columns = np.array([column_of[row[0]] for row in rows], dtype=int)
+    values = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), len(fields))
+
+    panels = {}
+    for k, field in enumerate(fields):
+        panel = np.full((len(dates), len(symbol_index)), np.nan)
+        panel[date_rows, columns] = values[:, k]
+        panels[field] = panel
+
+    return {
+        'dates': dates,
+        'symbol_index': symbol_index,
+        'fields': panels,
+        'resolved': resolved
+    }
+
+def save_pair_universe(pairs, scan_info):
+    """保存股票对扫描结果
+
+    Args:
+        pairs: 按排名排好序的股票对字典列表
+        scan_info: 扫描信息，包含start_date、end_date、timestamp
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # 确保pair_universe表存在
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pair_universe (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_time TEXT NOT NULL,
+        start_date TEXT,
+        end_date TEXT,
+        rank INTEGER,
+        stock1_code TEXT NOT NULL,
+        stock2_code TEXT NOT NULL,
+        correlation REAL,
+        hedge_ratio REAL,
+        adf_stat REAL,
+        critical_value REAL,
+        half_life REAL,
+        observations INTEGER
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pair_universe_scan ON pair_universe (scan_time, rank)")
+
+    sql = '''
+    INSERT INTO pair_universe (scan_time, start_date, end_date, rank, stock1_code, stock2_code,
+                               correlation, hedge_ratio, adf_stat, critical_value, half_life, observations)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    cursor.executemany(sql, [
+        (
+            scan_info.get('timestamp', ''),
+            scan_info.get('start_date', ''),
+            scan_info.get('end_date', ''),
+            pair['rank'],
+            pair['stock1_code'],
+            pair['stock2_code'],
+            pair['correlation'],
+            pair['hedge_ratio'],
+            pair['adf_stat'],
+            pair['critical_value'],
+            pair['half_life'],
+            pair['observations']
+        )
+        for pair in pairs
+    ])
+
+    conn.commit()
+    conn.close()
+
+def get_pair_universe(top_n=None, scan_time=None):
+    """获取股票对扫描结果，默认返回最近一次扫描
+
+    Returns:
+        DataFrame: 按排名排序的股票对
+    """
+    conn = get_db_connection()
+
+    try:
+        if scan_time is None:
+            row = conn.execute("SELECT MAX(scan_time) FROM pair_universe").fetchone()
+            scan_time = row[0] if row else None
+        if scan_time is None:
+            return pd.DataFrame()
+
+        query = "SELECT * FROM pair_universe WHERE scan_time = ? ORDER BY rank"
+        params = [scan_time]
+        if top_n:
+            query += " LIMIT ?"
+            params.append(int(top_n))
+
+        return pd.read_sql_query(query, conn, params=params)
+    except sqlite3.OperationalError:
+        # 还没有运行过扫描
+        return pd.DataFrame()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    # 检查高频查询的执行计划，有全表扫描时以非零状态退出
+    failed = []
+    for name, result in check_query_plans().items():
+        status = '全表扫描' if result['full_scan'] else '使用索引'
+        print(f"{name}: {status} | {' / '.join(result['plan'])}")
+        if result['full_scan']:
+            failed.append(name)
+    if failed:
+        raise SystemExit(f"以下查询没有使用索引: {failed}")
@@ -0,0 +1,211 @@
+import json
+import time
+import threading
+from collections import deque
+
+# 每条事件流保留的最近事件数，重连时Last-Event-ID早于这个范围的客户端会收到完整快照
+EVENT_HISTORY = 2000
+
+# 没有新事件时发送注释行的间隔（秒），用于保持连接和发现已断开的客户端
+KEEPALIVE_INTERVAL = 15
+
+# 快照中保留的最近交易记录数
+SNAPSHOT_TRADES = 10
+
+
+def format_sse(event_id, event_type, data):
+    """编码为一条SSE消息"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+def empty_execution_state():
+    """执行系统事件流的初始快照"""
+    return {'progress': 0, 'date': None, 'metrics': None, 'trades': [], 'equity': []}
+
+
+def apply_execution_event(state, event_type, data):
+    """把执行系统的事件合并进快照，返回新的快照"""
+    if event_type == 'reset':
+        state = empty_execution_state()
+        state.update({key: data[key] for key in ('progress', 'date', 'metrics') if key in data})
+    elif event_type == 'progress':
+        state['progress'] = data['progress']
+        state['date'] = data['date']
+    elif event_type == 'metrics':
+        state['metrics'] = {**(state['metrics'] or {}), **data}
+    elif event_type == 'equity':
+        state['equity'].append(data)
+    elif event_type == 'trade':
+        trades = state['trades']
+        for i, trade in enumerate(trades):
+            if trade['seq'] == data['seq']:
+                trades[i] = data
+                break
+        else:
+            trades.append(data)
+            if len(trades) > SNAPSHOT_TRADES:
+                del trades[0]
+    return state
+
+
+def merge_event(state, event_type, data):
+    """默认的快照合并方式：事件数据覆盖快照中的同名字段"""
+    state.update(data)
+    return state
+
+
+class EventBroker:
+    """带版本号的事件发布/订阅
+
+    每条事件在发布时分配递增的版本号并编码一次，放进所有订阅者共享的环形缓冲区，
+    订阅者各自记住已经读到的版本号，只取之后的事件。发布的开销与订阅者数量无关，
+    没有新事件时订阅者阻塞等待，不占用CPU。
+
+    broker同时用reducer把事件合并成一份当前状态的快照，新连接或Last-Event-ID
+    已经不在缓冲区内的客户端先收到快照，再接着收增量事件
+    """
+
+    def __init__(self, history=EVENT_HISTORY, reducer=merge_event, state=None):
+        """
+        Args:
+            history: 缓冲区保留的事件数
+            reducer: (快照, 事件类型, 数据) -> 新快照
+            state: 初始快照
+        """
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)  # (版本号, 编码后的消息)
+        # 版本号从当前毫秒时间开始，服务重启后旧客户端的Last-Event-ID一定早于缓冲区，会收到快照
+        self._last_id = int(time.time() * 1000)
+        self._reducer = reducer
+        self._state = state if state is not None else {}
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, event_type, data):
+        """发布一条事件，返回它的版本号"""
+        with self._condition:
+            self._last_id += 1
+            self._state = self._reducer(self._state, event_type, data)
+            self._events.append((self._last_id, format_sse(self._last_id, event_type, data)))
+            self._condition.notify_all()
+            return self._last_id
+
+    def read(self, last_id, timeout=None):
+        """读取版本号大于last_id的事件，没有新事件时最多等待timeout秒
+
+        Returns:
+            tuple: (新的last_id, 编码后的消息列表)；last_id已经不在缓冲区内时
+                   返回一条snapshot消息代替缺失的事件
+        """
+        with self._condition:
+            if last_id == self._last_id and timeout:
+                self._condition.wait_for(lambda: self._last_id > last_id, timeout)
+
+            if last_id == self._last_id:
+                return last_id, []
+
+            oldest = self._events[0][0] if self._events else self._last_id + 1
+            if last_id is None or last_id < oldest - 1 or last_id > self._last_id:
+                return self._last_id, [format_sse(self._last_id, 'snapshot', self._state)]
+
+            messages = [message for event_id, message in self._events if event_id > last_id]
+            return self._last_id, messages
+
+    def stream(self, last_id=None, keepalive=KEEPALIVE_INTERVAL, closed=None):
+        """SSE消息生成器，last_id为None时先发送快照
+
+        Args:
+            closed: 返回事件流是否已经结束的函数，结束且已发送全部事件后生成器退出；
+                    为None时一直保持连接
+        """
+        while True:
+            last_id, messages = self.read(last_id, timeout=keepalive)
+            if messages:
+                yield ''.join(messages)
+            elif closed is None or not closed():
+                yield ': keepalive\n\n'
+            if closed is not None and closed() and last_id == self._last_id:
+                return
+
+
+class ExecutionEventPublisher:
+    """执行系统的update_callback，把每个交易日的完整状态转换为增量事件
+
+    只发布发生变化的内容：
+    - progress: 进度和当前日期
+    - equity: 新的权益点
+    - metrics: 数值变化了的指标
+    - trade: 新开的交易，以及状态或盈亏发生变化的交易
+    """
+
+    def __init__(self, broker, equity_source=None):
+        """
+        Args:
+            broker: EventBroker
+            equity_source: 返回当天权益的函数，返回None或为None时不发布权益点
+        """
+        self.broker = broker
+        self.equity_source = equity_source
+        self.reset()
+
+    def reset(self):
+        self._metrics = {}
+        self._date = None
+        self._published = 0  # 已经发布过的交易数
+        self._open = {}      # 未平仓交易的序号 -> 上次发布时的(状态, 盈亏)
+
+    def start(self, progress=0, date_str=None, metrics=None):
+        """新一轮执行开始，客户端收到reset后清空本地状态"""
+        self.reset()
+        self._metrics = dict(metrics or {})
+        self.broker.publish('reset', {'progress': progress, 'date': date_str, 'metrics': metrics})
+
+    def __call__(self, progress, date_str, metrics, trades):
+        broker = self.broker
+
+        if date_str != self._date:
+            broker.publish('progress', {'progress': progress, 'date': date_str})
+            if self.equity_source is not None:
+                equity = self.equity_source()
+                if equity is not None:
+                    broker.publish('equity', {'date': date_str, 'equity': equity})
+            self._date = date_str
+        elif progress == 100:
+            broker.publish('progress', {'progress': progress, 'date': date_str})
+
+        changed = {key: value for key, value in (metrics or {}).items() if self._metrics.get(key) != value}
+        if changed:
+            self._metrics.update(changed)
+            broker.publish('metrics', changed)
+
+        # 交易列表被清空（例如停止后重新启动）时从头开始
+        if len(trades) < self._published:
+            self._published = 0
+            self._open = {}
+
+        # 已发布的未平仓交易只检查状态是否变化，新交易逐条发布
+        for seq, published in list(self._open.items()):
+            trade = trades[seq]
+            if (trade.get('status'), trade.get('pnl')) != published:
+                self._publish_trade(seq, trade)
+        for seq in range(self._published, len(trades)):
+            self._publish_trade(seq, trades[seq])
+        self._published = len(trades)
+
+    def _publish_trade(self, seq, trade):
+        if trade.get('status') == 'closed':
+            self._open.pop(seq, None)
+        else:
+            self._open[seq] = (trade.get('status'), trade.get('pnl'))
+        self.broker.publish('trade', {**trade, 'seq': seq})
+
+
+def parse_last_event_id(value):
+    """解析Last-Event-ID，无法解析时返回None（按新连接处理）"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
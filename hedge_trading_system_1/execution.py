@@ -3,15 +3,16 @@ import threading
 import numpy as np
 import pandas as pd
 import database as db
+from journal import get_journal
+from metrics import RunningMetrics
+from replay import ReplayClock
+from price_store import get_price_store
+from panel_cache import get_price_panel
+from charts import drawdown_series
 from datetime import datetime, timedelta
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from strategy import PairTradingStrategy
+from strategy import PairTradingStrategy, RollingZScore
 from config.config import EXECUTION_CONFIG
 import database as db
-import yfinance as yf
-import os
 
 # 添加DataLoader类
 class DataLoader:
@@ -20,6 +21,7 @@ class DataLoader:
         self.start_date = start_date
         self.end_date = end_date
         self.data = {}
+        self.price_index = None
         
     def load_data(self, stock_codes):
         """加载股票数据"""
@@ -34,23 +36,10 @@ class DataLoader:
                 
                 # 保存到数据库
                 if df is not None and len(df) > 0:
-                    for index, row in df.iterrows():
-                        # 修复：确保获取单个值而不是Series
-                        data = {
-                            'code': code,
-                            'date': index.strftime('%Y%m%d') if hasattr(index, 'strftime') else str(index),
-                            'open': float(row['Open']) if not pd.isna(row['Open']) else 0.0,
-                            'high': float(row['High']) if not pd.isna(row['High']) else 0.0,
-                            'low': float(row['Low']) if not pd.isna(row['Low']) else 0.0,
-                            'close': float(row['Close']) if not pd.isna(row['Close']) else 0.0,
-                            'volume': float(row['Volume']) if not pd.isna(row['Volume']) else 0,
-                            'amount': float(row['Volume'] * row['Close']) if not pd.isna(row['Volume']) and not pd.isna(row['Close']) else 0.0
-                        }
-                        try:
-                            db.save_stock_data(data)
-                        except Exception as e:
-                            print(f"保存股票数据时出错: {e}")
-                            print(f"数据: {data}")
+                    try:
+                        get_price_store().save_stock_data(df, code=code)
+                    except Exception as e:
+                        print(f"保存股票数据时出错: {e}")
             else:
                 # 统一列名为大写格式，与yfinance保持一致
                 df.rename(columns={
@@ -67,6 +56,8 @@ class DataLoader:
                 print(f"成功加载 {code} 的 {len(df)} 条数据")
             else:
                 print(f"警告: 无法获取 {code} 的数据")
+        
+        self.build_price_index()
     
     def load_recent_data_from_db(self, stock_codes, months=3):
         """直接从数据库加载最近几个月的数据"""
@@ -79,20 +70,25 @@ class DataLoader:
         
         print(f"从数据库加载最近{months}个月的数据: {start_date_str} 至 {end_date_str}")
         
+        # 一次加载所有股票，优先复用进程内缓存的只读面板
+        panel = get_price_panel(stock_codes, start_date_str, end_date_str, fields=db.PRICE_FIELDS)
+        dates = pd.to_datetime(panel['dates'], format='%Y%m%d')
+        
         for code in stock_codes:
-            # 从数据库获取数据
-            df = db.get_stock_data(code, start_date_str, end_date_str)
-            
-            if df is not None and len(df) > 0:
-                # 将日期列转换为datetime索引
-                if 'date' in df.columns:
-                    df['date'] = pd.to_datetime(df['date'], format='%Y%m%d')
-                    df.set_index('date', inplace=True)
-                
-                self.data[code] = df
-                print(f"成功从数据库加载 {code} 的 {len(df)} 条数据")
-            else:
+            if code not in panel['symbol_index']:
                 print(f"警告: 数据库中没有 {code} 在指定时间范围内的数据")
+                continue
+            
+            j = panel['symbol_index'][code]
+            present = ~np.isnan(panel['fields']['close'][:, j])
+            df = pd.DataFrame({field: values[present, j] for field, values in panel['fields'].items()},
+                              index=pd.DatetimeIndex(dates[present], name='date'))
+            df.insert(0, 'code', panel['resolved'][code])
+            
+            self.data[code] = df
+            print(f"成功从数据库加载 {code} 的 {len(df)} 条数据")
+        
+        self.build_price_index()
         
         return len(self.data) > 0
     
@@ -111,41 +107,70 @@ class DataLoader:
         
         return date_strs
     
+    def build_price_index(self):
+        """为每只股票建立 日期→收盘价 的索引
+
+        日期转换为升序的YYYYMMDD整数数组，查价时用二分查找直接定位，
+        与历史数据长度无关。self.data变化后需要重新调用
+        """
+        self.price_index = {}
+        for code, df in self.data.items():
+            # 确定收盘价列名
+            if 'Close' in df.columns:
+                close_column = 'Close'
+            elif 'close' in df.columns:
+                close_column = 'close'
+            else:
+                print(f"警告: 数据中没有收盘价列 (Close/close)，可用列: {df.columns.tolist()}")
+                continue
+            
+            dates = pd.DatetimeIndex(df.index)
+            if dates.tz is not None:
+                dates = dates.tz_localize(None)
+            keys = (dates.year * 10000 + dates.month * 100 + dates.day).to_numpy(dtype=np.int64)
+            closes = np.asarray(df[close_column], dtype=np.float64).reshape(len(df), -1)[:, 0]
+            
+            order = np.argsort(keys, kind='stable')
+            self.price_index[code] = (keys[order], closes[order])
+    
+    @staticmethod
+    def _date_key(date):
+        """把日期转换为YYYYMMDD整数，无法识别时返回None"""
+        if isinstance(date, str):
+            date = date.replace('-', '')
+            return int(date) if len(date) == 8 and date.isdigit() else None
+        if hasattr(date, 'year'):
+            return date.year * 10000 + date.month * 100 + date.day
+        return None
+    
     def get_price(self, code, date):
-        """获取指定日期的收盘价"""
-        if code not in self.data:
-            return None
+        """获取指定日期的收盘价
         
-        # 确定收盘价列名
-        close_column = None
-        if 'Close' in self.data[code].columns:
-            close_column = 'Close'
-        elif 'close' in self.data[code].columns:
-            close_column = 'close'
-        else:
-            print(f"警告: 数据中没有收盘价列 (Close/close)，可用列: {self.data[code].columns.tolist()}")
+        日期为字符串时返回该日期或之后最近一个交易日的收盘价，为datetime时只匹配同一天
+        """
+        if getattr(self, 'price_index', None) is None:
+            self.build_price_index()
+        
+        index = self.price_index.get(code)
+        key = self._date_key(date)
+        if index is None or key is None:
             return None
         
-        # 如果日期是字符串格式，转换为datetime
-        if isinstance(date, str):
-            try:
-                date_obj = datetime.strptime(date, '%Y%m%d')
-                # 查找最接近的日期
-                for idx, row_date in enumerate(self.data[code].index):
-                    if row_date >= date_obj:
-                        return self.data[code].iloc[idx][close_column]
-                return None
-            except:
-                # 如果转换失败，尝试直接查找
-                if date in self.data[code].index:
-                    return self.data[code].loc[date][close_column]
-                return None
-        
-        # 如果日期是datetime格式
-        if date in self.data[code].index:
-            return self.data[code].loc[date][close_column]
+        keys, closes = index
+        position = int(np.searchsorted(keys, key, side='left'))
+        if position >= len(keys):
+            return None
+        if not isinstance(date, str) and keys[position] != key:
+            return None
+        return float(closes[position])
+    
+    def get_prices(self, codes, date):
+        """批量获取多只股票在指定日期的收盘价
         
-        return None
+        Returns:
+            dict: 股票代码到收盘价的字典，没有价格的股票为None
+        """
+        return {code: self.get_price(code, date) for code in codes}
     
     def _fetch_data_from_yfinance(self, code):
         """从yfinance获取股票数据"""
@@ -159,6 +184,7 @@ class DataLoader:
                 yf_code = code
             
             # 获取数据
+            import yfinance as yf
             df = yf.download(yf_code, start=self.start_date, end=self.end_date)
             
             return df
@@ -179,13 +205,19 @@ class ExecutionSystem:
         self.thread = None
         self.current_date_index = 0
         self.equity_curve = [initial_capital]
+        self.equity_dates = []
         self.trades = []
+        self.run_id = None  # 交易记录在数据库中的run_id，第一次启动时生成，与self.trades同生命周期
         self.positions = {}
         self.update_callback = None
         self.trading_days = []
         self.returns = []
         self.drawdowns = []
         self.data = {}
+        self.zscore_trackers = {}  # 每个股票对的滚动z-score
+        self.running_metrics = RunningMetrics(initial_capital)  # 增量维护的绩效指标
+        self.clock = ReplayClock(mode=EXECUTION_CONFIG['replay_mode'], speed=EXECUTION_CONFIG['replay_speed'],
+                                 seconds_per_day=EXECUTION_CONFIG['seconds_per_day'])
         
         # 设置日期范围
         end_date = datetime.now()
@@ -193,11 +225,8 @@ class ExecutionSystem:
         self.start_date = start_date.strftime('%Y-%m-%d')
         self.end_date = end_date.strftime('%Y-%m-%d')
         
-        # 初始化数据加载器
+        # 初始化数据加载器，数据在第一次启动时才加载
         self.data_loader = DataLoader(start_date=self.start_date, end_date=self.end_date)
-        
-        # 加载数据
-        self._load_data()
     
     def _load_data(self):
         """加载历史数据"""
@@ -218,37 +247,45 @@ class ExecutionSystem:
         # 将数据加载器中的数据复制到执行系统中
         self.data = self.data_loader.data
 
-    def start(self, update_callback=None):
-        """启动执行系统"""
+    def start(self, update_callback=None, replay_mode=None, speed=None):
+        """启动执行系统
+        
+        Args:
+            update_callback: 每个交易日处理完后的回调函数
+            replay_mode: 回放模式，见replay.REPLAY_MODES，默认沿用当前模式
+            speed: speed模式下的回放倍速
+        """
         if self.running:
             return {'status': 'error', 'message': '执行系统已经在运行'}
         
+        if replay_mode is not None or speed is not None:
+            try:
+                self.clock.set_mode(replay_mode or self.clock.mode, speed)
+            except ValueError as e:
+                return {'status': 'error', 'message': str(e)}
+        self.clock.reset()
+        
         # 设置回调函数
         self.update_callback = update_callback
         
+        # 交易记录在多次启动之间保留，沿用同一个run_id
+        if self.run_id is None:
+            self._start_run()
+        
         # 重置状态
         self.running = True
         self.current_date_index = 0
         self.equity_curve = [self.initial_capital]  # 初始化权益曲线
+        self.equity_dates = []  # 权益曲线中每个交易日对应的日期（不含初始资金）
+        self.zscore_trackers = {}
         
-        # 创建初始图表
-        static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-        if not os.path.exists(static_dir):
-            os.makedirs(static_dir)
+        # 权益曲线重新开始，之前已平仓的交易仍计入胜率和盈亏比
+        self.running_metrics = RunningMetrics(self.initial_capital)
+        for trade in self.trades:
+            if trade['status'] == 'closed':
+                self.running_metrics.record_trade(trade['pnl'])
         
-        chart_path = os.path.join(static_dir, 'execution_results.png')
         try:
-            import matplotlib.pyplot as plt
-            plt.figure(figsize=(10, 6))
-            plt.title('策略权益曲线 (等待数据...)')
-            plt.xlabel('交易日')
-            plt.ylabel('权益')
-            plt.grid(True)
-            plt.ylim([self.initial_capital * 0.9, self.initial_capital * 1.1])  # 设置一个合理的范围
-            plt.savefig(chart_path)
-            plt.close()
-            print(f"初始空白图表已创建: {chart_path}")
-            
             # 立即调用回调函数，更新初始状态
             if self.update_callback:
                 # 计算初始指标
@@ -263,7 +300,7 @@ class ExecutionSystem:
                 }
                 self.update_callback(0, '等待数据...', metrics, [])
         except Exception as e:
-            print(f"创建初始空白图表失败: {e}")
+            print(f"更新初始状态失败: {e}")
         
         # 启动执行线程
         self.thread = threading.Thread(target=self._run_loop)
@@ -277,15 +314,40 @@ class ExecutionSystem:
     def stop(self):
         """停止执行系统"""
         self.running = False
+        # 唤醒正在等待下一个交易日的回放线程
+        self.clock.stop()
         if self.thread:
             self.thread.join()
+        journal = get_journal()
+        journal.flush(run_id=self.run_id)
+        dropped = journal.dropped(self.run_id)
         print("执行系统已停止")
         
+        if dropped:
+            message = f'执行系统已停止，但有 {dropped} 条交易记录没有写入数据库'
+            print(f"警告: {message}")
+            return {
+                'status': 'error',
+                'message': message
+            }
+        
         return {
             'status': 'success',
             'message': '执行系统已停止'
         }
     
+    def _start_run(self):
+        """生成新的run_id并记录运行信息，之后的交易记录都写入这次运行"""
+        self.run_id = db.new_run_id('execution')
+        db.save_backtest_info({
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'initial_capital': self.initial_capital,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'run_id': self.run_id,
+            'kind': 'execution'
+        })
+    
     def _initialize_backtest(self):
         """初始化回测数据"""
         print(f"初始化回测数据: {self.start_date} 至 {self.end_date}")
@@ -297,6 +359,8 @@ class ExecutionSystem:
         self.daily_returns = []
         self.daily_equity = []
         self.equity_curve = [self.initial_capital]
+        self.equity_dates = []
+        self.running_metrics = RunningMetrics(self.initial_capital)
         self.returns = []
         self.drawdowns = []
         self.current_date_index = 0
@@ -310,20 +374,18 @@ class ExecutionSystem:
         # 获取所有交易日
         self.trading_days = sorted(self.data.keys())
         
-        # 保存回测配置信息
-        backtest_info = {
-            'start_date': self.start_date,
-            'end_date': self.end_date,
-            'initial_capital': self.initial_capital,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        db.save_backtest_info(backtest_info)
+        # 交易记录已清空，开始新的一次运行
+        self._start_run()
         
         print(f"初始化完成，共 {len(self.trading_days)} 个交易日")
     
     def _run_loop(self):
         """执行系统主循环"""
         try:
+            # 第一次运行时在回放线程中加载数据，不阻塞启动请求
+            if not self.data:
+                self._load_data()
+            
             # 获取交易日期列表
             trading_dates = self.data_loader.get_trading_dates()
             
@@ -353,21 +415,21 @@ class ExecutionSystem:
                 
                 # 更新权益曲线
                 self.equity_curve.append(self.calculate_equity())
+                self.equity_dates.append(date)
+                self.running_metrics.update_equity(self.equity_curve[-1])
                 
                 # 计算指标
                 metrics = self._calculate_metrics()
                 
-                # 生成图表
-                self._generate_charts()
-                
                 # 调用回调函数
                 if self.update_callback:
                     self.update_callback(progress, date, metrics, self.trades)
                 
-                # 暂停一下，模拟实时执行
-                time.sleep(1)
+                # 由回放时钟决定等待多久，暂停时在这里等待恢复或单步推进
+                if i < total_days - 1 and not self.clock.wait_next():
+                    break
             
-            # 执行完成后，设置进度为100%
+            # 执行完成，设置进度为100%
             if self.running and self.update_callback:
                 self.update_callback(100, trading_dates[-1], self._calculate_metrics(), self.trades)
             
@@ -382,24 +444,37 @@ class ExecutionSystem:
     def _process_trading_day(self, date):
         """处理单个交易日"""
         try:
+            # 一次取出当天所有股票的价格
+            codes = {code for pair in self.strategy.pairs for code in pair}
+            codes.update(code for position in self.positions.values()
+                         for code in (position['stock1_code'], position['stock2_code']))
+            prices = self.data_loader.get_prices(codes, date)
+            
             # 获取所有股票对的价格
             pair_prices = {}
             for i, pair in enumerate(self.strategy.pairs):
                 stock1_code, stock2_code = pair
                 
                 # 获取价格
-                stock1_price = self.data_loader.get_price(stock1_code, date)
-                stock2_price = self.data_loader.get_price(stock2_code, date)
+                stock1_price = prices[stock1_code]
+                stock2_price = prices[stock2_code]
                 
                 if stock1_price is None or stock2_price is None:
                     print(f"警告: 无法获取股票对 {stock1_code}/{stock2_code} 在 {date} 的价格")
                     continue
                 
+                # 逐日更新股票对的滚动z-score，每个交易日O(1)；只用于监控，开仓仍使用固定的比率阈值
+                tracker = self.zscore_trackers.get(i)
+                if tracker is None:
+                    tracker = self.zscore_trackers[i] = RollingZScore(self.strategy.lookback_period)
+                z_score = tracker.update(stock1_price / stock2_price)
+                
                 pair_prices[i] = {
                     'stock1_code': stock1_code,
                     'stock2_code': stock2_code,
                     'stock1_price': stock1_price,
-                    'stock2_price': stock2_price
+                    'stock2_price': stock2_price,
+                    'z_score': z_score
                 }
             
             # 检查是否有持仓需要平仓
@@ -409,8 +484,8 @@ class ExecutionSystem:
                 # 获取当前价格
                 stock1_code = position['stock1_code']
                 stock2_code = position['stock2_code']
-                current_stock1_price = self.data_loader.get_price(stock1_code, date)
-                current_stock2_price = self.data_loader.get_price(stock2_code, date)
+                current_stock1_price = prices[stock1_code]
+                current_stock2_price = prices[stock2_code]
                 
                 if current_stock1_price is None or current_stock2_price is None:
                     print(f"警告: 无法获取持仓股票 {stock1_code}/{stock2_code} 在 {date} 的价格")
@@ -572,9 +647,9 @@ class ExecutionSystem:
             
             self.trades.append(trade)
             
-            # 保存交易记录到数据库
+            # 保存交易记录到数据库（后台批量写入）
             try:
-                db.save_trade(trade)
+                get_journal().record_trade(trade, self.run_id)
             except Exception as e:
                 print(f"保存交易记录到数据库时出错: {e}")
             
@@ -617,31 +692,11 @@ class ExecutionSystem:
                     self.trades[i]['commission'] += commission
                     self.trades[i]['status'] = 'closed'
                     self.trades[i]['close_time'] = date_str
+                    self.running_metrics.record_trade(pnl)
                     
-                    # 尝试更新数据库
+                    # 平仓记录放入写入队列，由后台线程在开仓记录之后更新数据库，交易线程不等待磁盘
                     try:
-                        # 检查数据库模块是否有update_trade函数
-                        if hasattr(db, 'update_trade'):
-                            db.update_trade(self.trades[i])
-                        else:
-                            # 如果没有update_trade函数，使用save_trade函数
-                            print("警告: 数据库模块没有update_trade函数，使用save_trade函数")
-                            # 确保trade记录有id字段
-                            if 'id' not in self.trades[i]:
-                                # 查询数据库获取id
-                                conn = db.get_db_connection()
-                                cursor = conn.cursor()
-                                cursor.execute(
-                                    "SELECT id FROM trades WHERE pair_id = ? AND timestamp = ? AND action = ?",
-                                    (pair_id, self.trades[i]['timestamp'], 'open')
-                                )
-                                result = cursor.fetchone()
-                                if result:
-                                    self.trades[i]['id'] = result[0]
-                                conn.close()
-                            
-                            # 保存更新后的交易记录
-                            db.save_trade(self.trades[i])
+                        get_journal().record_trade_update(self.trades[i], self.run_id)
                     except Exception as e:
                         print(f"更新交易记录到数据库时出错: {e}")
                     break
@@ -666,79 +721,61 @@ class ExecutionSystem:
         return total_equity
     
     def _calculate_metrics(self):
-        """计算绩效指标"""
+        """计算绩效指标，回撤、夏普比率和交易统计取自增量维护的累加器"""
+        metrics = self.running_metrics
+        
         # 计算总收益率
-        if len(self.equity_curve) > 1:
-            total_return = (self.equity_curve[-1] - self.equity_curve[0]) / self.equity_curve[0]
-        else:
-            total_return = 0
+        total_return = metrics.total_return if metrics.equity_count > 1 else 0
         
         # 计算年化收益率（假设252个交易日）
-        if len(self.equity_curve) > 1:
-            days = len(self.equity_curve) - 1
-            annual_return = total_return * (252 / days) if days > 0 else 0
-        else:
-            annual_return = 0
-        
-        # 计算最大回撤
-        max_drawdown = 0
-        peak = self.equity_curve[0]
-        for equity in self.equity_curve:
-            if equity > peak:
-                peak = equity
-            drawdown = (peak - equity) / peak if peak > 0 else 0
-            max_drawdown = max(max_drawdown, drawdown)
-        
-        # 计算夏普比率
-        if len(self.equity_curve) > 1:
-            returns = [(self.equity_curve[i] - self.equity_curve[i-1]) / self.equity_curve[i-1] for i in range(1, len(self.equity_curve))]
-            avg_return = sum(returns) / len(returns) if returns else 0
-            std_return = (sum((r - avg_return) ** 2 for r in returns) / len(returns)) ** 0.5 if returns else 0
-            sharpe_ratio = (avg_return / std_return) * (252 ** 0.5) if std_return > 0 else 0
-        else:
-            sharpe_ratio = 0
-        
-        # 计算胜率和盈亏比
-        closed_trades = [t for t in self.trades if t['status'] == 'closed']
-        winning_trades = [t for t in closed_trades if t['pnl'] > 0]
-        losing_trades = [t for t in closed_trades if t['pnl'] <= 0]
-        
-        win_rate = len(winning_trades) / len(closed_trades) if closed_trades else 0
-        
-        avg_win = sum(t['pnl'] for t in winning_trades) / len(winning_trades) if winning_trades else 0
-        avg_loss = sum(t['pnl'] for t in losing_trades) / len(losing_trades) if losing_trades else 0
-        profit_loss_ratio = abs(avg_win / avg_loss) if avg_loss != 0 else 0
+        days = metrics.equity_count - 1
+        annual_return = total_return * (252 / days) if days > 0 else 0
         
+        # 胜率和盈亏比只统计已平仓的交易，盈亏为0的交易算作亏损
         return {
             'total_return': total_return,
             'annual_return': annual_return,
-            'max_drawdown': max_drawdown,
-            'sharpe_ratio': sharpe_ratio,
-            'win_rate': win_rate,
-            'profit_loss_ratio': profit_loss_ratio,
-            'total_trades': len(closed_trades)
+            'max_drawdown': metrics.max_drawdown,
+            'sharpe_ratio': metrics.sharpe(252),
+            'win_rate': metrics.win_rate(),
+            'profit_loss_ratio': metrics.profit_loss_ratio(flat_as_loss=True),
+            'total_trades': metrics.trade_count
+        }
+    
+    def get_series(self):
+        """当前回放的日期、权益和回撤序列，供/api/series接口和图表使用"""
+        equity = self.equity_curve[1:len(self.equity_dates) + 1]
+        return {
+            'dates': list(self.equity_dates[:len(equity)]),
+            'equity': list(equity),
+            'drawdown': drawdown_series(equity).tolist()
         }
     
-    def _generate_charts(self):
-        """生成图表"""
+    def pause(self):
+        """暂停回放"""
+        self.clock.pause()
+        return {'status': 'success', 'message': '回放已暂停', 'clock': self.clock.status()}
+    
+    def resume(self):
+        """恢复回放"""
+        self.clock.resume()
+        return {'status': 'success', 'message': '回放已恢复', 'clock': self.clock.status()}
+    
+    def step(self, days=1):
+        """暂停状态下推进指定数量的交易日"""
         try:
-            # 创建图表目录
-            static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-            if not os.path.exists(static_dir):
-                os.makedirs(static_dir)
-            
-            # 生成权益曲线图
-            plt.figure(figsize=(10, 6))
-            plt.plot(self.equity_curve)
-            plt.title('策略权益曲线')
-            plt.xlabel('交易日')
-            plt.ylabel('权益')
-            plt.grid(True)
-            plt.savefig(os.path.join(static_dir, 'execution_results.png'))
-            plt.close()
-            
-        except Exception as e:
-            print(f"生成图表时出错: {e}")
+            self.clock.step(days)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        return {'status': 'success', 'message': f'推进 {days} 个交易日', 'clock': self.clock.status()}
+    
+    def set_replay_mode(self, mode, speed=None):
+        """切换回放模式，运行中也可以切换"""
+        try:
+            self.clock.set_mode(mode, speed)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        return {'status': 'success', 'message': f'回放模式已切换为 {mode}', 'clock': self.clock.status()}
     
     def _calculate_performance_metrics(self):
         """计算绩效指标"""
@@ -763,6 +800,7 @@ class ExecutionSystem:
         
         return {
             'running': self.running,
+            'clock': self.clock.status(),
             'current_date': metrics['current_date'],
             'progress': metrics['progress'],
             'metrics': {
@@ -774,7 +812,7 @@ class ExecutionSystem:
                 'profit_loss_ratio': f"{metrics['profit_loss_ratio']:.2f}",
                 'total_trades': metrics['total_trades']
             },
-            'chart_url': '/static/execution_results.png',
+            'chart_url': '/api/charts/execution.png',
             'positions': len(self.positions),
             'equity': self.equity_curve[-1] if len(self.equity_curve) > 0 else self.initial_capital
         }
\ No newline at end of file
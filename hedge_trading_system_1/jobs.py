@@ -0,0 +1,189 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from events import EventBroker
+from config.config import JOB_CONFIG
+
+# 任务状态
+JOB_STATUSES = ('queued', 'running', 'completed', 'error', 'cancelled')
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+# 每个任务的事件流保留的事件数
+JOB_EVENT_HISTORY = 200
+
+
+class JobCancelled(Exception):
+    """任务被取消，由进度回调抛出以中断正在运行的回测"""
+
+
+class Job:
+    """一个后台任务的状态、进度和结果
+
+    进度和状态的每次变化都发布到任务自己的事件流，可以通过SSE订阅
+    """
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.progress = 0
+        self.message = '排队中'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.events = EventBroker(history=JOB_EVENT_HISTORY, state=self.summary())
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def summary(self):
+        """任务状态，不包含结果"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def update(self, status=None, progress=None, message=None, **fields):
+        """更新状态并发布事件"""
+        if status is not None:
+            self.status = status
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.events.publish('status', self.summary())
+
+    def progress_callback(self, progress, message, status=None):
+        """传给Backtest.progress_callback，任务被取消时抛出JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+        # 回测自己报告的completed由任务完成时统一发布
+        self.update(progress=progress, message=message)
+
+
+class JobManager:
+    """后台任务队列
+
+    任务提交后立即返回任务id，由固定数量的工作线程按提交顺序执行，
+    HTTP请求不再等待回测完成。排队和运行中的任务总数有上限，超过时拒绝提交。
+    正在运行的任务在下一次报告进度时检查取消标记并中断
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, keep_finished=None):
+        self.max_workers = max_workers or JOB_CONFIG['max_workers']
+        self.max_pending = max_pending or JOB_CONFIG['max_pending']
+        self.keep_finished = keep_finished or JOB_CONFIG['keep_finished']
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='backtest-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, target, params):
+        """提交任务
+
+        Args:
+            kind: 任务类型，例如'backtest'
+            target: target(params, job) -> 结果，在工作线程中执行，
+                    需要把job.progress_callback传给回测以支持进度和取消
+            params: 任务参数
+
+        Returns:
+            Job
+
+        Raises:
+            RuntimeError: 排队和运行中的任务已经达到上限
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise RuntimeError(f"排队和运行中的任务已达上限 {self.max_pending}，请稍后再提交")
+
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._evict()
+
+        self._executor.submit(self._run, job, target)
+        return job
+
+    def _run(self, job, target):
+        # 与cancel()互斥，取消和开始运行只会有一个生效
+        with self._lock:
+            if job.cancel_event.is_set():
+                return
+            job.status = 'running'
+
+        job.update(message='开始运行', started_at=time.time())
+        try:
+            result = target(job.params, job)
+            job.update(status='completed', progress=100, message='已完成', result=result, finished_at=time.time())
+        except JobCancelled:
+            job.update(status='cancelled', message='已取消', finished_at=time.time())
+        except Exception as e:
+            import traceback
+            print(f"任务 {job.id} 运行出错: {e}")
+            print(traceback.format_exc())
+            job.update(status='error', message='运行出错', error=str(e), finished_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        """所有任务的状态，最近提交的在前"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.summary() for job in reversed(jobs)]
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务不再运行，运行中的任务在下一次报告进度时中断
+
+        Returns:
+            Job: 任务不存在时返回None
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+
+        with self._lock:
+            job.cancel_event.set()
+            queued = job.status == 'queued'
+        if queued:
+            job.update(status='cancelled', message='已取消', finished_at=time.time())
+        else:
+            job.update(message='正在取消')
+        return job
+
+    def _evict(self):
+        """删除最早结束的任务，保留最近keep_finished个"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """获取进程内共享的任务队列"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
@@ -0,0 +1,307 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from collections import Counter
+import database as db
+from config.config import JOURNAL_CONFIG
+
+# 持久化模式
+# async: 写入请求放入队列，由后台线程批量提交，调用方不等待磁盘
+# sync: 在调用线程中立即写入并提交，与直接调用database模块相同
+DURABILITY_MODES = ('async', 'sync')
+
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+# 记录类型的名称，用于错误信息
+RECORD_NAMES = {'trade': '交易记录', 'trade_update': '平仓记录', 'performance': '绩效数据'}
+
+
+class JournalWriteError(Exception):
+    """有交易记录或绩效数据没有写入数据库"""
+
+
+class WriteBehindJournal:
+    """交易记录和每日绩效的异步批量写入器
+
+    调用方把交易记录和绩效数据放入有界队列后立即返回，后台线程在积累到batch_size条
+    或距离上次提交超过flush_interval秒时，把队列中的数据放在一个事务里写入数据库。
+    队列满时record_*会阻塞，直到后台线程追上，避免内存无限增长。
+    需要立即读到写入结果时调用flush()，进程退出时会自动调用close()
+
+    平仓记录与开仓记录进入同一个队列，按提交顺序写入，开仓记录总是先于对应的平仓更新。
+
+    数据库被锁时整批重试，其他错误时改为逐条写入，只丢弃出错的记录。
+    丢弃的记录数按run_id统计，flush(run_id=...)只反映这次运行，调用方用dropped(run_id)取出并清除计数
+    """
+
+    def __init__(self, durability=None, max_queue=None, batch_size=None, flush_interval=None,
+                 retries=None, retry_delay=None):
+        """
+        Args:
+            durability: 持久化模式，见DURABILITY_MODES，默认使用JOURNAL_CONFIG
+            max_queue: 队列最多缓存的记录数
+            batch_size: 每个事务最多写入的记录数
+            flush_interval: 两次提交之间的最长间隔（秒）
+            retries: 数据库被锁等OperationalError时整批重试的次数
+            retry_delay: 第一次重试前等待的秒数，之后每次加倍
+        """
+        self.durability = durability or JOURNAL_CONFIG['durability']
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"不支持的持久化模式: {self.durability}，可选 {DURABILITY_MODES}")
+
+        self.batch_size = batch_size or JOURNAL_CONFIG['batch_size']
+        self.flush_interval = flush_interval or JOURNAL_CONFIG['flush_interval']
+        self.retries = retries if retries is not None else JOURNAL_CONFIG['retries']
+        self.retry_delay = retry_delay if retry_delay is not None else JOURNAL_CONFIG['retry_delay']
+        self._queue = queue.Queue(maxsize=max_queue or JOURNAL_CONFIG['max_queue'])
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        # 写入统计
+        self.written_trades = 0
+        self.written_updates = 0
+        self.written_performance = 0
+        self.failed_records = 0
+        self._failed_runs = Counter()   # run_id -> 丢弃的记录数
+        self._reported_failures = 0     # 上一次flush()时的failed_records
+
+    def record_trade(self, trade_data, run_id=''):
+        """写入一条交易记录
+
+        成本字段在调用线程中补全并写回trade_data，与database.save_trade的行为一致
+
+        Args:
+            run_id: 交易记录所属的回测或执行
+        """
+        row = db.prepare_trade_row(trade_data, run_id)
+        self._submit('trade', row)
+
+    def record_trade_update(self, trade_data, run_id=''):
+        """写入平仓后的交易记录，由后台线程在之前提交的开仓记录之后更新，见database.write_trade_update
+
+        Args:
+            run_id: 交易记录所属的回测或执行
+        """
+        self._submit('trade_update', (run_id or '', dict(trade_data)))
+
+    def record_performance(self, data):
+        """写入一天的绩效数据，字段与database.save_performance_data相同，run_id为所属的回测或执行"""
+        self._submit('performance', dict(data))
+
+    def _submit(self, kind, payload):
+        if self.durability == 'sync' or self._closed:
+            # 同步写入时直接把错误交给调用方
+            error = self._write_batch([(kind, payload)])
+            if error is not None:
+                raise JournalWriteError(f"写入{RECORD_NAMES[kind]}失败: {error}") from error
+            return
+
+        self._ensure_started()
+        self._queue.put((kind, payload))
+
+    def flush(self, timeout=None, run_id=None):
+        """等待队列中已有的记录全部提交
+
+        Args:
+            run_id: 只检查这次运行是否有记录被丢弃，其他运行的失败不影响返回值；
+                    为None时检查自上一次不指定run_id的flush()以来所有运行
+
+        Returns:
+            bool: 是否在超时前完成，并且没有丢弃记录
+        """
+        completed = True
+        if self._thread is not None and self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put((_FLUSH, done))
+            completed = done.wait(timeout)
+
+        with self._lock:
+            if run_id is not None:
+                dropped = self._failed_runs.get(run_id, 0)
+            else:
+                dropped = self.failed_records - self._reported_failures
+                self._reported_failures = self.failed_records
+        if dropped:
+            print(f"警告: {f'运行 {run_id} ' if run_id is not None else ''}有 {dropped} 条交易记录和绩效数据没有写入数据库")
+        return completed and not dropped
+
+    def dropped(self, run_id):
+        """取出这次运行没有写入数据库的记录数并清除计数，需要先调用flush()等待队列中的记录提交"""
+        with self._lock:
+            return self._failed_runs.pop(run_id, 0)
+
+    def close(self, timeout=None):
+        """提交剩余记录并停止后台线程，之后的写入在调用线程中同步完成"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None and thread.is_alive():
+            self._queue.put((_STOP, None))
+            thread.join(timeout)
+
+    def pending(self):
+        """队列中尚未提交的记录数（近似值）"""
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writer_loop, name='write-behind-journal', daemon=True)
+                self._thread.start()
+
+    def _writer_loop(self):
+        batch = []
+        waiters = []
+        deadline = None
+        stopping = False
+
+        while not stopping:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = None, None
+
+            if kind == _FLUSH:
+                waiters.append(payload)
+            elif kind == _STOP:
+                stopping = True
+            elif kind is not None:
+                batch.append((kind, payload))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            # 攒够一批、到达提交间隔、或有flush/close请求时提交
+            due = deadline is not None and time.monotonic() >= deadline
+            if batch and (len(batch) >= self.batch_size or due or waiters or stopping):
+                self._write_batch(batch)
+                batch = []
+                deadline = None
+
+            for done in waiters:
+                done.set()
+            waiters = []
+
+    def _write_batch(self, batch):
+        """写入一批记录
+
+        先在一个事务中整批写入。数据库被锁等OperationalError时等待后整批重试，
+        重试用尽后整批丢弃；其他错误（例如某一行数据有问题）时改为逐条写入，只丢弃出错的记录
+
+        Returns:
+            Exception: 最后一个导致记录被丢弃的错误，全部写入时为None
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                self._commit(batch)
+                return None
+            except sqlite3.OperationalError as e:
+                if attempt == self.retries:
+                    self._record_failures(batch, e)
+                    return e
+                delay = self.retry_delay * 2 ** attempt
+                print(f"写入交易记录和绩效数据时数据库不可用，{delay:.1f} 秒后重试: {e}")
+                time.sleep(delay)
+            except Exception as e:
+                if len(batch) == 1:
+                    self._record_failures(batch, e)
+                    return e
+                print(f"批量写入交易记录和绩效数据时出错，改为逐条写入: {e}")
+                break
+
+        error = None
+        for record in batch:
+            try:
+                self._commit([record])
+            except Exception as e:
+                self._record_failures([record], e)
+                error = e
+        return error
+
+    def _commit(self, batch):
+        """在一个事务中写入一批记录，失败时回滚并抛出异常"""
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        try:
+            if any(kind == 'performance' for kind, _ in batch):
+                cursor.execute(db.PERFORMANCE_TABLE_SQL)
+
+            written = Counter()
+            for kind, payload in batch:
+                if kind == 'trade':
+                    cursor.execute(db.TRADE_INSERT_SQL, payload)
+                elif kind == 'trade_update':
+                    db.write_trade_update(cursor, payload[1], payload[0])
+                else:
+                    db.write_performance_row(cursor, payload)
+                written[kind] += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.written_trades += written['trade']
+            self.written_updates += written['trade_update']
+            self.written_performance += written['performance']
+
+    def _record_failures(self, batch, error):
+        """记录丢弃的记录数，按run_id分别统计"""
+        with self._lock:
+            self.failed_records += len(batch)
+            for kind, payload in batch:
+                # 交易记录的第一列是run_id（见database.TRADE_INSERT_SQL），平仓记录为(run_id, 交易记录)
+                run_id = payload.get('run_id', '') if kind == 'performance' else payload[0]
+                self._failed_runs[run_id] += 1
+        print(f"写入交易记录和绩效数据时出错，丢弃 {len(batch)} 条记录: {error}")
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """获取进程内共享的写入器"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = WriteBehindJournal()
+    return _journal
+
+
+def flush_journal(timeout=None):
+    """提交共享写入器中已有的记录，返回值见WriteBehindJournal.flush"""
+    if _journal is not None:
+        return _journal.flush(timeout)
+    return True
+
+
+def close_journal():
+    """关闭共享写入器，进程退出时自动调用"""
+    if _journal is not None:
+        _journal.close()
+
+
+def _reset_after_fork():
+    """子进程没有父进程的写入线程，重新创建写入器"""
+    global _journal, _journal_lock
+    _journal = None
+    _journal_lock = threading.Lock()
+
+
+atexit.register(close_journal)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,97 @@
+import math
+
+
+class RunningMetrics:
+    """逐日更新的绩效指标累加器
+
+    每个交易日加入一次权益、每笔交易加入一次盈亏，都是O(1)更新：
+    - 权益峰值和最大回撤
+    - 日收益率的均值和方差（Welford方法）
+    - 盈利、亏损、持平交易的笔数和盈亏合计
+    回测引擎和执行系统随时可以取出当前指标，不需要重新遍历权益曲线和交易列表
+    """
+
+    def __init__(self, initial_equity):
+        self.initial_equity = initial_equity
+        self.last_equity = initial_equity
+        self.peak = initial_equity
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.equity_count = 1  # 包含初始权益
+
+        # 日收益率
+        self.return_count = 0
+        self.return_mean = 0.0
+        self.return_m2 = 0.0  # 离差平方和
+        self.last_return = None
+
+        # 交易盈亏
+        self.trade_count = 0
+        self.win_count = 0
+        self.win_sum = 0.0
+        self.loss_count = 0
+        self.loss_sum = 0.0
+        self.flat_count = 0
+
+    def update_equity(self, equity):
+        """加入一个交易日的权益
+
+        Returns:
+            tuple: (当日收益率, 当日回撤)
+        """
+        daily_return = equity / self.last_equity - 1
+        self.return_count += 1
+        delta = daily_return - self.return_mean
+        self.return_mean += delta / self.return_count
+        self.return_m2 += delta * (daily_return - self.return_mean)
+        self.last_return = daily_return
+
+        self.peak = max(self.peak, equity)
+        self.drawdown = (self.peak - equity) / self.peak if self.peak > 0 else 0
+        self.max_drawdown = max(self.max_drawdown, self.drawdown)
+
+        self.last_equity = equity
+        self.equity_count += 1
+        return daily_return, self.drawdown
+
+    def record_trade(self, pnl):
+        """加入一笔交易的盈亏"""
+        self.trade_count += 1
+        if pnl > 0:
+            self.win_count += 1
+            self.win_sum += pnl
+        elif pnl < 0:
+            self.loss_count += 1
+            self.loss_sum += pnl
+        else:
+            self.flat_count += 1
+
+    @property
+    def total_return(self):
+        return self.last_equity / self.initial_equity - 1
+
+    @property
+    def return_std(self):
+        """日收益率的总体标准差（ddof=0）"""
+        if self.return_count == 0:
+            return 0.0
+        return math.sqrt(max(self.return_m2, 0.0) / self.return_count)
+
+    def sharpe(self, periods=1):
+        """日收益率均值与标准差之比，periods为年化的期数（例如252）"""
+        std = self.return_std
+        if std <= 0:
+            return 0
+        return self.return_mean / std * math.sqrt(periods)
+
+    def win_rate(self, include_flat=True):
+        """胜率，include_flat为False时分母只包含盈利和亏损的交易"""
+        total = self.trade_count if include_flat else self.win_count + self.loss_count
+        return self.win_count / total if total > 0 else 0
+
+    def profit_loss_ratio(self, flat_as_loss=False):
+        """平均盈利与平均亏损之比，flat_as_loss为True时持平的交易计入亏损笔数"""
+        avg_win = self.win_sum / self.win_count if self.win_count else 0
+        losses = self.loss_count + (self.flat_count if flat_as_loss else 0)
+        avg_loss = self.loss_sum / losses if losses else 0
+        return abs(avg_win / avg_loss) if avg_loss != 0 else 0
@@ -0,0 +1,246 @@
+import math
+import time
+import numpy as np
+from datetime import datetime, timedelta
+import database as db
+from shared_panel import shared_panel_executor, get_worker_panel
+from config.config import SCANNER_CONFIG
+
+# Engle-Granger协整检验（两个变量、含常数项）的MacKinnon(2010)临界值系数
+# 临界值 = b0 + b1/T + b2/T^2 + b3/T^3
+EG_CRITICAL_COEFFICIENTS = {
+    '1%': (-3.89644, -10.9519, -33.527, 0.0),
+    '5%': (-3.33613, -6.1101, -6.823, 0.0),
+    '10%': (-3.04445, -4.2412, -2.720, 0.0),
+}
+
+
+def eg_critical_value(nobs, significance='5%'):
+    """Engle-Granger协整检验在给定样本量下的临界值"""
+    if significance not in EG_CRITICAL_COEFFICIENTS:
+        raise ValueError(f"不支持的显著性水平: {significance}，可选 {list(EG_CRITICAL_COEFFICIENTS)}")
+    b0, b1, b2, b3 = EG_CRITICAL_COEFFICIENTS[significance]
+    return b0 + b1 / nobs + b2 / nobs ** 2 + b3 / nobs ** 3
+
+
+def _ols(y, x):
+    """最小二乘回归，返回系数和系数的标准误"""
+    coef, _, rank, _ = np.linalg.lstsq(x, y, rcond=None)
+    dof = len(y) - x.shape[1]
+    if rank < x.shape[1] or dof <= 0:
+        return coef, None
+
+    resid = y - x @ coef
+    sigma2 = resid @ resid / dof
+    cov = sigma2 * np.linalg.inv(x.T @ x)
+    return coef, np.sqrt(np.diag(cov))
+
+
+def engle_granger(log_price1, log_price2, adf_lags=1):
+    """对两只股票的对数价格做Engle-Granger两步法协整检验并估计半衰期
+
+    1. 回归 log_price1 = a + b * log_price2，得到对冲比率b和残差
+    2. 对残差做不含常数项的ADF检验，t统计量越小越平稳
+    3. 残差的一阶差分对滞后残差回归，得到均值回归速度和半衰期
+
+    Returns:
+        dict: hedge_ratio、adf_stat、half_life、observations，数据不足时返回None
+    """
+    valid = ~(np.isnan(log_price1) | np.isnan(log_price2))
+    y = log_price1[valid]
+    x = log_price2[valid]
+    if len(y) < adf_lags + 10:
+        return None
+
+    coef, _ = _ols(y, np.column_stack([np.ones(len(x)), x]))
+    resid = y - coef[0] - coef[1] * x
+
+    # ADF回归: Δe_t = γ e_{t-1} + Σ φ_i Δe_{t-i}
+    diff = np.diff(resid)
+    target = diff[adf_lags:]
+    regressors = [resid[adf_lags:-1]]
+    for i in range(1, adf_lags + 1):
+        regressors.append(diff[adf_lags - i:-i])
+    adf_coef, adf_se = _ols(target, np.column_stack(regressors))
+    if adf_se is None or adf_se[0] == 0:
+        return None
+    adf_stat = adf_coef[0] / adf_se[0]
+
+    # 半衰期: Δe_t = c + λ e_{t-1}
+    speed_coef, _ = _ols(diff, np.column_stack([np.ones(len(diff)), resid[:-1]]))
+    speed = speed_coef[1]
+    half_life = -math.log(2) / speed if speed < 0 else float('inf')
+
+    return {
+        'hedge_ratio': float(coef[1]),
+        'adf_stat': float(adf_stat),
+        'half_life': float(half_life),
+        'observations': int(len(target))
+    }
+
+
+def load_log_price_panel(start_date, end_date, min_observations):
+    """加载所有股票的对数收盘价面板，去掉有效数据不足的股票
+
+    Returns:
+        tuple: (日期数组, 股票代码列表, 日期×股票 的对数价格矩阵)
+    """
+    df = db.get_close_prices(start_date, end_date)
+    if df.empty:
+        return np.array([]), [], np.empty((0, 0))
+
+    prices = df.pivot_table(index='date', columns='code', values='close', aggfunc='last').sort_index()
+    prices = prices.where(prices > 0)
+    prices = prices.loc[:, prices.notna().sum() >= min_observations]
+
+    return prices.index.to_numpy(), list(prices.columns), np.log(prices.to_numpy(dtype=np.float64))
+
+
+def correlation_candidates(log_prices, min_correlation, max_pairs_per_symbol=None, block_size=1000):
+    """用日收益率相关系数预筛选候选股票对
+
+    收益率按股票标准化后缺失值填0，相关系数矩阵分块计算，避免一次生成全部 N×N 矩阵
+
+    Returns:
+        tuple: (stock1列下标数组, stock2列下标数组, 相关系数数组)，每对只出现一次
+    """
+    returns = np.diff(log_prices, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standardized = (returns - np.nanmean(returns, axis=0)) / np.nanstd(returns, axis=0)
+    standardized = np.nan_to_num(standardized, nan=0.0, posinf=0.0, neginf=0.0)
+    nobs = max(len(standardized), 1)
+
+    symbols = standardized.shape[1]
+    index1, index2, correlations = [], [], []
+    for start in range(0, symbols, block_size):
+        end = min(start + block_size, symbols)
+        block = standardized[:, start:end].T @ standardized / nobs
+
+        # 只保留上三角，每对只统计一次
+        rows = np.arange(start, end)[:, None]
+        block[np.arange(symbols)[None, :] <= rows] = -np.inf
+        block[block < min_correlation] = -np.inf
+
+        # 每只股票只保留相关性最高的若干个候选
+        if max_pairs_per_symbol and max_pairs_per_symbol < symbols:
+            top = np.argpartition(-block, max_pairs_per_symbol - 1, axis=1)[:, :max_pairs_per_symbol]
+            keep = np.zeros(block.shape, dtype=bool)
+            np.put_along_axis(keep, top, True, axis=1)
+            block[~keep] = -np.inf
+
+        block_rows, block_cols = np.nonzero(np.isfinite(block))
+        index1.append(block_rows + start)
+        index2.append(block_cols)
+        correlations.append(block[block_rows, block_cols])
+
+    if not index1:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+
+    return np.concatenate(index1), np.concatenate(index2), np.concatenate(correlations)
+
+
+def _scan_chunk(candidates, adf_lags):
+    """在工作进程中对一批候选股票对做协整检验"""
+    _, _, log_prices = get_worker_panel()
+
+    results = []
+    for i, j, correlation in candidates:
+        result = engle_granger(log_prices[:, i], log_prices[:, j], adf_lags)
+        if result is not None:
+            result.update({'index1': i, 'index2': j, 'correlation': correlation})
+            results.append(result)
+    return results
+
+
+def run_pair_scan(start_date=None, end_date=None, config=None, max_workers=None, save=True):
+    """扫描stock_data中的所有股票，找出协整的股票对
+
+    先用收益率相关系数剪枝，再把候选股票对分批交给进程池做Engle-Granger检验和半衰期估计。
+    通过检验且半衰期在范围内的股票对按ADF统计量排序，写入pair_universe表
+
+    Args:
+        start_date: 扫描区间开始日期，默认为三年前
+        end_date: 扫描区间结束日期，默认为今天
+        config: 扫描配置，默认使用SCANNER_CONFIG
+        max_workers: 最大进程数，默认为CPU核数
+        save: 是否把结果写入数据库
+
+    Returns:
+        dict: 扫描信息和排好序的股票对列表
+    """
+    config = {**SCANNER_CONFIG, **(config or {})}
+    end_date = end_date or datetime.now().strftime('%Y%m%d')
+    start_date = start_date or (datetime.now() - timedelta(days=365 * 3)).strftime('%Y%m%d')
+
+    start_time = time.time()
+    dates, codes, log_prices = load_log_price_panel(start_date, end_date, config['min_observations'])
+    if len(codes) < 2:
+        return {'status': 'error', 'message': '有效数据的股票不足两只', 'pairs': []}
+
+    index1, index2, correlations = correlation_candidates(
+        log_prices, config['min_correlation'], config['max_pairs_per_symbol'])
+    print(f"共 {len(codes)} 只股票，{len(codes) * (len(codes) - 1) // 2} 个股票对，"
+          f"相关性筛选后剩余 {len(index1)} 个候选")
+
+    candidates = list(zip(index1.tolist(), index2.tolist(), correlations.tolist()))
+    chunk_size = config['chunk_size']
+    chunks = [candidates[k:k + chunk_size] for k in range(0, len(candidates), chunk_size)]
+
+    tested = []
+    if chunks:
+        symbol_index = {code: j for j, code in enumerate(codes)}
+        with shared_panel_executor(dates, symbol_index, log_prices, max_workers) as executor:
+            futures = [executor.submit(_scan_chunk, chunk, config['adf_lags']) for chunk in chunks]
+            for future in futures:
+                tested.extend(future.result())
+
+    # 通过协整检验且半衰期合理的股票对，ADF统计量越小排名越靠前
+    pairs = []
+    for result in tested:
+        critical_value = eg_critical_value(result['observations'], config['significance'])
+        if result['adf_stat'] >= critical_value:
+            continue
+        # 策略按价格比率交易，只保留同向变动的股票对
+        if result['hedge_ratio'] <= 0:
+            continue
+        if not config['min_half_life'] <= result['half_life'] <= config['max_half_life']:
+            continue
+        pairs.append({
+            'stock1_code': codes[result['index1']],
+            'stock2_code': codes[result['index2']],
+            'correlation': result['correlation'],
+            'hedge_ratio': result['hedge_ratio'],
+            'adf_stat': result['adf_stat'],
+            'critical_value': critical_value,
+            'half_life': result['half_life'],
+            'observations': result['observations']
+        })
+
+    pairs.sort(key=lambda pair: pair['adf_stat'])
+    for rank, pair in enumerate(pairs, start=1):
+        pair['rank'] = rank
+
+    scan_info = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    if save:
+        db.save_pair_universe(pairs, scan_info)
+
+    elapsed = time.time() - start_time
+    print(f"股票对扫描完成，{len(tested)} 个候选中 {len(pairs)} 个通过协整检验，耗时 {elapsed:.2f} 秒")
+
+    return {
+        'status': 'success',
+        **scan_info,
+        'symbols': len(codes),
+        'candidates': len(candidates),
+        'tested': len(tested),
+        'elapsed': elapsed,
+        'pairs': pairs
+    }
+
+
+if __name__ == '__main__':
+    run_pair_scan()
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import database as db
+from price_store import get_price_store
+from config.config import PANEL_CACHE_CONFIG
+
+
+def _freeze(array):
+    """返回不可写的数组视图，缓存的数据被所有调用方共享，不允许原地修改"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def panel_nbytes(panel):
+    """价格面板占用的内存字节数"""
+    return panel['dates'].nbytes + sum(values.nbytes for values in panel['fields'].values())
+
+
+class PanelCache:
+    """进程内共享的价格面板缓存
+
+    按(股票代码, 日期区间, 字段, 代码写法, stock_data版本号)缓存get_price_panel的结果。
+    回测、执行系统和接口请求读取同样的区间时直接复用已经加载的数组，不再读取磁盘；
+    版本号由本进程的写入版本号和data_revisions中的持久化修订号组成，本进程或其他进程
+    （导入脚本、price_store命令行等）写入stock_data后版本号改变，旧版本的面板在下一次读取时全部丢弃。
+
+    缓存的数组是只读的，调用方需要修改时应当先复制。symbol_index和resolved每次返回新的字典。
+    总内存超过max_bytes或条目数超过max_entries时按最近最少使用的顺序淘汰
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None, loader=None):
+        """
+        Args:
+            max_bytes: 缓存的数组总字节数上限
+            max_entries: 缓存的面板数量上限
+            loader: 缓存未命中时加载面板的函数，参数与database.get_price_panel相同，
+                    默认读取列式价格缓存
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else PANEL_CACHE_CONFIG['max_bytes']
+        self.max_entries = max_entries if max_entries is not None else PANEL_CACHE_CONFIG['max_entries']
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 键 -> (面板, 字节数)
+        self._loading = {}             # 正在加载的键 -> 锁，同一个面板只加载一次
+        self._version = self.data_version()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(codes, start_date, end_date, fields, aliases):
+        codes = tuple(dict.fromkeys(codes))
+        aliases = tuple(tuple((aliases or {}).get(code) or ()) for code in codes)
+        return (codes, str(start_date), str(end_date), tuple(fields), aliases)
+
+    @staticmethod
+    def data_version():
+        """stock_data的当前版本：(本进程的写入版本号, 持久化修订号)
+
+        修订号只读取一行，每次读取缓存时检查；完整的get_stock_data_fingerprint需要扫描整个表
+        """
+        return (db.get_stock_data_version(), db.get_stock_data_revision())
+
+    def _check_version(self):
+        """stock_data有新的写入时清空缓存，需要在持有self._lock时调用"""
+        version = self.data_version()
+        if version != self._version:
+            self._entries.clear()
+            self.bytes = 0
+            self._version = version
+        return version
+
+    def get_price_panel(self, codes, start_date, end_date, fields=('close',), aliases=None):
+        """读取 日期×股票 的价格矩阵，参数和返回值与database.get_price_panel相同
+
+        命中缓存时不访问磁盘，返回的数组是只读的
+        """
+        key = self.make_key(codes, start_date, end_date, fields, aliases)
+
+        with self._lock:
+            version = self._check_version()
+            panel = self._lookup(key)
+            if panel is not None:
+                return panel
+            loading = self._loading.setdefault((key, version), threading.Lock())
+
+        # 同一个面板的并发请求排队，第一个请求加载完成后其余请求直接命中
+        with loading:
+            with self._lock:
+                self._check_version()
+                panel = self._lookup(key)
+            if panel is not None:
+                return panel
+
+            loader = self._loader or get_price_store().get_price_panel
+            try:
+                panel = loader(list(key[0]), start_date, end_date, fields=fields, aliases=aliases)
+            finally:
+                with self._lock:
+                    self._loading.pop((key, version), None)
+            panel = {
+                'dates': _freeze(np.asarray(panel['dates'])),
+                'symbol_index': dict(panel['symbol_index']),
+                'fields': {field: _freeze(values) for field, values in panel['fields'].items()},
+                'resolved': dict(panel['resolved'])
+            }
+
+            with self._lock:
+                self.misses += 1
+                # 加载期间stock_data发生了变化时不缓存，下一次读取重新加载
+                if version == self._check_version():
+                    self._store(key, panel)
+
+        return self._copy(panel)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._copy(entry[0])
+
+    def _store(self, key, panel):
+        size = panel_nbytes(panel)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (panel, size)
+        self.bytes += size
+        while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    @staticmethod
+    def _copy(panel):
+        # 数组共享，字典复制：调用方修改字典不影响缓存
+        return {
+            'dates': panel['dates'],
+            'symbol_index': dict(panel['symbol_index']),
+            'fields': dict(panel['fields']),
+            'resolved': dict(panel['resolved'])
+        }
+
+    def invalidate(self):
+        """清空缓存，用于不经过database模块直接修改了stock_data的情况"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'version': self._version
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_panel_cache():
+    """获取进程内共享的价格面板缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PanelCache()
+    return _cache
+
+
+def get_price_panel(codes, start_date, end_date, fields=('close',), aliases=None):
+    """通过进程内共享的缓存读取价格面板，见PanelCache.get_price_panel"""
+    return get_panel_cache().get_price_panel(codes, start_date, end_date, fields=fields, aliases=aliases)
@@ -0,0 +1,419 @@
+import os
+import json
+import tempfile
+import shutil
+import threading
+import itertools
+import numpy as np
+import database as db
+
+# 列式价格缓存目录
+PRICE_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'price_store')
+
+# 缓存格式版本，格式变化时旧缓存视为过期（2：标识包含stock_data的修订号）
+STORE_VERSION = 2
+
+# 日期统一为YYYYMMDD，按8字节定长保存
+DATE_DTYPE = 'S8'
+
+
+class ColumnarPriceStore:
+    """stock_data的列式磁盘缓存
+
+    目录结构：
+        dates.s8                所有股票共享的日期索引（升序）
+        <股票代码>/<字段>.f8     与日期索引对齐的float64数组，缺失为NaN
+        <股票代码>/present.u1    该日期在stock_data中是否有记录
+        meta.json               各股票的数组长度、日期数量和对应的stock_data标识（含修订号）
+
+    股票的数组只覆盖到它最后一个有数据的日期，之后的日期按缺失处理，因此追加新交易日时
+    只需要写入有更新的股票。读取时用numpy.memmap打开，多个进程共享操作系统的页缓存。
+    stock_data被其他途径修改后（包括原地覆盖已有的行，由data_revisions的修订号反映）缓存视为过期，读取自动回退到SQLite，调用build()重建
+    """
+
+    def __init__(self, root=PRICE_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def load_meta(self):
+        """读取缓存元数据，缓存不存在或版本不符时返回None"""
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != STORE_VERSION:
+            return None
+        return meta
+
+    def _write_meta(self, meta, root=None):
+        path = os.path.join(root or self.root, 'meta.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def is_fresh(self, meta=None):
+        """缓存是否与stock_data表一致
+
+        比较database.get_stock_data_fingerprint()：行数、最大日期和最大id反映新增和删除的行，
+        修订号反映覆盖已有(code, date)的写入
+        """
+        meta = meta or self.load_meta()
+        if meta is None:
+            return False
+        return tuple(meta['signature']) == db.get_stock_data_fingerprint()
+
+    def _open(self, root, code, name, dtype, length):
+        if length <= 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(root, code, name), dtype=dtype, mode='r', shape=(length,))
+
+    def _open_dates(self, meta):
+        return self._open(self.root, '', 'dates.s8', DATE_DTYPE, meta['dates'])
+
+    def build(self):
+        """从stock_data全量重建缓存
+
+        先写入临时目录再整体替换，重建过程中的读取仍使用旧缓存或回退到SQLite
+        """
+        with self._lock:
+            # 先取标识：重建期间如果有新的写入，缓存会被判定为过期
+            signature = db.get_stock_data_fingerprint()
+
+            conn = db.get_connection()
+            dates = [row[0] for row in conn.execute("SELECT DISTINCT date FROM stock_data ORDER BY date")]
+            invalid = [date for date in dates if len(str(date)) != 8]
+            if invalid:
+                conn.close()
+                raise ValueError(f"stock_data中存在不是YYYYMMDD格式的日期，例如 {invalid[:3]}")
+
+            tmp_root = self.root + '.tmp'
+            shutil.rmtree(tmp_root, ignore_errors=True)
+            os.makedirs(tmp_root)
+
+            all_dates = np.array(dates, dtype=DATE_DTYPE)
+            all_dates.tofile(os.path.join(tmp_root, 'dates.s8'))
+
+            symbols = {}
+            cursor = conn.execute(
+                f"SELECT code, date, {', '.join(db.PRICE_FIELDS)} FROM stock_data ORDER BY code, date")
+            for code, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+                rows = list(rows)
+                positions = np.searchsorted(all_dates, np.array([row[1] for row in rows], dtype=DATE_DTYPE))
+                values = np.array([row[2:] for row in rows], dtype=np.float64).reshape(len(rows), len(db.PRICE_FIELDS))
+                symbols[code] = self._write_symbol(tmp_root, code, positions, values)
+            conn.close()
+
+            self._write_meta({
+                'version': STORE_VERSION,
+                'dates': len(all_dates),
+                'symbols': symbols,
+                'signature': list(signature)
+            }, root=tmp_root)
+
+            # 整体替换旧缓存，已经打开的memmap仍指向旧文件，不受影响
+            old_root = self.root + '.old'
+            shutil.rmtree(old_root, ignore_errors=True)
+            if os.path.exists(self.root):
+                os.rename(self.root, old_root)
+            os.rename(tmp_root, self.root)
+            shutil.rmtree(old_root, ignore_errors=True)
+
+        print(f"列式价格缓存重建完成: {len(all_dates)} 个日期 × {len(symbols)} 只股票")
+
+    def _write_symbol(self, root, code, positions, values):
+        """写入一只股票的全部字段，返回数组长度"""
+        length = int(positions[-1]) + 1
+        os.makedirs(os.path.join(root, code), exist_ok=True)
+
+        present = np.zeros(length, dtype=np.uint8)
+        present[positions] = 1
+        present.tofile(os.path.join(root, code, 'present.u1'))
+
+        for k, field in enumerate(db.PRICE_FIELDS):
+            column = np.full(length, np.nan)
+            column[positions] = values[:, k]
+            column.tofile(os.path.join(root, code, f'{field}.f8'))
+
+        return length
+
+    def refresh(self):
+        """缓存不存在或已过期时重建"""
+        if not self.is_fresh():
+            self.build()
+
+    def save_stock_data(self, data, code=None):
+        """把股票数据写入SQLite，并追加到缓存
+
+        写入事务内记录写入前后的stock_data标识。只有缓存的标识正好是写入前的标识，
+        即缓存加上这一次写入就与SQLite一致时才追加；写入前缓存已经过期，
+        或者其他写入方的提交夹在中间时只写SQLite，缓存保持过期，等下一次build()再更新
+
+        Args:
+            data: 与database.save_stock_data_bulk相同
+            code: 数据中没有code列时使用的股票代码
+        """
+        result = db.save_stock_data_bulk(data, code=code, fingerprints=True)
+        if result['rows']:
+            self.append(db.stock_data_rows(data, code), result['previous_fingerprint'], result['fingerprint'])
+        return result
+
+    def append(self, rows, previous_signature, signature):
+        """把已经写入SQLite的行追加到缓存
+
+        晚于共享日期索引末尾的新日期直接追加；已有日期的值原地覆盖；
+        需要在日期索引中间插入新日期时改为全量重建
+
+        Args:
+            rows: (code, date, open, high, low, close, volume) 元组列表，见database.stock_data_rows
+            previous_signature: 写入这些行之前的database.get_stock_data_fingerprint()，
+                                缓存不存在或标识与它不同时不追加，缓存保持过期
+            signature: 写入这些行之后的标识，追加完成后记录到meta.json
+        """
+        if not rows:
+            return
+
+        with self._lock:
+            meta = self.load_meta()
+            if meta is None or tuple(meta['signature']) != tuple(previous_signature):
+                return
+
+            all_dates = np.array(self._open_dates(meta))
+            new_dates = np.unique(np.array([row[1] for row in rows], dtype=DATE_DTYPE))
+            missing = new_dates[~np.isin(new_dates, all_dates)]
+            rebuild = len(all_dates) > 0 and len(missing) > 0 and missing[0] < all_dates[-1]
+
+            if not rebuild:
+                self._append_rows(meta, all_dates, missing, rows, signature)
+
+        if rebuild:
+            self.build()
+
+    def _append_rows(self, meta, all_dates, missing, rows, signature):
+        # 先追加数据文件，最后替换meta.json，读取方只会看到完整写入的数据
+        if len(missing):
+            with open(self._path('dates.s8'), 'ab') as f:
+                missing.tofile(f)
+            all_dates = np.concatenate([all_dates, missing])
+
+        rows = sorted(rows, key=lambda row: row[0])
+        for code, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            positions = np.searchsorted(all_dates, np.array([row[1] for row in group], dtype=DATE_DTYPE))
+            values = np.array([row[2:] for row in group], dtype=np.float64).reshape(len(group), len(db.PRICE_FIELDS))
+
+            old_length = meta['symbols'].get(code, 0)
+            length = max(old_length, int(positions.max()) + 1)
+            os.makedirs(self._path(code), exist_ok=True)
+
+            # 先用缺失值把文件补到新长度，再原地写入
+            names = [('present.u1', np.uint8, 0)] + [(f'{field}.f8', np.float64, np.nan) for field in db.PRICE_FIELDS]
+            for name, dtype, fill in names:
+                path = self._path(code, name)
+                with open(path, 'ab') as f:
+                    f.truncate(old_length * np.dtype(dtype).itemsize)
+                    np.full(length - old_length, fill, dtype=dtype).tofile(f)
+
+            present = np.memmap(self._path(code, 'present.u1'), dtype=np.uint8, mode='r+', shape=(length,))
+            present[positions] = 1
+            present.flush()
+            for k, field in enumerate(db.PRICE_FIELDS):
+                column = np.memmap(self._path(code, f'{field}.f8'), dtype=np.float64, mode='r+', shape=(length,))
+                column[positions] = values[:, k]
+                column.flush()
+
+            meta['symbols'][code] = length
+
+        meta['dates'] = len(all_dates)
+        meta['signature'] = list(signature)
+        self._write_meta(meta)
+
+    def get_price_panel(self, codes, start_date, end_date, fields=('close',), aliases=None):
+        """从缓存读取 日期×股票 的价格矩阵，参数和返回值与database.get_price_panel相同
+
+        缓存不存在或已过期时回退到SQLite
+        """
+        meta = self.load_meta()
+        if meta is None or not self.is_fresh(meta):
+            return db.get_price_panel(codes, start_date, end_date, fields=fields, aliases=aliases)
+
+        fields = list(fields)
+        unknown = [field for field in fields if field not in db.PRICE_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的价格字段: {unknown}，可选 {db.PRICE_FIELDS}")
+
+        all_dates = self._open_dates(meta)
+        lo = int(np.searchsorted(all_dates, str(start_date).encode(), side='left'))
+        hi = int(np.searchsorted(all_dates, str(end_date).encode(), side='right'))
+        span = max(hi - lo, 0)
+
+        def read(code, name, dtype, fill):
+            # 读出区间内的数据，超出该股票数组长度的部分按缺失处理
+            length = meta['symbols'][code]
+            values = np.full(span, fill, dtype=dtype)
+            if length > lo:
+                stored = self._open(self.root, code, name, dtype, length)[lo:min(hi, length)]
+                values[:len(stored)] = stored
+            return values
+
+        # 每只股票取第一个在区间内有数据的代码写法
+        codes = list(dict.fromkeys(codes))
+        resolved = {}
+        present = {}
+        for code in codes:
+            for alias in (aliases or {}).get(code) or db.code_aliases(code):
+                if alias not in meta['symbols']:
+                    continue
+                mask = read(alias, 'present.u1', np.uint8, 0).astype(bool)
+                if mask.any():
+                    resolved[code] = alias
+                    present[code] = mask
+                    break
+
+        # 只保留至少一只股票有记录的日期
+        rows = np.zeros(span, dtype=bool)
+        for mask in present.values():
+            rows |= mask
+        selected = np.flatnonzero(rows)
+
+        symbol_index = {code: j for j, code in enumerate(resolved)}
+        panels = {}
+        for field in fields:
+            panel = np.full((len(selected), len(symbol_index)), np.nan)
+            for code, j in symbol_index.items():
+                panel[:, j] = read(resolved[code], f'{field}.f8', np.float64, np.nan)[selected]
+            panels[field] = panel
+
+        return {
+            'dates': np.asarray(all_dates[lo:hi][selected]).astype(str),
+            'symbol_index': symbol_index,
+            'fields': panels,
+            'resolved': resolved
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_price_store():
+    """获取进程内共享的列式价格缓存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ColumnarPriceStore()
+    return _store
+
+
+def check_in_place_update():
+    """在临时数据库上检查：覆盖已有(code, date)的写入会使缓存过期，读取返回新的价格
+
+    不经过缓存直接调用database.save_stock_data_bulk覆盖一行，行数、最大日期和最大id都不变
+
+    Returns:
+        list: 检查失败的说明，全部通过时为空
+    """
+    failed = []
+    original_path = db.HEDGE_DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.connection_manager.close_all()
+        db.HEDGE_DB_PATH = os.path.join(tmp, 'check.db')
+        try:
+            store = ColumnarPriceStore(root=os.path.join(tmp, 'price_store'))
+            bars = {'date': ['20250422', '20250423'], 'open': [7.5, 7.5], 'high': [7.6, 7.6],
+                    'low': [7.4, 7.4], 'close': [7.5, 7.55], 'volume': [1000, 1000]}
+            db.save_stock_data_bulk(bars, code='CHECK.SH')
+            store.build()
+
+            bars['close'] = [7.5, 107.55]
+            db.save_stock_data_bulk(bars, code='CHECK.SH')
+            if store.is_fresh():
+                failed.append("原地覆盖已有的行后缓存仍被判定为最新")
+            close = store.get_price_panel(['CHECK.SH'], '20250423', '20250423')['fields']['close']
+            if close.size != 1 or close[0, 0] != 107.55:
+                failed.append(f"原地覆盖后读取到的收盘价为 {close.ravel().tolist()}，应为 [107.55]")
+
+            store.refresh()
+            if not store.is_fresh():
+                failed.append("重建后缓存仍被判定为过期")
+            close = store.get_price_panel(['CHECK.SH'], '20250423', '20250423')['fields']['close']
+            if close.size != 1 or close[0, 0] != 107.55:
+                failed.append(f"重建后读取到的收盘价为 {close.ravel().tolist()}，应为 [107.55]")
+        finally:
+            db.connection_manager.close_all()
+            db.HEDGE_DB_PATH = original_path
+    return failed
+
+
+def check_interleaved_write():
+    """在临时数据库上检查：其他写入方的提交夹在缓存的过期判断和写入之间时缓存保持过期
+
+    缓存只差这一次写入时追加后仍是最新；中间夹着其他写入方的行时不能被标记为最新，
+    读取回退到SQLite，两次写入的行都能读到
+
+    Returns:
+        list: 检查失败的说明，全部通过时为空
+    """
+    failed = []
+    original_path = db.HEDGE_DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.connection_manager.close_all()
+        db.HEDGE_DB_PATH = os.path.join(tmp, 'check.db')
+        try:
+            store = ColumnarPriceStore(root=os.path.join(tmp, 'price_store'))
+
+            def bars(date, close):
+                return {'date': [date], 'open': [close], 'high': [close], 'low': [close],
+                        'close': [close], 'volume': [1000]}
+
+            db.save_stock_data_bulk(bars('20250422', 7.5), code='CHECK.SH')
+            store.build()
+
+            store.save_stock_data(bars('20250423', 7.6), code='CHECK.SH')
+            if not store.is_fresh():
+                failed.append("缓存只差这一次写入时，追加后仍被判定为过期")
+
+            # 其他写入方恰好在这次写入之前提交一行
+            save_stock_data_bulk = db.save_stock_data_bulk
+
+            def interleaved(data, **kwargs):
+                save_stock_data_bulk(bars('20250424', 7.7), code='OTHER.SH')
+                return save_stock_data_bulk(data, **kwargs)
+
+            db.save_stock_data_bulk = interleaved
+            try:
+                store.save_stock_data(bars('20250425', 7.8), code='CHECK.SH')
+            finally:
+                db.save_stock_data_bulk = save_stock_data_bulk
+            if store.is_fresh():
+                failed.append("其他写入方的提交夹在中间时缓存仍被标记为最新")
+
+            panel = store.get_price_panel(['CHECK.SH', 'OTHER.SH'], '20250422', '20250425')
+            if sorted(panel['symbol_index']) != ['CHECK.SH', 'OTHER.SH'] or len(panel['dates']) != 4:
+                failed.append(f"读取到的股票为 {sorted(panel['symbol_index'])}、日期为 {list(panel['dates'])}，"
+                              f"应包含两只股票的4个日期")
+        finally:
+            db.connection_manager.close_all()
+            db.HEDGE_DB_PATH = original_path
+    return failed
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='重建列式价格缓存')
+    parser.add_argument('--check', action='store_true', help='在临时数据库上检查缓存的过期判断，不重建缓存')
+    args = parser.parse_args()
+
+    if args.check:
+        failed = check_in_place_update() + check_interleaved_write()
+        for message in failed:
+            print(f"❌ {message}")
+        if failed:
+            raise SystemExit(1)
+        print("✅ 原地更新和夹在中间的其他写入都会使缓存过期")
+    else:
+        get_price_store().build()
@@ -0,0 +1,117 @@
+import time
+import threading
+
+# 回放模式
+# realtime: 每个交易日等待seconds_per_day秒
+# speed: 按倍速回放，每个交易日等待 seconds_per_day / speed 秒
+# fast: 不等待，尽快回放
+REPLAY_MODES = ('realtime', 'speed', 'fast')
+
+
+class ReplayClock:
+    """执行系统回放的时钟
+
+    回放线程每处理完一个交易日调用一次wait_next()，由时钟决定等待多久。
+    其他线程可以随时切换模式、暂停、单步推进或停止，等待中的回放线程会立即响应
+    """
+
+    def __init__(self, mode='realtime', speed=1.0, seconds_per_day=1.0):
+        self._condition = threading.Condition()
+        self.seconds_per_day = seconds_per_day
+        self.mode = 'realtime'
+        self.speed = 1.0
+        self.set_mode(mode, speed)
+        self.paused = False
+        self.stopped = False
+        self._steps = 0  # 暂停时还允许推进的交易日数量
+
+    def set_mode(self, mode, speed=None):
+        """切换回放模式，speed只在speed模式下使用"""
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"不支持的回放模式: {mode}，可选 {REPLAY_MODES}")
+        if speed is not None and speed <= 0:
+            raise ValueError(f"回放倍速必须大于0: {speed}")
+
+        with self._condition:
+            self.mode = mode
+            if speed is not None:
+                self.speed = float(speed)
+            self._condition.notify_all()
+
+    @property
+    def interval(self):
+        """当前模式下每个交易日之间的等待秒数"""
+        if self.mode == 'fast':
+            return 0.0
+        if self.mode == 'speed':
+            return self.seconds_per_day / self.speed
+        return self.seconds_per_day
+
+    def reset(self):
+        """开始新的回放前清除暂停和停止状态"""
+        with self._condition:
+            self.paused = False
+            self.stopped = False
+            self._steps = 0
+            self._condition.notify_all()
+
+    def pause(self):
+        with self._condition:
+            self.paused = True
+            self._steps = 0
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            self.paused = False
+            self._steps = 0
+            self._condition.notify_all()
+
+    def step(self, days=1):
+        """暂停状态下再推进days个交易日，未暂停时先暂停"""
+        if days < 1:
+            raise ValueError(f"单步推进的交易日数量必须大于0: {days}")
+        with self._condition:
+            self.paused = True
+            self._steps += int(days)
+            self._condition.notify_all()
+
+    def stop(self):
+        with self._condition:
+            self.stopped = True
+            self._condition.notify_all()
+
+    def wait_next(self):
+        """等待到可以处理下一个交易日
+
+        Returns:
+            bool: False表示时钟已停止，回放应当结束
+        """
+        with self._condition:
+            deadline = time.monotonic() + self.interval
+            while not self.stopped:
+                if self.paused:
+                    if self._steps > 0:
+                        self._steps -= 1
+                        return True
+                    self._condition.wait()
+                    continue
+
+                # 等待期间切换模式或倍速时按新的间隔重新计算
+                deadline = min(deadline, time.monotonic() + self.interval)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._condition.wait(remaining)
+            return False
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'speed': self.speed,
+            'seconds_per_day': self.seconds_per_day,
+            'interval': self.interval,
+            'paused': self.paused,
+            'stopped': self.stopped,
+            'pending_steps': self._steps
+        }
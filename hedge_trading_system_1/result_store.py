@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+import database as db
+from config.config import RESULT_STORE_CONFIG
+
+# 回测结果缓存目录
+RESULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'backtest_results')
+
+# 结果文件格式版本，格式或回测逻辑变化时旧结果不再命中
+RESULT_FORMAT_VERSION = 1
+
+# 按列保存为float64数组的序列
+SERIES_COLUMNS = ('equity_curve', 'returns', 'drawdowns')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, complex):
+        return value.real
+    return str(value)
+
+
+def _dumps(value, **kwargs):
+    return json.dumps(value, ensure_ascii=False, default=_json_default, **kwargs)
+
+
+def run_fingerprint(backtest_config, strategy_config, mode, data_fingerprint=None):
+    """回测参数和价格数据的哈希，作为结果缓存的键
+
+    Args:
+        data_fingerprint: stock_data的标识，默认读取database.get_stock_data_fingerprint()
+    """
+    if data_fingerprint is None:
+        data_fingerprint = db.get_stock_data_fingerprint()
+    payload = _dumps({
+        'format': RESULT_FORMAT_VERSION,
+        'backtest': backtest_config,
+        'strategy': strategy_config,
+        'mode': mode,
+        'data': list(data_fingerprint)
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+
+class ResultStore:
+    """磁盘上的回测结果缓存
+
+    每次回测保存为两个文件：
+        <键>.npz    日期和权益、回报、回撤序列按列保存为数组，交易记录和指标为压缩的JSON
+        <键>.json   参数、指标和创建时间等摘要，列出和比较结果时只读这个文件
+
+    读取命中时更新文件的修改时间，总大小超过max_bytes时按修改时间删除最久未使用的结果
+    """
+
+    def __init__(self, root=RESULT_STORE_DIR, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes if max_bytes is not None else RESULT_STORE_CONFIG['max_bytes']
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, run_id, suffix):
+        # run_id来自请求参数，只允许十六进制字符，避免路径穿越
+        if not run_id or not all(c in '0123456789abcdef' for c in run_id):
+            raise ValueError(f"无效的回测结果id: {run_id}")
+        return os.path.join(self.root, run_id + suffix)
+
+    def save(self, run_id, params, results, dates, db_run_id=None):
+        """保存一次回测的结果
+
+        Args:
+            run_id: run_fingerprint的结果
+            params: 回测参数，保存在摘要中用于比较
+            results: Backtest.run()的返回值
+            dates: 与权益、回报和回撤序列对应的交易日
+            db_run_id: 这次回测在数据库中的run_id，交易记录和绩效数据按它查询
+        """
+        summary = {
+            'run_id': run_id,
+            'db_run_id': db_run_id,
+            'params': params,
+            'metrics': results.get('metrics', {}),
+            'total_trades': len(results.get('trades', [])),
+            'start_date': str(dates[0]) if len(dates) else None,
+            'end_date': str(dates[-1]) if len(dates) else None,
+            'created_at': time.time()
+        }
+        arrays = {column: np.asarray(results.get(column, []), dtype=np.float64) for column in SERIES_COLUMNS}
+        arrays['dates'] = np.asarray([str(date) for date in dates], dtype='S8')
+        arrays['trades'] = np.frombuffer(_dumps(results.get('trades', [])).encode('utf-8'), dtype=np.uint8)
+        arrays['metrics'] = np.frombuffer(_dumps(results.get('metrics', {})).encode('utf-8'), dtype=np.uint8)
+
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            # 先写临时文件再替换，读取方不会看到写了一半的结果
+            data_path = self._path(run_id, '.npz')
+            with open(data_path + '.tmp', 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            summary['bytes'] = os.path.getsize(data_path + '.tmp')
+            summary_path = self._path(run_id, '.json')
+            with open(summary_path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(_dumps(summary))
+            os.replace(data_path + '.tmp', data_path)
+            os.replace(summary_path + '.tmp', summary_path)
+            self._evict()
+
+        return summary
+
+    def load(self, run_id):
+        """读取回测结果，没有缓存时返回None
+
+        Returns:
+            dict: 与Backtest.run()的返回值相同，另外包含dates和run_id
+        """
+        path = self._path(run_id, '.npz')
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                results = {column: data[column].tolist() for column in SERIES_COLUMNS}
+                results['dates'] = data['dates'].astype(str).tolist()
+                results['trades'] = json.loads(data['trades'].tobytes().decode('utf-8'))
+                results['metrics'] = json.loads(data['metrics'].tobytes().decode('utf-8'))
+        except (OSError, KeyError, ValueError):
+            # 文件不存在、被淘汰或已损坏
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        results['run_id'] = run_id
+        return results
+
+    def get_series(self, run_id):
+        """缓存结果的日期、权益、每日回报和回撤序列，格式与Backtest.get_series()相同"""
+        results = self.load(run_id)
+        if results is None:
+            return None
+        dates = results['dates']
+        return {
+            'dates': dates,
+            'equity': results['equity_curve'][1:len(dates) + 1],
+            'returns': results['returns'][:len(dates)],
+            'drawdown': results['drawdowns'][:len(dates)]
+        }
+
+    def summary(self, run_id):
+        """读取结果摘要，没有缓存时返回None"""
+        try:
+            with open(self._path(run_id, '.json'), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+            summary['last_used_at'] = os.path.getmtime(self._path(run_id, '.npz'))
+        except (OSError, ValueError):
+            return None
+        return summary
+
+    def list_runs(self):
+        """所有缓存结果的摘要，最近使用的在前"""
+        if not os.path.isdir(self.root):
+            return []
+        runs = [self.summary(name[:-len('.npz')]) for name in os.listdir(self.root) if name.endswith('.npz')]
+        runs = [run for run in runs if run is not None]
+        runs.sort(key=lambda run: run['last_used_at'], reverse=True)
+        return runs
+
+    def compare(self, run_ids):
+        """比较多个结果的参数和指标
+
+        Returns:
+            dict: runs为各结果的摘要；params为取值不同的参数；metrics为各指标在每个结果中的取值
+        """
+        runs = []
+        for run_id in run_ids:
+            summary = self.summary(run_id)
+            if summary is None:
+                raise KeyError(run_id)
+            runs.append(summary)
+
+        def flatten(params):
+            flat = {}
+            for section, values in params.items():
+                if isinstance(values, dict):
+                    flat.update({f'{section}.{key}': value for key, value in values.items()})
+                else:
+                    flat[section] = values
+            return flat
+
+        flat_params = [flatten(run['params']) for run in runs]
+        param_names = sorted({name for params in flat_params for name in params})
+        differing = {}
+        for name in param_names:
+            values = [params.get(name) for params in flat_params]
+            if any(value != values[0] for value in values[1:]):
+                differing[name] = values
+
+        metric_names = sorted({name for run in runs for name in run['metrics']})
+        return {
+            'runs': runs,
+            'params': differing,
+            'metrics': {name: [run['metrics'].get(name) for run in runs] for name in metric_names}
+        }
+
+    def delete(self, run_id):
+        with self._lock:
+            return self._remove(run_id)
+
+    def _remove(self, run_id):
+        removed = False
+        for suffix in ('.npz', '.json'):
+            try:
+                os.remove(self._path(run_id, suffix))
+                removed = True
+            except OSError:
+                pass
+        return removed
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.npz'):
+                continue
+            run_id = name[:-len('.npz')]
+            size = 0
+            for suffix in ('.npz', '.json'):
+                try:
+                    size += os.path.getsize(self._path(run_id, suffix))
+                except OSError:
+                    pass
+            entries.append((os.path.getmtime(self._path(run_id, '.npz')), run_id, size))
+
+        total = sum(size for _, _, size in entries)
+        entries.sort()
+        # 至少保留最近写入的一个结果
+        for _, run_id, size in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self._remove(run_id)
+            total -= size
+
+    def stats(self):
+        runs = self.list_runs()
+        return {
+            'runs': len(runs),
+            'bytes': sum(run.get('bytes', 0) for run in runs),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """获取进程内共享的回测结果缓存"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore()
+    return _store
@@ -0,0 +1,59 @@
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# 工作进程中挂载的价格面板：(共享内存, 日期数组, 股票代码到列下标的字典, 价格面板)
+_worker_panel = None
+
+
+def _init_worker(shm_name, shape, panel_dates, symbol_index):
+    """工作进程初始化：挂载共享内存中的价格面板"""
+    global _worker_panel
+
+    # 共享内存由主进程创建和释放，工作进程只挂载
+    shm = shared_memory.SharedMemory(name=shm_name)
+    close_panel = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    close_panel.flags.writeable = False
+
+    # 保留shm的引用，防止共享内存被提前关闭
+    _worker_panel = (shm, np.asarray(panel_dates), symbol_index, close_panel)
+
+
+def get_worker_panel():
+    """在工作进程中获取共享的价格面板
+
+    Returns:
+        tuple: (日期数组, 股票代码到列下标的字典, 价格面板)，价格面板只读
+    """
+    if _worker_panel is None:
+        raise RuntimeError("当前进程没有挂载共享的价格面板，只能在shared_panel_executor创建的工作进程中调用")
+    _, panel_dates, symbol_index, close_panel = _worker_panel
+    return panel_dates, symbol_index, close_panel
+
+
+@contextmanager
+def shared_panel_executor(panel_dates, symbol_index, close_panel, max_workers=None):
+    """把价格面板放入共享内存，并创建挂载该面板的进程池
+
+    工作进程中用get_worker_panel()读取面板，参数扫描、滚动优化和股票对扫描共用
+
+    Args:
+        panel_dates: 面板的日期数组
+        symbol_index: 股票代码到面板列下标的字典
+        close_panel: 日期×股票 的价格面板
+        max_workers: 最大进程数，默认为CPU核数
+    """
+    close_panel = np.ascontiguousarray(close_panel, dtype=np.float64)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(close_panel.nbytes, 1))
+    try:
+        shared_panel = np.ndarray(close_panel.shape, dtype=np.float64, buffer=shm.buf)
+        shared_panel[:] = close_panel
+
+        initargs = (shm.name, close_panel.shape, list(panel_dates), symbol_index)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+            yield executor
+    finally:
+        shm.close()
+        shm.unlink()
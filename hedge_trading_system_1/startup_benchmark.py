@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# 导入app允许的最长时间（秒），取多次运行的中位数
+STARTUP_BUDGET_SECONDS = 1.0
+
+# 启动时不应加载的重量级模块，应在第一次使用时才导入
+DEFERRED_MODULES = ('yfinance', 'matplotlib')
+
+# 在新进程中导入app：禁止网络连接，记录导入耗时和已加载的模块
+_CHILD_CODE = '''
+import sys, json, time, socket
+
+def _blocked(*args, **kwargs):
+    raise OSError("启动过程中不允许访问网络")
+socket.socket.connect = _blocked
+socket.create_connection = _blocked
+
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'import_seconds': elapsed,
+    'loaded': [name for name in %r if name in sys.modules]
+}))
+'''
+
+
+def measure_startup(runs=5):
+    """在全新的进程中导入app若干次
+
+    Returns:
+        dict: import_seconds为每次导入耗时，loaded为启动时加载了的延迟模块
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', _CHILD_CODE % (DEFERRED_MODULES,)],
+            cwd=base_dir, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"导入app失败:\n{result.stderr}")
+        # 最后一行是结果，前面可能有应用自己的输出
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(report['import_seconds'])
+        loaded.update(report['loaded'])
+    return {'import_seconds': timings, 'loaded': sorted(loaded)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查应用启动耗时和启动时的副作用')
+    parser.add_argument('--runs', type=int, default=5, help='运行次数')
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS, help='允许的导入耗时中位数（秒）')
+    args = parser.parse_args()
+
+    try:
+        report = measure_startup(args.runs)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    median = statistics.median(report['import_seconds'])
+    print(f"导入app耗时: 中位数 {median:.3f}s，最大 {max(report['import_seconds']):.3f}s（{args.runs} 次，预算 {args.budget:.3f}s）")
+
+    failed = False
+    if median > args.budget:
+        print(f"❌ 启动耗时超过预算")
+        failed = True
+    if report['loaded']:
+        print(f"❌ 启动时加载了应延迟导入的模块: {report['loaded']}")
+        failed = True
+    if not failed:
+        print("✅ 启动检查通过")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
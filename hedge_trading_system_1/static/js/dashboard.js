@@ -308,7 +308,7 @@ function startExecution() {
             startExecutionEventSource();
             
             // 显示初始图表
-            const chartUrl = `static/execution_results.png?t=${new Date().getTime()}`;
+            const chartUrl = `/api/charts/execution.png?t=${new Date().getTime()}`;
             updateExecutionChart(chartUrl);
         } else {
             alert(`启动失败: ${data.message}`);
@@ -464,6 +464,14 @@ document.addEventListener('DOMContentLoaded', function() {
     checkExecutionStatus();
 });
 
+// 执行事件流在客户端合并出的当前状态
+const executionState = {
+    lastEventId: null,
+    chartTimer: null,
+    metrics: {},
+    trades: []
+};
+
 // 启动SSE连接
 function startExecutionEventSource() {
     // 如果已经存在连接，先关闭
@@ -471,48 +479,92 @@ function startExecutionEventSource() {
         window.executionEventSource.close();
     }
     
-    // 创建新连接
-    window.executionEventSource = new EventSource('/api/execution/progress');
-    
-    // 监听消息
-    window.executionEventSource.onmessage = function(event) {
-        try {
-            const data = JSON.parse(event.data);
-            console.log("收到SSE更新:", data);  // 添加日志
-            
-            // 更新进度
-            if (data.progress !== undefined) {
-                updateExecutionProgress(data.progress, data.date);
-            }
-            
-            // 更新指标
-            if (data.metrics) {
-                updateExecutionMetrics(data.metrics);
-            }
-            
-            // 更新交易记录
-            if (data.trades && data.trades.length > 0) {
-                updateExecutionTrades(data.trades);
+    // 创建新连接，手动重连时从上次收到的事件继续
+    let url = '/api/execution/progress';
+    if (executionState.lastEventId !== null) {
+        url += `?last_event_id=${encodeURIComponent(executionState.lastEventId)}`;
+    }
+    const source = new EventSource(url);
+    window.executionEventSource = source;
+    
+    // 注册事件处理函数，记录最后收到的事件版本号
+    function on(type, handler) {
+        source.addEventListener(type, function(event) {
+            try {
+                executionState.lastEventId = event.lastEventId;
+                handler(JSON.parse(event.data));
+            } catch (error) {
+                console.error("处理SSE消息时出错:", error, "原始数据:", event.data);
             }
-            
-            // 更新图表
-            if (data.chart_url) {
-                updateExecutionChart(data.chart_url);
+        });
+    }
+    
+    // 完整状态：新连接或错过的事件太多时收到
+    on('snapshot', function(state) {
+        executionState.metrics = state.metrics || {};
+        executionState.trades = state.trades || [];
+        updateExecutionProgress(state.progress, state.date);
+        if (state.metrics) {
+            updateExecutionMetrics(executionState.metrics);
+        }
+        updateExecutionTrades(executionState.trades);
+        updateExecutionChart(`/api/charts/execution.png?t=${executionState.lastEventId}`);
+    });
+    
+    // 新一轮执行开始
+    on('reset', function(state) {
+        executionState.metrics = state.metrics || {};
+        executionState.trades = [];
+        updateExecutionProgress(state.progress, state.date);
+        if (state.metrics) {
+            updateExecutionMetrics(executionState.metrics);
+        }
+        updateExecutionTrades([]);
+    });
+    
+    // 进度推进时刷新图表，图表在服务端按需渲染，最多每秒请求一次
+    on('progress', function(data) {
+        updateExecutionProgress(data.progress, data.date);
+        if (!executionState.chartTimer) {
+            executionState.chartTimer = setTimeout(function() {
+                executionState.chartTimer = null;
+                updateExecutionChart(`/api/charts/execution.png?t=${executionState.lastEventId}`);
+            }, 1000);
+        }
+    });
+    
+    // 只包含变化了的指标
+    on('metrics', function(changed) {
+        Object.assign(executionState.metrics, changed);
+        updateExecutionMetrics(executionState.metrics);
+    });
+    
+    // 新交易或状态变化的交易，只保留最近10条
+    on('trade', function(trade) {
+        const trades = executionState.trades;
+        const index = trades.findIndex(item => item.seq === trade.seq);
+        if (index >= 0) {
+            trades[index] = trade;
+        } else {
+            trades.push(trade);
+            if (trades.length > 10) {
+                trades.shift();
             }
-        } catch (error) {
-            console.error("处理SSE消息时出错:", error, "原始数据:", event.data);
         }
-    };
+        updateExecutionTrades(trades);
+    });
     
     // 监听错误
-    window.executionEventSource.onerror = function(error) {
+    source.onerror = function(error) {
         console.error('SSE连接错误:', error);
-        // 尝试重新连接
-        setTimeout(startExecutionEventSource, 5000);
+        // 浏览器会带着Last-Event-ID自动重连，连接被关闭时才手动重连
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(startExecutionEventSource, 5000);
+        }
     };
     
     // 监听连接打开
-    window.executionEventSource.onopen = function() {
+    source.onopen = function() {
         console.log("SSE连接已建立");
     };
 }
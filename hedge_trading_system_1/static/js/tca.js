@@ -165,7 +165,8 @@ function displayTCAChart(chartUrl) {
     
     // 添加时间戳以避免缓存
     const timestamp = new Date().getTime();
-    container.innerHTML = `<img src="${chartUrl}?t=${timestamp}" class="img-fluid" alt="交易成本分析图表">`;
+    const separator = chartUrl.includes('?') ? '&' : '?';
+    container.innerHTML = `<img src="${chartUrl}${separator}t=${timestamp}" class="img-fluid" alt="交易成本分析图表">`;
 }
 
 // 显示交易明细
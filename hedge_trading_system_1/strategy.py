@@ -1,12 +1,358 @@
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from datetime import datetime, timedelta
+import math
 import time
+from collections.abc import Mapping
 from config.config import STRATEGY_CONFIG
 import database as db
 
-# 使用yfinance获取数据
-import yfinance as yf
+def batch_pair_ratios(close_panel, index1, index2):
+    """计算所有股票对的价格比率矩阵
+
+    Args:
+        close_panel: 日期×股票 的收盘价矩阵，缺失为NaN
+        index1: 每个股票对中stock1在close_panel中的列下标数组
+        index2: 每个股票对中stock2在close_panel中的列下标数组
+
+    Returns:
+        numpy.ndarray: 形状为 (股票对数量, 日期数量) 的比率矩阵，任一价格缺失时为NaN
+    """
+    close_panel = np.asarray(close_panel, dtype=np.float64)
+    return (close_panel[:, index1] / close_panel[:, index2]).T
+
+
+def batch_ratio_stats(close_panel, index1, index2):
+    """一次计算所有股票对在整个日期区间上的比率均值和总体标准差
+
+    Returns:
+        tuple: (每个股票对的有效天数, 均值, 标准差)，没有数据的股票对均值和标准差为NaN
+    """
+    ratio = batch_pair_ratios(close_panel, index1, index2)
+    valid = ~np.isnan(ratio)
+    counts = valid.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(valid, ratio, 0.0).sum(axis=1) / counts
+        deviations = np.where(valid, ratio - means[:, None], 0.0)
+        stds = np.sqrt((deviations ** 2).sum(axis=1) / counts)
+
+    return counts, means, stds
+
+
+def batch_rolling_zscores(close_panel, index1, index2, lookback_period, skip_missing=False):
+    """一次向量化计算所有股票对的滚动均值、滚动标准差和z-score
+
+    默认与逐对使用pandas的rolling(window=lookback_period).mean()/std()一致：
+    窗口内有缺失值时结果为NaN，标准差使用ddof=1。窗口统计量由前缀和相减得到，
+    计算量与回溯期长度无关
+
+    skip_missing为True时窗口由最近lookback_period个两只股票都有价格的日期组成，
+    缺失的日期沿用之前最后一个有效日期的结果（ratio为该日期的比率）
+
+    Args:
+        close_panel: 日期×股票 的收盘价矩阵，缺失为NaN
+        index1: 每个股票对中stock1的列下标数组
+        index2: 每个股票对中stock2的列下标数组
+        lookback_period: 回溯期
+        skip_missing: 是否跳过缺失的日期
+
+    Returns:
+        dict: ratio、mean、std、z_score四个 (股票对数量, 日期数量) 的矩阵
+    """
+    ratio = batch_pair_ratios(close_panel, index1, index2)
+    pairs, days = ratio.shape
+    mean = np.full((pairs, days), np.nan)
+    std = np.full((pairs, days), np.nan)
+
+    if days >= lookback_period:
+        valid = ~np.isnan(ratio)
+
+        # 每个股票对先减去自身的均值，降低前缀和相减时的精度损失
+        with np.errstate(invalid='ignore', divide='ignore'):
+            center = np.where(valid, ratio, 0.0).sum(axis=1, keepdims=True) / valid.sum(axis=1, keepdims=True)
+        center = np.nan_to_num(center)
+        shifted = np.where(valid, ratio - center, 0.0)
+
+        zeros = np.zeros((pairs, 1))
+        counts = np.hstack([zeros, np.cumsum(valid, axis=1)]).astype(int)
+        sums = np.hstack([zeros, np.cumsum(shifted, axis=1)])
+        squares = np.hstack([zeros, np.cumsum(shifted ** 2, axis=1)])
+
+        if skip_missing:
+            # 按有效观测的序号重新排列前缀和：第m列为前m个有效观测的累计值
+            rows, columns = np.nonzero(valid)
+            order = counts[rows, columns + 1]
+            obs_sums = np.zeros((pairs, days + 1))
+            obs_squares = np.zeros((pairs, days + 1))
+            obs_ratio = np.full((pairs, days + 1), np.nan)
+            obs_sums[rows, order] = sums[rows, columns + 1]
+            obs_squares[rows, order] = squares[rows, columns + 1]
+            obs_ratio[rows, order] = ratio[rows, columns]
+
+            # 每个日期结尾的窗口：截至该日期的最近lookback_period个有效观测
+            last = counts[:, 1:]
+            first = np.maximum(last - lookback_period, 0)
+            full = last >= lookback_period
+            window_sums = np.take_along_axis(obs_sums, last, axis=1) - np.take_along_axis(obs_sums, first, axis=1)
+            window_squares = np.take_along_axis(obs_squares, last, axis=1) - np.take_along_axis(obs_squares, first, axis=1)
+            ratio = np.where(last > 0, np.take_along_axis(obs_ratio, last, axis=1), np.nan)
+            target = (slice(None), slice(None))
+        else:
+            # 以第lookback_period-1个日期起的每个日期结尾的窗口
+            window_counts = counts[:, lookback_period:] - counts[:, :-lookback_period]
+            window_sums = sums[:, lookback_period:] - sums[:, :-lookback_period]
+            window_squares = squares[:, lookback_period:] - squares[:, :-lookback_period]
+            full = window_counts == lookback_period
+            target = (slice(None), slice(lookback_period - 1, None))
+
+        window_means = window_sums / lookback_period
+        window_vars = np.maximum(window_squares - window_sums * window_means, 0.0) / (lookback_period - 1)
+
+        mean[target] = np.where(full, window_means + center, np.nan)
+        std[target] = np.where(full, np.sqrt(window_vars), np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_score = (ratio - mean) / np.where(std > 0, std, np.nan)
+
+    return {'ratio': ratio, 'mean': mean, 'std': std, 'z_score': z_score}
+
+
+def zscore_threshold_masks(z_scores, entry_threshold, exit_threshold):
+    """把z-score矩阵转换为开平仓条件的布尔掩码，NaN的位置全部为False
+
+    Returns:
+        dict: short_entry（z-score高于开仓阈值，做空stock1做多stock2）、
+              long_entry（z-score低于负的开仓阈值，做多stock1做空stock2）、
+              long_exit（多头仓位z-score回归到负的平仓阈值以上）、
+              short_exit（空头仓位z-score回归到平仓阈值以下）
+    """
+    z_scores = np.asarray(z_scores, dtype=np.float64)
+    return {
+        'short_entry': z_scores > entry_threshold,
+        'long_entry': z_scores < -entry_threshold,
+        'long_exit': z_scores >= -exit_threshold,
+        'short_exit': z_scores <= exit_threshold
+    }
+
+
+class PairStatsCache:
+    """基于价格面板的股票对统计量缓存
+
+    价格比率的前缀和以及滚动z-score按股票对（和回溯期）只计算一次，
+    日期区间相互重叠的多次回测（参数扫描、滚动优化）直接复用
+    """
+
+    def __init__(self, panel_dates, symbol_index, close_panel):
+        self.panel_dates = np.asarray(panel_dates)
+        self.symbol_index = symbol_index
+        self.close_panel = close_panel
+        self._ratio_sums = {}
+        self._zscores = {}
+
+    def _prefix_sums(self, stock1_code, stock2_code):
+        """价格比率的数量、和、平方和的前缀和"""
+        key = (stock1_code, stock2_code)
+        if key not in self._ratio_sums:
+            close1 = self.close_panel[:, self.symbol_index[stock1_code]]
+            close2 = self.close_panel[:, self.symbol_index[stock2_code]]
+            both_valid = ~(np.isnan(close1) | np.isnan(close2))
+
+            ratio = np.zeros(len(close1))
+            ratio[both_valid] = close1[both_valid] / close2[both_valid]
+
+            self._ratio_sums[key] = (
+                np.concatenate(([0], np.cumsum(both_valid))),
+                np.concatenate(([0.0], np.cumsum(ratio))),
+                np.concatenate(([0.0], np.cumsum(ratio ** 2)))
+            )
+        return self._ratio_sums[key]
+
+    def ratio_stats(self, stock1_code, stock2_code, start_date, end_date):
+        """计算日期区间内价格比率的均值和总体标准差
+
+        Returns:
+            tuple: (有效天数, 均值, 标准差)，没有数据时均值和标准差为None
+        """
+        if stock1_code not in self.symbol_index or stock2_code not in self.symbol_index:
+            return 0, None, None
+
+        counts, sums, squares = self._prefix_sums(stock1_code, stock2_code)
+        start = int(np.searchsorted(self.panel_dates, start_date, side='left'))
+        end = int(np.searchsorted(self.panel_dates, end_date, side='right'))
+
+        count = counts[end] - counts[start]
+        if count == 0:
+            return 0, None, None
+
+        mean = (sums[end] - sums[start]) / count
+        variance = max((squares[end] - squares[start]) / count - mean ** 2, 0.0)
+        return count, mean, variance ** 0.5
+
+    def rolling_zscores(self, index1, index2, lookback_period):
+        """整个价格面板上所有股票对的滚动统计量，跳过缺失的日期
+
+        Args:
+            index1: 每个股票对中stock1在价格面板中的列下标数组
+            index2: 每个股票对中stock2在价格面板中的列下标数组
+
+        Returns:
+            dict: batch_rolling_zscores(skip_missing=True)的结果
+        """
+        key = (np.asarray(index1).tobytes(), np.asarray(index2).tobytes(), lookback_period)
+        if key not in self._zscores:
+            self._zscores[key] = batch_rolling_zscores(self.close_panel, index1, index2, lookback_period,
+                                                       skip_missing=True)
+        return self._zscores[key]
+
+
+class MarketData(Mapping):
+    """按 日期×股票 矩阵保存的每日行情
+
+    各字段是行为日期、列为股票的二维数组，按日期和股票代码映射到整数下标查找，
+    不再为每个日期和股票生成字典。同时兼容原来 data[date][code]['close'] 的访问方式，
+    字典只在访问时临时生成
+    """
+
+    def __init__(self, dates, codes, fields):
+        """
+        Args:
+            dates: 升序的日期列表
+            codes: 股票代码列表
+            fields: 字段名到 len(dates)×len(codes) 数组的字典，必须包含close
+        """
+        self.dates = [str(date) for date in dates]
+        self.codes = list(codes)
+        self.date_index = {date: i for i, date in enumerate(self.dates)}
+        self.symbol_index = {code: j for j, code in enumerate(self.codes)}
+        self.fields = fields
+
+    def __getitem__(self, date):
+        return MarketDay(self, self.date_index[date])
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.date_index
+
+    def value(self, row, column, field='close'):
+        """按整数下标取值"""
+        return float(self.fields[field][row, column])
+
+    def close(self, date, code):
+        """指定日期和股票的收盘价，没有数据时返回None"""
+        row = self.date_index.get(date)
+        column = self.symbol_index.get(code)
+        if row is None or column is None:
+            return None
+        return float(self.fields['close'][row, column])
+
+    def panel(self, field, codes):
+        """按给定股票顺序取出字段矩阵，不存在的股票为NaN"""
+        values = np.full((len(self.dates), len(codes)), np.nan)
+        for k, code in enumerate(codes):
+            if code in self.symbol_index:
+                values[:, k] = self.fields[field][:, self.symbol_index[code]]
+        return values
+
+
+class MarketDay(Mapping):
+    """MarketData中某一天的行情，按股票代码访问"""
+
+    def __init__(self, market_data, row):
+        self.market_data = market_data
+        self.row = row
+
+    def __getitem__(self, code):
+        data = self.market_data
+        column = data.symbol_index[code]
+        bar = {'code': code, 'date': data.dates[self.row]}
+        for field, values in data.fields.items():
+            bar[field] = float(values[self.row, column])
+        return bar
+
+    def __iter__(self):
+        return iter(self.market_data.codes)
+
+    def __len__(self):
+        return len(self.market_data.codes)
+
+    def __contains__(self, code):
+        return code in self.market_data.symbol_index
+
+
+class RollingZScore:
+    """固定窗口的滚动均值和标准差，每加入一个新值O(1)更新并给出当前z-score
+
+    环形缓冲区保存窗口内的值，均值和离差平方和按Welford方法增量更新，
+    每滚动一整圈用缓冲区精确重算一次，避免浮点误差累积
+    """
+
+    def __init__(self, window):
+        if window < 2:
+            raise ValueError(f"滚动窗口长度必须大于1: {window}")
+        self.window = window
+        self.buffer = [0.0] * window
+        self.position = 0  # 下一个写入位置
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # 离差平方和
+        self.last = None
+
+    @property
+    def is_ready(self):
+        """窗口是否已经填满"""
+        return self.count == self.window
+
+    @property
+    def std(self):
+        """窗口内的样本标准差（ddof=1），窗口未满时为None"""
+        if not self.is_ready:
+            return None
+        return (max(self.m2, 0.0) / (self.window - 1)) ** 0.5
+
+    @property
+    def zscore(self):
+        """最新值的z-score，窗口未满或标准差为0时为None"""
+        std = self.std
+        if not std:
+            return None
+        return (self.last - self.mean) / std
+
+    def update(self, value):
+        """加入一个新值，窗口已满时同时移出最旧的值
+
+        Returns:
+            float: 当前z-score，窗口未满或标准差为0时为None
+        """
+        value = float(value)
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        else:
+            oldest = self.buffer[self.position]
+            old_mean = self.mean
+            self.mean += (value - oldest) / self.window
+            self.m2 += (value - oldest) * (value - self.mean + oldest - old_mean)
+
+        self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.window
+        self.last = value
+
+        # 每滚动一整圈精确重算一次，摊销后仍为O(1)
+        if self.position == 0 and self.is_ready:
+            self.mean = math.fsum(self.buffer) / self.window
+            self.m2 = math.fsum((v - self.mean) ** 2 for v in self.buffer)
+
+        return self.zscore
+
 
 class PairTradingStrategy:
     def __init__(self, config=None):
@@ -43,6 +389,8 @@ class PairTradingStrategy:
                 yf_code = self.convert_to_yf_code(code)
                 
                 # 获取数据
+                import yfinance as yf
+                from price_store import get_price_store
                 df_new = yf.download(
                     yf_code,
                     start=start_date,
@@ -70,8 +418,8 @@ class PairTradingStrategy:
                     # 转换日期格式
                     df_new['date'] = df_new['date'].dt.strftime('%Y%m%d')
                     
-                    # 保存到数据库
-                    db.save_stock_data(df_new)
+                    # 保存到数据库，同时追加到列式价格缓存
+                    get_price_store().save_stock_data(df_new)
                     
                     # 合并数据
                     if not df.empty:
@@ -92,7 +440,75 @@ class PairTradingStrategy:
             return code.split('.')[0] + '.SS'
         return code
     
-    def display_pairs_info(self):
+    def load_scanned_pairs(self, top_n=None):
+        """使用pair_universe表中最近一次扫描的股票对替换配置中的股票对
+
+        Args:
+            top_n: 只使用排名前top_n的股票对
+
+        Returns:
+            list: 当前使用的股票对列表，没有扫描结果时保持不变
+        """
+        universe = db.get_pair_universe(top_n=top_n)
+        if universe.empty:
+            print("没有股票对扫描结果，继续使用配置中的股票对")
+            return self.pairs
+
+        self.pairs = list(zip(universe['stock1_code'], universe['stock2_code']))
+        self.pair_stats = {}
+        print(f"已加载 {len(self.pairs)} 个扫描得到的股票对（扫描时间: {universe['scan_time'].iloc[0]}）")
+        return self.pairs
+
+    def get_pairs_coverage(self, years=3):
+        """统计每个股票对最近years年在本地价格数据中的覆盖情况
+
+        只读取数据库（或列式价格缓存），不访问网络
+
+        Returns:
+            list: 每个股票对一个字典，包含各自和共同的交易日数量、最早和最新日期，
+                  以及是否满足years年数据要求、是否有最近7天内的数据
+        """
+        from panel_cache import get_price_panel
+        
+        today = datetime.now()
+        start_date = (today - timedelta(days=365 * years)).strftime('%Y%m%d')
+        end_date = today.strftime('%Y%m%d')
+        latest_required = (today - timedelta(days=7)).strftime('%Y%m%d')  # 允许最多7天的滞后
+        required_days = 252 * years  # 假设每年约252个交易日
+        
+        codes = [code for pair in self.pairs for code in pair]
+        panel = get_price_panel(codes, start_date, end_date)
+        dates = panel['dates']
+        close = panel['fields']['close']
+        
+        def present(code):
+            j = panel['symbol_index'].get(code)
+            if j is None:
+                return np.zeros(len(dates), dtype=bool)
+            return ~np.isnan(close[:, j])
+        
+        report = []
+        for stock1_code, stock2_code in self.pairs:
+            mask1 = present(stock1_code)
+            mask2 = present(stock2_code)
+            common = dates[mask1 & mask2]
+            
+            report.append({
+                'pair': [stock1_code, stock2_code],
+                'stocks': [
+                    {'code': code, 'days': int(mask.sum()), 'latest_date': str(dates[mask][-1]) if mask.any() else None}
+                    for code, mask in ((stock1_code, mask1), (stock2_code, mask2))
+                ],
+                'common_days': len(common),
+                'earliest_common_date': str(common[0]) if len(common) else None,
+                'latest_common_date': str(common[-1]) if len(common) else None,
+                'enough_history': len(common) >= required_days,
+                'up_to_date': len(common) > 0 and str(common[-1]) >= latest_required
+            })
+        
+        return report
+    
+    def display_pairs_info(self, report=None):
         """显示选取的股票对及其共同有数据的连续3年时间范围"""
         print("选取的股票对:")
         for pair in self.pairs:
@@ -100,90 +516,37 @@ class PairTradingStrategy:
             print(f"- {stock1_code} 和 {stock2_code}")
         
         print("\n检查是否有最近3年的数据:")
-        three_years_ago = datetime.now() - timedelta(days=365*3)
-        today = datetime.now()
+        if report is None:
+            report = self.get_pairs_coverage()
         
-        for pair in self.pairs:
-            stock1_code, stock2_code = pair
+        for item in report:
+            stock1_code, stock2_code = item['pair']
+            if item['common_days'] == 0:
+                print(f"- {stock1_code} 和 {stock2_code}: 无法获取足够数据")
+                continue
             
-            try:
-                # 获取两只股票的数据
-                yf_code1 = self.convert_to_yf_code(stock1_code)
-                yf_code2 = self.convert_to_yf_code(stock2_code)
-                
-                # 获取第一只股票的数据
-                df1 = yf.download(
-                    yf_code1,
-                    start=three_years_ago,
-                    end=today,
-                    progress=False
-                )
-                
-                # 获取第二只股票的数据
-                df2 = yf.download(
-                    yf_code2,
-                    start=three_years_ago,
-                    end=today,
-                    progress=False
-                )
-                
-                # 检查数据量
-                if df1.empty or df2.empty:
-                    print(f"- {stock1_code} 和 {stock2_code}: 无法获取足够数据")
-                    continue
-                
-                # 重置索引，将日期列从索引转为普通列
-                df1 = df1.reset_index()
-                df2 = df2.reset_index()
-                
-                # 检查最新数据日期
-                latest_date1 = df1['Date'].max() if not df1.empty else None
-                latest_date2 = df2['Date'].max() if not df2.empty else None
-                
-                # 检查数据量是否足够3年
-                days_count1 = len(df1)
-                days_count2 = len(df2)
-                
-                # 找出共同的交易日
-                common_dates = set(df1['Date']).intersection(set(df2['Date']))
-                common_days_count = len(common_dates)
-                
-                # 检查最早的共同日期
-                earliest_common_date = min(common_dates) if common_dates else None
-                
-                print(f"- {stock1_code}:")
-                print(f"  - 数据量: {days_count1}个交易日")
-                print(f"  - 最新数据日期: {latest_date1}")
-                
-                print(f"- {stock2_code}:")
-                print(f"  - 数据量: {days_count2}个交易日")
-                print(f"  - 最新数据日期: {latest_date2}")
-                
-                print(f"- 共同数据:")
-                print(f"  - 共同交易日数量: {common_days_count}个交易日")
-                print(f"  - 最早共同日期: {earliest_common_date}")
-                print(f"  - 最新共同日期: {max(common_dates) if common_dates else None}")
-                
-                # 判断是否满足要求
-                three_years_days = 252 * 3  # 假设每年约252个交易日
-                if common_days_count >= three_years_days:
-                    print(f"  - 状态: ✅ 满足3年数据要求")
-                else:
-                    print(f"  - 状态: ❌ 不满足3年数据要求，仅有{common_days_count}个交易日")
-                
-                # 检查是否有最新的数据
-                latest_date = datetime.now() - timedelta(days=7)  # 允许最多7天的滞后
-                
-                if max(common_dates) if common_dates else None >= latest_date:
-                    print(f"  - 最新数据: ✅ 有最新数据")
-                else:
-                    print(f"  - 最新数据: ❌ 缺少最新数据，最新日期为{max(common_dates) if common_dates else None}")
-                
-                print("")
-                
-            except Exception as e:
-                print(f"- {stock1_code} 和 {stock2_code}: 获取数据失败 - {e}")
-                print("")
+            for stock in item['stocks']:
+                print(f"- {stock['code']}:")
+                print(f"  - 数据量: {stock['days']}个交易日")
+                print(f"  - 最新数据日期: {stock['latest_date']}")
+            
+            print(f"- 共同数据:")
+            print(f"  - 共同交易日数量: {item['common_days']}个交易日")
+            print(f"  - 最早共同日期: {item['earliest_common_date']}")
+            print(f"  - 最新共同日期: {item['latest_common_date']}")
+            
+            # 判断是否满足要求
+            if item['enough_history']:
+                print(f"  - 状态: ✅ 满足3年数据要求")
+            else:
+                print(f"  - 状态: ❌ 不满足3年数据要求，仅有{item['common_days']}个交易日")
+            
+            if item['up_to_date']:
+                print(f"  - 最新数据: ✅ 有最新数据")
+            else:
+                print(f"  - 最新数据: ❌ 缺少最新数据，最新日期为{item['latest_common_date']}")
+            
+            print("")
     
     def calculate_spread(self, stock1_data, stock2_data):
         """计算两只股票的价差"""
@@ -215,7 +578,23 @@ class PairTradingStrategy:
         # 获取最新的z-score和价格
         latest = merged_data.iloc[-1]
         return latest['z_score'], latest['close_1'], latest['close_2']
-    
+
+    def pair_index_arrays(self, symbol_index):
+        """把股票对映射为价格矩阵的列下标数组，两只股票都在symbol_index中的股票对才保留
+
+        Returns:
+            tuple: (股票对ID数组, stock1列下标数组, stock2列下标数组)
+        """
+        kept = [(pair_id, symbol_index[stock1_code], symbol_index[stock2_code])
+                for pair_id, (stock1_code, stock2_code) in enumerate(self.pairs)
+                if stock1_code in symbol_index and stock2_code in symbol_index]
+        if not kept:
+            empty = np.array([], dtype=int)
+            return empty, empty, empty
+
+        pair_ids, index1, index2 = (np.array(column, dtype=int) for column in zip(*kept))
+        return pair_ids, index1, index2
+
     def generate_signals(self, date_str=None, data=None):
         """生成交易信号"""
         signals = []
@@ -227,45 +606,43 @@ class PairTradingStrategy:
         # 调试信息
         print(f"处理日期: {date_str}, 可用股票数量: {len(data)}")
         
-        # 遍历所有股票对
-        for pair_id, pair in enumerate(self.pairs):
-            stock1_code, stock2_code = pair
-            
-            # 检查两只股票的数据是否都存在
-            if stock1_code not in data or stock2_code not in data:
-                continue
-            
-            stock1_data = data[stock1_code]
-            stock2_data = data[stock2_code]
-            
-            # 获取当前价格
-            stock1_price = stock1_data['close']
-            stock2_price = stock2_data['close']
-            
-            # 计算价格比率
-            price_ratio = stock1_price / stock2_price
-            
-            # 检查是否有足够的历史数据来计算均值和标准差
-            if pair_id not in self.pair_stats:
-                print(f"警告: 股票对 {pair_id} 没有统计数据")
-                continue
-            
-            mean = self.pair_stats[pair_id]['mean']
-            std = self.pair_stats[pair_id]['std']
-            
-            # 确保标准差不为零
-            if std <= 0.0001:
-                std = 0.0001
-            
-            # 计算z-score
-            z_score = (price_ratio - mean) / std
+        # 两只股票的数据都存在且有统计数据的股票对
+        symbol_index = {code: j for j, code in enumerate(data.keys())}
+        pair_ids, index1, index2 = self.pair_index_arrays(symbol_index)
+        has_stats = np.array([pair_id in self.pair_stats for pair_id in pair_ids], dtype=bool)
+        for pair_id in pair_ids[~has_stats]:
+            print(f"警告: 股票对 {pair_id} 没有统计数据")
+        pair_ids, index1, index2 = pair_ids[has_stats], index1[has_stats], index2[has_stats]
+        if len(pair_ids) == 0:
+            return signals
+        
+        # 所有股票对的z-score和开平仓条件一次算出
+        prices = np.array([[bar['close'] for bar in data.values()]], dtype=np.float64)
+        price_ratios = batch_pair_ratios(prices, index1, index2)[:, 0]
+        means = np.array([self.pair_stats[pair_id]['mean'] for pair_id in pair_ids], dtype=np.float64)
+        # 确保标准差不为零
+        stds = np.maximum([self.pair_stats[pair_id]['std'] for pair_id in pair_ids], 0.0001)
+        z_scores = (price_ratios - means) / stds
+        masks = zscore_threshold_masks(z_scores, self.entry_threshold, self.exit_threshold)
+        
+        in_position = np.array([pair_id in self.positions for pair_id in pair_ids], dtype=bool)
+        candidates = np.flatnonzero(masks['short_entry'] | masks['long_entry'] |
+                                    (in_position & (masks['long_exit'] | masks['short_exit'])))
+        
+        # 只遍历满足条件的股票对
+        for k in candidates:
+            pair_id = int(pair_ids[k])
+            stock1_code, stock2_code = self.pairs[pair_id]
+            stock1_price = data[stock1_code]['close']
+            stock2_price = data[stock2_code]['close']
+            z_score = float(z_scores[k])
             
             # 调试信息
             if abs(z_score) > 0.5:
                 print(f"股票对 {stock1_code}-{stock2_code} 的z-score: {z_score:.4f}")
             
             # 根据z-score生成交易信号
-            if z_score > self.entry_threshold:
+            if masks['short_entry'][k]:
                 # 价格比率高于阈值，做空stock1，做多stock2
                 print(f"生成做空信号: {stock1_code}-{stock2_code}, z-score={z_score:.4f}")
                 signals.append({
@@ -279,7 +656,7 @@ class PairTradingStrategy:
                     'position_type': 'short',
                     'timestamp': date_str
                 })
-            elif z_score < -self.entry_threshold:
+            elif masks['long_entry'][k]:
                 # 价格比率低于阈值，做多stock1，做空stock2
                 print(f"生成做多信号: {stock1_code}-{stock2_code}, z-score={z_score:.4f}")
                 signals.append({
@@ -297,7 +674,7 @@ class PairTradingStrategy:
                 # 检查是否需要平仓
                 position = self.positions[pair_id]
                 
-                if position['type'] == 'long' and z_score >= -self.exit_threshold:
+                if position['type'] == 'long' and masks['long_exit'][k]:
                     # 做多仓位，z-score回归，平仓
                     print(f"生成平仓信号(多头): {stock1_code}-{stock2_code}, z-score={z_score:.4f}")
                     signals.append({
@@ -311,7 +688,7 @@ class PairTradingStrategy:
                         'position_type': 'long',
                         'timestamp': date_str
                     })
-                elif position['type'] == 'short' and z_score <= self.exit_threshold:
+                elif position['type'] == 'short' and masks['short_exit'][k]:
                     # 做空仓位，z-score回归，平仓
                     print(f"生成平仓信号(空头): {stock1_code}-{stock2_code}, z-score={z_score:.4f}")
                     signals.append({
@@ -369,11 +746,12 @@ class PairTradingStrategy:
         """运行策略，生成交易信号"""
         return self.generate_signals()
     
-    def calculate_pair_stats(self, historical_data=None):
+    def calculate_pair_stats(self, historical_data=None, stats_cache=None):
         """计算每个股票对的统计数据
         
         Args:
             historical_data: 历史数据字典，如果为None则从数据库获取
+            stats_cache: PairStatsCache实例，提供时直接用前缀和得到历史数据日期区间内的统计量
             
         Returns:
             dict: 每个股票对的统计数据
@@ -381,6 +759,18 @@ class PairTradingStrategy:
         self.pair_stats = {}
         
         print("计算股票对统计数据...")
+
+        if stats_cache is not None and historical_data:
+            dates = sorted(historical_data.keys())
+            for pair_id, (stock1_code, stock2_code) in enumerate(self.pairs):
+                count, mean, std = stats_cache.ratio_stats(stock1_code, stock2_code, dates[0], dates[-1])
+                if count < self.lookback_period:
+                    print(f"警告: {stock1_code} 和 {stock2_code} 的数据不足 {self.lookback_period} 天")
+                    continue
+                self.pair_stats[pair_id] = {'mean': mean, 'std': std}
+
+            print(f"计算完成，共有 {len(self.pair_stats)} 个股票对的统计数据")
+            return self.pair_stats
         
         # 打印历史数据的第一个日期的所有股票代码，用于调试
         if historical_data is not None and len(historical_data) > 0:
@@ -389,6 +779,9 @@ class PairTradingStrategy:
             for code in historical_data[first_date].keys():
                 print(f"  - {code}")
         
+        # 使用历史数据的股票对最后一起计算：(股票对ID, stock1代码, stock2代码)
+        history_pairs = []
+        
         for pair_id, pair in enumerate(self.pairs):
             stock1_code, stock2_code = pair
             
@@ -415,33 +808,8 @@ class PairTradingStrategy:
                     stock1_code_use = stock1_code_std
                     stock2_code_use = stock2_code_std
                 
-                # 获取共同的日期
-                common_dates = set(historical_data.keys())
-                
-                if not common_dates:
-                    print(f"警告: {stock1_code} 和 {stock2_code} 没有共同的交易日")
-                    continue
-                
-                # 构建价格序列
-                dates = sorted(common_dates)
-                stock1_prices = []
-                stock2_prices = []
-                
-                for date in dates:
-                    if stock1_code_use in historical_data[date] and stock2_code_use in historical_data[date]:
-                        stock1_prices.append(historical_data[date][stock1_code_use]['close'])
-                        stock2_prices.append(historical_data[date][stock2_code_use]['close'])
-                
-                if len(stock1_prices) < self.lookback_period:
-                    print(f"警告: {stock1_code} 和 {stock2_code} 的数据不足 {self.lookback_period} 天")
-                    continue
-                
-                # 计算价格比率
-                price_ratios = [p1 / p2 for p1, p2 in zip(stock1_prices, stock2_prices)]
-                
-                # 计算均值和标准差
-                mean = sum(price_ratios) / len(price_ratios)
-                std = (sum((r - mean) ** 2 for r in price_ratios) / len(price_ratios)) ** 0.5
+                history_pairs.append((pair_id, stock1_code_use, stock2_code_use))
+                continue
             else:
                 # 从数据库获取数据
                 end_date = datetime.now().strftime('%Y%m%d')
@@ -481,9 +849,47 @@ class PairTradingStrategy:
             
             print(f"股票对 {stock1_code}-{stock2_code} 的统计数据: 均值={mean:.4f}, 标准差={std:.4f}")
         
+        if history_pairs:
+            self.calculate_history_pair_stats(historical_data, history_pairs)
+        
         print(f"计算完成，共有 {len(self.pair_stats)} 个股票对的统计数据")
         return self.pair_stats
     
+    def calculate_history_pair_stats(self, historical_data, history_pairs):
+        """把历史数据字典转换为 日期×股票 的价格矩阵，一次算出所有股票对的统计数据
+        
+        Args:
+            historical_data: 历史数据字典
+            history_pairs: (股票对ID, stock1代码, stock2代码) 的列表，代码为历史数据中使用的格式
+        """
+        codes = sorted({code for _, stock1_code, stock2_code in history_pairs for code in (stock1_code, stock2_code)})
+        symbol_index = {code: j for j, code in enumerate(codes)}
+        
+        # 缺失的价格用NaN表示
+        if isinstance(historical_data, MarketData):
+            close_panel = historical_data.panel('close', codes)
+        else:
+            close_panel = np.array([
+                [historical_data[date][code]['close'] if code in historical_data[date] else np.nan for code in codes]
+                for date in sorted(historical_data.keys())
+            ], dtype=np.float64)
+        
+        index1 = np.array([symbol_index[stock1_code] for _, stock1_code, _ in history_pairs], dtype=int)
+        index2 = np.array([symbol_index[stock2_code] for _, _, stock2_code in history_pairs], dtype=int)
+        counts, means, stds = batch_ratio_stats(close_panel, index1, index2)
+        
+        for (pair_id, stock1_code, stock2_code), count, mean, std in zip(history_pairs, counts, means, stds):
+            if count < self.lookback_period:
+                print(f"警告: {stock1_code} 和 {stock2_code} 的数据不足 {self.lookback_period} 天")
+                continue
+            
+            self.pair_stats[pair_id] = {
+                'mean': mean,
+                'std': std
+            }
+            
+            print(f"股票对 {stock1_code}-{stock2_code} 的统计数据: 均值={mean:.4f}, 标准差={std:.4f}")
+    
     def standardize_stock_code(self, code):
         """标准化股票代码格式，确保在数据库和回测系统中使用一致的格式"""
         
@@ -0,0 +1,238 @@
+import itertools
+import time
+import numpy as np
+from backtest import Backtest
+from strategy import PairTradingStrategy, PairStatsCache
+from shared_panel import shared_panel_executor, get_worker_panel
+from config.config import BACKTEST_CONFIG, STRATEGY_CONFIG
+
+# 可以扫描的策略参数
+SWEEP_PARAMS = ('lookback_period', 'entry_threshold', 'exit_threshold', 'stop_loss', 'position_size')
+
+# 需要同时传给回测引擎的参数（回测引擎默认不使用策略配置中的这两个值）
+BACKTEST_OVERRIDE_PARAMS = ('exit_threshold', 'stop_loss')
+
+# 数值越小越好的指标
+LOWER_IS_BETTER = ('max_drawdown',)
+
+# 工作进程中基于共享价格面板的股票对统计量缓存
+_worker_stats_cache = None
+
+
+def expand_param_range(spec):
+    """把参数范围展开为取值列表
+
+    Args:
+        spec: 取值列表，或包含start、stop、step的字典（包含stop），或单个值
+
+    Returns:
+        list: 参数取值列表
+    """
+    if isinstance(spec, dict):
+        start = spec['start']
+        stop = spec['stop']
+        step = spec.get('step', 1)
+        if step <= 0:
+            raise ValueError(f"参数范围的step必须大于0: {spec}")
+        # 加上半个步长以包含stop，并消除浮点误差
+        values = np.arange(start, stop + step / 2, step)
+        return [round(float(v), 10) for v in values]
+
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+
+    return [spec]
+
+
+def build_param_grid(param_ranges):
+    """根据各参数的取值范围生成所有参数组合
+
+    Args:
+        param_ranges: 参数名到取值范围的字典，参数名必须在SWEEP_PARAMS中
+
+    Returns:
+        list: 每个元素是一组参数的字典
+    """
+    unknown = [key for key in param_ranges if key not in SWEEP_PARAMS]
+    if unknown:
+        raise ValueError(f"不支持扫描的参数: {unknown}，可选参数为 {SWEEP_PARAMS}")
+
+    keys = list(param_ranges.keys())
+    values = [expand_param_range(param_ranges[key]) for key in keys]
+
+    grid = []
+    for combination in itertools.product(*values):
+        params = dict(zip(keys, combination))
+        if 'lookback_period' in params:
+            params['lookback_period'] = int(params['lookback_period'])
+        grid.append(params)
+
+    return grid
+
+
+def _get_worker_stats_cache(panel_dates, symbol_index, close_panel):
+    """工作进程内的股票对统计量缓存，同一进程内的多次回测复用"""
+    global _worker_stats_cache
+    if _worker_stats_cache is None or _worker_stats_cache.close_panel is not close_panel:
+        _worker_stats_cache = PairStatsCache(panel_dates, symbol_index, close_panel)
+    return _worker_stats_cache
+
+
+def _run_single(params, backtest_config, strategy_config, mode, include_returns=False):
+    """在工作进程中运行一组参数的回测
+
+    Args:
+        include_returns: 是否在结果中附带每日收益率
+    """
+    panel_dates, symbol_index, close_panel = get_worker_panel()
+    stats_cache = _get_worker_stats_cache(panel_dates, symbol_index, close_panel)
+
+    try:
+        backtest = Backtest(strategy_class=PairTradingStrategy, config=backtest_config, mode=mode,
+                            strategy_config=strategy_config, save_results=False)
+        backtest.set_price_panel(panel_dates, symbol_index, close_panel, stats_cache=stats_cache)
+        results = backtest.run()
+
+        metrics = {key: float(value) for key, value in results['metrics'].items()}
+        result = {'params': params, 'status': 'success', 'metrics': metrics}
+        if include_returns:
+            result['returns'] = [float(r) for r in results['returns']]
+        return result
+    except Exception as e:
+        return {'params': params, 'status': 'error', 'message': str(e)}
+
+
+def build_run_configs(params, backtest_config, strategy_config):
+    """把一组扫描参数合并到回测配置和策略配置中
+
+    Returns:
+        tuple: (回测配置, 策略配置)
+    """
+    run_strategy_config = dict(strategy_config)
+    run_strategy_config.update(params)
+
+    run_backtest_config = dict(backtest_config)
+    for key in BACKTEST_OVERRIDE_PARAMS:
+        if key in params:
+            run_backtest_config[key] = params[key]
+
+    return run_backtest_config, run_strategy_config
+
+
+def load_panel_for_grid(grid, backtest_config, strategy_config):
+    """按参数组合中最长的回溯期从数据库加载一次价格面板
+
+    Returns:
+        Backtest: 已加载价格面板的回测对象
+    """
+    panel_strategy_config = dict(strategy_config)
+    panel_strategy_config['lookback_period'] = max(
+        params.get('lookback_period', strategy_config['lookback_period']) for params in grid)
+    loader = Backtest(strategy_class=PairTradingStrategy, config=backtest_config,
+                      strategy_config=panel_strategy_config, save_results=False)
+    loader.load_price_panel()
+    return loader
+
+
+def run_parameter_sweep(param_ranges, backtest_config=None, strategy_config=None, mode='vectorized',
+                        max_workers=None, rank_by='sharpe_ratio', progress_callback=None):
+    """并行运行参数扫描
+
+    价格面板只从数据库加载一次并放入共享内存，所有工作进程只读共享
+
+    Args:
+        param_ranges: 参数名到取值范围的字典，参见build_param_grid
+        backtest_config: 回测配置，默认使用BACKTEST_CONFIG
+        strategy_config: 基础策略配置，默认使用STRATEGY_CONFIG
+        mode: 回测引擎模式
+        max_workers: 最大进程数，默认为CPU核数
+        rank_by: 用于排序的指标名称
+        progress_callback: progress_callback(progress, message)，每完成一组参数报告一次进度，
+                           抛出异常时取消尚未运行的组合并中断扫描
+
+    Returns:
+        dict: 按指标排序后的结果表以及运行信息
+    """
+    backtest_config = dict(backtest_config or BACKTEST_CONFIG)
+    strategy_config = dict(strategy_config or STRATEGY_CONFIG)
+
+    grid = build_param_grid(param_ranges)
+    if not grid:
+        return {'status': 'error', 'message': '参数组合为空', 'results': []}
+
+    print(f"开始参数扫描，共 {len(grid)} 组参数")
+    start_time = time.time()
+
+    # 按最长的回溯期加载一次价格面板，放入共享内存供所有工作进程只读使用
+    if progress_callback:
+        progress_callback(5, "加载历史数据...")
+    loader = load_panel_for_grid(grid, backtest_config, strategy_config)
+
+    with shared_panel_executor(loader.panel_dates, loader.symbol_index, loader.close_panel, max_workers) as executor:
+        futures = []
+        for params in grid:
+            run_backtest_config, run_strategy_config = build_run_configs(params, backtest_config, strategy_config)
+            futures.append(executor.submit(_run_single, params, run_backtest_config, run_strategy_config, mode))
+        results = collect_results(futures, progress_callback, (10, 95), "参数扫描进度")
+
+    ranked = rank_results(results, rank_by)
+    elapsed = time.time() - start_time
+    print(f"参数扫描完成，共 {len(grid)} 组参数，耗时 {elapsed:.2f} 秒")
+
+    return {
+        'status': 'success',
+        'rank_by': rank_by,
+        'total_runs': len(grid),
+        'failed_runs': len([r for r in results if r['status'] != 'success']),
+        'elapsed': elapsed,
+        'results': ranked
+    }
+
+
+def collect_results(futures, progress_callback=None, progress_range=(0, 100), message="进度"):
+    """按提交顺序收集进程池的结果，每完成一个报告一次进度
+
+    progress_callback抛出异常（例如任务被取消）时，取消所有尚未开始运行的future后重新抛出
+
+    Args:
+        futures: 按提交顺序排列的future列表
+        progress_callback: progress_callback(progress, message)，可以为None
+        progress_range: (起始进度, 结束进度)，按完成的数量线性分配
+        message: 进度消息的前缀
+
+    Returns:
+        list: 与futures顺序一致的结果
+    """
+    start, end = progress_range
+    results = []
+    try:
+        for done, future in enumerate(futures, start=1):
+            results.append(future.result())
+            if progress_callback:
+                progress_callback(start + int((end - start) * done / len(futures)), f"{message}: {done}/{len(futures)}")
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+def rank_results(results, rank_by='sharpe_ratio'):
+    """按指标对扫描结果排序，失败的组合排在最后
+
+    Returns:
+        list: 带有rank字段的结果列表
+    """
+    succeeded = [r for r in results if r['status'] == 'success']
+    failed = [r for r in results if r['status'] != 'success']
+
+    reverse = rank_by not in LOWER_IS_BETTER
+    succeeded.sort(key=lambda r: r['metrics'].get(rank_by, 0), reverse=reverse)
+
+    ranked = []
+    for rank, result in enumerate(succeeded, start=1):
+        ranked.append({'rank': rank, **result})
+    for result in failed:
+        ranked.append({'rank': None, **result})
+
+    return ranked
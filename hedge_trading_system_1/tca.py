@@ -1,22 +1,132 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib
-# 设置Matplotlib使用非交互式后端，避免线程问题
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import database as db
-# 添加中文字体支持
-from matplotlib import font_manager
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+from charts import get_chart_cache, series_payload, CHART_MAX_POINTS
+from config.config import TCA_CONFIG
+
+# 交易量和各项成本列
+COST_COLUMNS = ['volume', 'commission', 'slippage', 'market_impact', 'timing_cost', 'total_cost']
+
+# 每日成本序列包含的列
+COST_SERIES_COLUMNS = COST_COLUMNS + ['cost_ratio']
+
+
+def cost_metrics_from_sums(sums):
+    """由交易量和各项成本的合计计算成本比例和各项成本占总成本的比例
+
+    Args:
+        sums: {列名: 合计}，包含COST_COLUMNS中的列
+    """
+    total_volume = sums['volume']
+    if total_volume == 0:
+        return {
+            'avg_cost_ratio': 0,
+            'commission_pct': 0,
+            'slippage_pct': 0,
+            'market_impact_pct': 0,
+            'timing_cost_pct': 0
+        }
+    
+    total_cost = sums['total_cost']
+    
+    # 计算成本比例
+    avg_cost_ratio = total_cost / total_volume * 100
+    
+    # 计算各项成本占总成本的比例
+    commission_pct = sums['commission'] / total_cost * 100 if total_cost > 0 else 0
+    slippage_pct = sums['slippage'] / total_cost * 100 if total_cost > 0 else 0
+    market_impact_pct = sums['market_impact'] / total_cost * 100 if total_cost > 0 else 0
+    timing_cost_pct = sums['timing_cost'] / total_cost * 100 if total_cost > 0 else 0
+    
+    metrics = {
+        'avg_cost_ratio': avg_cost_ratio,
+        'commission_pct': commission_pct,
+        'slippage_pct': slippage_pct,
+        'market_impact_pct': market_impact_pct,
+        'timing_cost_pct': timing_cost_pct
+    }
+    
+    # 将NaN或无穷大值替换为0
+    for key, value in metrics.items():
+        if np.isnan(value) or np.isinf(value):
+            metrics[key] = 0
+    
+    return metrics
+
+
+class CostAggregator:
+    """交易成本的增量汇总
+
+    逐块加入交易记录，只保留记录数、各项成本的合计和按日期的合计，
+    内存占用与交易记录数无关（按日期的合计只与交易天数有关）。
+    汇总结果与把所有记录读入一个DataFrame后计算的结果相同
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(COST_COLUMNS, 0.0)
+        self.slippage_count = 0  # 滑点非空的记录数，用于计算平均滑点
+        self.daily = None        # 日期 -> 各项成本的合计
+
+    def add(self, chunk):
+        """加入一块交易记录，需要包含timestamp和COST_COLUMNS中的列"""
+        if chunk.empty:
+            return
+        costs = chunk[COST_COLUMNS].apply(pd.to_numeric, errors='coerce')
+        self.count += len(chunk)
+        for column in COST_COLUMNS:
+            self.sums[column] += costs[column].sum()
+        self.slippage_count += int(costs['slippage'].count())
+        
+        daily = costs.groupby(pd.to_datetime(chunk['timestamp']).dt.date).sum()
+        self.daily = daily if self.daily is None else self.daily.add(daily, fill_value=0)
+
+    def summary(self):
+        """与TCA.analyze_trades的返回值相同"""
+        return {
+            'total_trades': self.count,
+            'total_volume': self.sums['volume'],
+            'total_commission': self.sums['commission'],
+            'avg_slippage': self.sums['slippage'] / self.slippage_count if self.slippage_count else np.nan,
+            'implementation_shortfall': self.sums['total_cost'],
+            'market_impact': self.sums['market_impact'],
+            'timing_cost': self.sums['timing_cost']
+        }
+
+    def cost_metrics(self):
+        """与TCA.get_cost_metrics的返回值相同"""
+        return cost_metrics_from_sums(self.sums)
+
+    def daily_costs(self):
+        """与TCA.daily_costs的返回值相同"""
+        if self.daily is None:
+            return pd.DataFrame(columns=['timestamp'] + COST_SERIES_COLUMNS)
+        daily_costs = self.daily.sort_index()
+        daily_costs.index.name = 'timestamp'
+        daily_costs = daily_costs.reset_index()
+        daily_costs['cost_ratio'] = daily_costs['total_cost'] / daily_costs['volume'] * 100
+        return daily_costs
+
 
 class TCA:
-    def __init__(self, start_date=None, end_date=None):
-        """初始化交易成本分析"""
+    def __init__(self, start_date=None, end_date=None, run_id=None, streaming=None, chunk_size=None):
+        """初始化交易成本分析
+
+        Args:
+            run_id: 只分析这次回测或执行的交易记录，为None时分析所有运行
+            streaming: 为True时分块读取交易记录并累计汇总，内存占用不随交易记录数增长，
+                       交易明细只返回最近的TCA_CONFIG['detail_limit']条；
+                       为None时交易记录数超过TCA_CONFIG['stream_threshold']才使用流式分析
+            chunk_size: 流式分析每次读取的记录数，默认为TCA_CONFIG['chunk_size']
+        """
         self.start_date = start_date
         self.end_date = end_date
+        self.run_id = run_id
+        self.streaming = streaming
+        self.chunk_size = chunk_size or TCA_CONFIG['chunk_size']
         self.trades = None
+        self.aggregator = None
         self.progress_callback = None
     
     def run(self):
@@ -30,7 +140,7 @@ class TCA:
         # 加载交易数据
         self.load_trades()
         
-        if self.trades is None or len(self.trades) == 0:
+        if self.trade_count() == 0:
             print("没有找到交易数据")
             return {
                 'status': 'error',
@@ -54,13 +164,6 @@ class TCA:
         # 分析交易成本
         metrics = self.analyze_trades()
         
-        # 报告进度：生成图表
-        if hasattr(self, 'progress_callback') and self.progress_callback:
-            self.progress_callback(70, "生成图表...")
-        
-        # 生成图表
-        chart_path = self.plot_cost_analysis()
-        
         # 获取成本指标
         cost_metrics = self.get_cost_metrics()
         
@@ -88,15 +191,28 @@ class TCA:
             'message': '交易成本分析完成',
             'metrics': all_metrics,
             'trade_details': self.trades.to_dict('records') if not self.trades.empty else [],
-            'chart_url': chart_path
+            'streaming': self.aggregator is not None
         }
     
+    def trade_count(self):
+        """已加载的交易记录数，流式分析时为汇总的记录数"""
+        if self.aggregator is not None:
+            return self.aggregator.count
+        return 0 if self.trades is None else len(self.trades)
+    
     def load_trades(self):
-        """加载交易数据"""
-        print(f"加载交易数据: {self.start_date} 至 {self.end_date}")
+        """加载交易数据，交易记录较多或指定streaming时分块汇总"""
+        if self.streaming is None:
+            count = db.count_trades(self.start_date, self.end_date, run_id=self.run_id)
+            self.streaming = count > TCA_CONFIG['stream_threshold']
+        if self.streaming:
+            self.load_trades_streaming()
+            return
+        
+        print(f"加载交易数据: {self.start_date} 至 {self.end_date}，运行 {self.run_id or '全部'}")
         
-        # 从数据库获取交易记录
-        trades_df = db.get_trades(self.start_date, self.end_date)
+        # 从数据库获取交易记录，指定run_id时只读取这次运行的记录
+        trades_df = db.get_trades(self.start_date, self.end_date, run_id=self.run_id)
         
         if trades_df.empty:
             print("警告: 没有找到交易数据")
@@ -114,8 +230,32 @@ class TCA:
         
         self.trades = trades_df
     
+    def load_trades_streaming(self):
+        """分块读取交易记录并累计汇总，只保留最近的交易作为明细"""
+        print(f"流式加载交易数据: {self.start_date} 至 {self.end_date}，运行 {self.run_id or '全部'}，每块 {self.chunk_size} 条")
+        
+        aggregator = CostAggregator()
+        for chunk in db.iter_trades(self.start_date, self.end_date, run_id=self.run_id,
+                                    columns=['timestamp'] + COST_COLUMNS, chunk_size=self.chunk_size):
+            aggregator.add(chunk)
+        self.aggregator = aggregator
+        print(f"汇总了 {aggregator.count} 条交易记录")
+        
+        trades_df = db.get_trades(self.start_date, self.end_date, run_id=self.run_id,
+                                  limit=TCA_CONFIG['detail_limit'])
+        if 'timestamp' in trades_df.columns:
+            trades_df['timestamp'] = pd.to_datetime(trades_df['timestamp'])
+        self.trades = trades_df
+    
     def analyze_trades(self):
         """分析交易成本"""
+        if self.aggregator is not None:
+            # 流式分析：汇总结果已经在读取时累计，明细只补充派生列
+            if not self.trades.empty:
+                self.trades['cost_ratio'] = self.trades['total_cost'] / self.trades['volume'] * 100
+                self.trades['implementation_shortfall'] = self.trades['total_cost']
+            return self.aggregator.summary()
+        
         if self.trades.empty:
             return {
                 'total_trades': 0,
@@ -201,11 +341,13 @@ class TCA:
         
         return result
     
-    def plot_cost_analysis(self, save_path='static/tca_analysis.png'):
-        """绘制交易成本分析图表"""
-        if self.trades.empty:
-            print("没有交易数据可供分析")
-            return save_path
+    def daily_costs(self):
+        """按日期汇总的交易量和各项成本，需要先调用analyze_trades"""
+        if self.aggregator is not None:
+            return self.aggregator.daily_costs()
+        
+        if self.trades is None or self.trades.empty:
+            return pd.DataFrame(columns=['timestamp'] + COST_SERIES_COLUMNS)
         
         # 确保时间戳列是日期时间格式
         if 'timestamp' not in self.trades.columns:
@@ -223,78 +365,31 @@ class TCA:
             'timing_cost': 'sum',
             'total_cost': 'sum'
         }).reset_index()
-        
-        # 确保有数据可以绘图
-        if len(daily_costs) == 0:
-            print("警告: 没有足够的数据生成每日成本图表")
-            # 创建一个简单的图表，显示没有数据
-            plt.figure(figsize=(10, 6))
-            plt.text(0.5, 0.5, '没有足够的数据生成图表', 
-                     horizontalalignment='center', verticalalignment='center',
-                     fontsize=14)
-            plt.tight_layout()
-            plt.savefig(save_path)
-            plt.close()
-            return save_path
-        
         daily_costs['cost_ratio'] = daily_costs['total_cost'] / daily_costs['volume'] * 100
+        return daily_costs
+    
+    def get_cost_series(self):
+        """每日成本序列，供/api/series接口和图表使用"""
+        daily_costs = self.daily_costs()
+        series = {'dates': [date.strftime('%Y%m%d') for date in daily_costs['timestamp']]}
+        for column in COST_SERIES_COLUMNS:
+            series[column] = daily_costs[column].tolist()
+        return series
+    
+    def plot_cost_analysis(self):
+        """绘制交易成本分析图表，返回图表文件路径"""
+        if self.trades.empty:
+            print("没有交易数据可供分析")
         
-        # 创建图表
-        fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(12, 15))
-        
-        # 绘制交易量和总成本
-        ax1.bar(daily_costs['timestamp'], daily_costs['volume'], alpha=0.7, label='交易量')
-        ax1_twin = ax1.twinx()
-        ax1_twin.plot(daily_costs['timestamp'], daily_costs['total_cost'], 'r-', label='总成本')
-        
-        # 设置标题和标签
-        ax1.set_title('每日交易量和总成本')
-        ax1.set_ylabel('交易量')
-        ax1_twin.set_ylabel('成本')
-        ax1.legend(loc='upper left')
-        ax1_twin.legend(loc='upper right')
-        
-        # 绘制成本比例
-        ax2.plot(daily_costs['timestamp'], daily_costs['cost_ratio'], 'g-', label='成本比例 (%)')
-        ax2.set_title('每日交易成本比例')
-        ax2.set_ylabel('成本比例 (%)')
-        ax2.legend()
-        
-        # 绘制成本构成
-        cost_components = daily_costs[['commission', 'slippage', 'market_impact', 'timing_cost']].copy()
-        cost_components.index = daily_costs['timestamp']
-
-        ax3.stackplot(cost_components.index, 
-                    cost_components['commission'], 
-                    cost_components['slippage'],
-                    cost_components['market_impact'],
-                    cost_components['timing_cost'],
-                    labels=['佣金', '滑点', '市场冲击', '时机成本'])
-        ax3.set_title('成本构成')
-        ax3.set_ylabel('成本')
-        ax3.legend()
-        
-        plt.tight_layout()
-        plt.savefig(save_path)
-        plt.close()
-        
-        return save_path
+        path, _ = get_chart_cache().render('costs', series_payload(self.get_cost_series(), CHART_MAX_POINTS, key='total_cost'))
+        return path
     
     def get_cost_metrics(self):
         """获取成本指标"""
-        if self.trades.empty:
-            return {
-                'avg_cost_ratio': 0,
-                'commission_pct': 0,
-                'slippage_pct': 0,
-                'market_impact_pct': 0,
-                'timing_cost_pct': 0
-            }
-        
-        # 计算总交易量
-        total_volume = self.trades['volume'].sum()
+        if self.aggregator is not None:
+            return self.aggregator.cost_metrics()
         
-        if total_volume == 0:
+        if self.trades.empty:
             return {
                 'avg_cost_ratio': 0,
                 'commission_pct': 0,
@@ -303,40 +398,5 @@ class TCA:
                 'timing_cost_pct': 0
             }
         
-        # 计算各项成本占比
-        total_cost = self.trades['total_cost'].sum()
-        commission_sum = self.trades['commission'].sum()
-        slippage_sum = self.trades['slippage'].sum()
-        market_impact_sum = self.trades['market_impact'].sum()
-        timing_cost_sum = self.trades['timing_cost'].sum()
-        
-        # 计算成本比例
-        avg_cost_ratio = total_cost / total_volume * 100
-        
-        # 计算各项成本占总成本的比例
-        commission_pct = commission_sum / total_cost * 100 if total_cost > 0 else 0
-        slippage_pct = slippage_sum / total_cost * 100 if total_cost > 0 else 0
-        market_impact_pct = market_impact_sum / total_cost * 100 if total_cost > 0 else 0
-        timing_cost_pct = timing_cost_sum / total_cost * 100 if total_cost > 0 else 0
-        
-        # 处理可能的NaN或无穷大值
-        metrics = {
-            'avg_cost_ratio': avg_cost_ratio,
-            'commission_pct': commission_pct,
-            'slippage_pct': slippage_pct,
-            'market_impact_pct': market_impact_pct,
-            'timing_cost_pct': timing_cost_pct
-        }
-        
-        # 将NaN或无穷大值替换为0
-        for key, value in metrics.items():
-            if np.isnan(value) or np.isinf(value):
-                metrics[key] = 0
-
-        return {
-            'avg_cost_ratio': avg_cost_ratio,
-            'commission_pct': commission_pct,
-            'slippage_pct': slippage_pct,
-            'market_impact_pct': market_impact_pct,
-            'timing_cost_pct': timing_cost_pct
-        }
\ No newline at end of file
+        # 计算交易量和各项成本的合计
+        return cost_metrics_from_sums({column: self.trades[column].sum() for column in COST_COLUMNS})
@@ -0,0 +1,207 @@
+import time
+import numpy as np
+from sweep import build_param_grid, build_run_configs, load_panel_for_grid, collect_results, rank_results, _run_single
+from shared_panel import shared_panel_executor
+from config.config import BACKTEST_CONFIG, STRATEGY_CONFIG
+
+
+def split_walk_forward_windows(trading_days, in_sample_days, out_of_sample_days, step_days=None):
+    """按交易日划分滚动的样本内/样本外窗口
+
+    每个窗口的样本外区间紧跟在样本内区间之后，窗口之间按step_days向前滚动。
+    最后一个样本外区间不足out_of_sample_days时截断到数据末尾
+
+    Args:
+        trading_days: 排好序的交易日列表
+        in_sample_days: 样本内交易日数量
+        out_of_sample_days: 样本外交易日数量
+        step_days: 窗口滚动的交易日数量，默认等于out_of_sample_days
+
+    Returns:
+        list: 每个窗口的日期区间字典
+    """
+    step_days = step_days or out_of_sample_days
+    if in_sample_days <= 0 or out_of_sample_days <= 0 or step_days <= 0:
+        raise ValueError("样本内、样本外和滚动步长的交易日数量必须大于0")
+
+    windows = []
+    start = 0
+    while start + in_sample_days < len(trading_days):
+        in_sample_end = start + in_sample_days - 1
+        out_of_sample_end = min(in_sample_end + out_of_sample_days, len(trading_days) - 1)
+        windows.append({
+            'window': len(windows) + 1,
+            'in_sample_start': trading_days[start],
+            'in_sample_end': trading_days[in_sample_end],
+            'out_of_sample_start': trading_days[in_sample_end + 1],
+            'out_of_sample_end': trading_days[out_of_sample_end]
+        })
+        start += step_days
+
+    return windows
+
+
+def summarize_returns(returns, initial_capital):
+    """根据拼接后的样本外每日收益率计算整体指标，计算方式与Backtest.calculate_metrics一致"""
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) == 0:
+        return {'total_return': 0, 'annual_return': 0, 'sharpe_ratio': 0, 'max_drawdown': 0}
+
+    equity = initial_capital * np.cumprod(1 + returns)
+    equity = np.concatenate(([initial_capital], equity))
+
+    total_return = equity[-1] / equity[0] - 1
+    annual_return = (equity[-1] / equity[0]) ** (252 / len(equity)) - 1
+    sharpe_ratio = np.mean(returns) / np.std(returns) * np.sqrt(252) if np.std(returns) > 0 else 0
+    peak = np.maximum.accumulate(equity)
+    max_drawdown = np.max((peak - equity) / peak)
+
+    return {
+        'total_return': float(total_return),
+        'annual_return': float(annual_return),
+        'sharpe_ratio': float(sharpe_ratio),
+        'max_drawdown': float(max_drawdown)
+    }
+
+
+def summarize_param_stability(windows, param_keys):
+    """统计每个参数在各窗口被选中的取值，用于判断参数是否稳定"""
+    stability = {}
+    for key in param_keys:
+        values = [w['best_params'][key] for w in windows if w.get('best_params')]
+        if not values:
+            continue
+        stability[key] = {'values': values, 'distinct': len(set(values))}
+        if all(isinstance(v, (int, float)) for v in values):
+            stability[key]['mean'] = float(np.mean(values))
+            stability[key]['std'] = float(np.std(values))
+    return stability
+
+
+def run_walk_forward(param_ranges, in_sample_days=252, out_of_sample_days=63, step_days=None,
+                     backtest_config=None, strategy_config=None, mode='vectorized',
+                     max_workers=None, rank_by='sharpe_ratio', progress_callback=None):
+    """运行滚动优化（walk-forward）
+
+    在每个样本内窗口上扫描参数并选出最优组合，再用该组合回测紧随其后的样本外窗口。
+    价格面板只加载一次并放入共享内存；所有窗口的样本内回测一起提交到进程池并发运行，
+    之后再并发运行所有样本外回测。同一工作进程内的回测共享PairStatsCache，
+    重叠窗口的价格比率统计量和滚动z-score不会重复计算
+
+    Args:
+        param_ranges: 参数名到取值范围的字典，参见sweep.build_param_grid
+        in_sample_days: 样本内交易日数量
+        out_of_sample_days: 样本外交易日数量
+        step_days: 窗口滚动的交易日数量，默认等于out_of_sample_days
+        backtest_config: 回测配置，start_date和end_date为整个滚动优化的区间
+        strategy_config: 基础策略配置，默认使用STRATEGY_CONFIG
+        mode: 回测引擎模式
+        max_workers: 最大进程数，默认为CPU核数
+        rank_by: 样本内选择最优参数的指标
+        progress_callback: progress_callback(progress, message)，每完成一次回测报告一次进度，
+                           抛出异常时取消尚未运行的回测并中断滚动优化
+
+    Returns:
+        dict: 每个窗口的最优参数和样本内外指标、拼接后的样本外指标以及参数稳定性统计
+    """
+    backtest_config = dict(backtest_config or BACKTEST_CONFIG)
+    strategy_config = dict(strategy_config or STRATEGY_CONFIG)
+
+    grid = build_param_grid(param_ranges)
+    if not grid:
+        return {'status': 'error', 'message': '参数组合为空', 'windows': []}
+
+    start_time = time.time()
+
+    # 整个区间的价格面板只加载一次，同时得到共同交易日用于划分窗口
+    if progress_callback:
+        progress_callback(5, "加载历史数据...")
+    loader = load_panel_for_grid(grid, backtest_config, strategy_config)
+    loader.set_price_panel(loader.panel_dates, loader.symbol_index, loader.close_panel)
+    loader.load_data()
+    trading_days = sorted(loader.data.keys())
+
+    windows = split_walk_forward_windows(trading_days, in_sample_days, out_of_sample_days, step_days)
+    if not windows:
+        return {'status': 'error', 'message': f'交易日数量不足，共 {len(trading_days)} 天', 'windows': []}
+
+    print(f"开始滚动优化，共 {len(windows)} 个窗口，每个窗口 {len(grid)} 组参数")
+
+    with shared_panel_executor(loader.panel_dates, loader.symbol_index, loader.close_panel, max_workers) as executor:
+        # 所有窗口的样本内参数扫描一起并发运行
+        in_sample_futures = []
+        for window in windows:
+            window_config = dict(backtest_config)
+            window_config['start_date'] = window['in_sample_start']
+            window_config['end_date'] = window['in_sample_end']
+
+            futures = []
+            for params in grid:
+                run_backtest_config, run_strategy_config = build_run_configs(params, window_config, strategy_config)
+                futures.append(executor.submit(_run_single, params, run_backtest_config, run_strategy_config, mode))
+            in_sample_futures.append(futures)
+
+        # 每个窗口选出最优参数后，并发运行样本外回测
+        out_of_sample_futures = []
+        all_in_sample = [future for futures in in_sample_futures for future in futures]
+        collect_results(all_in_sample, progress_callback, (10, 80), "样本内参数扫描进度")
+        for window, futures in zip(windows, in_sample_futures):
+            ranked = rank_results([future.result() for future in futures], rank_by)
+            best = ranked[0] if ranked and ranked[0]['status'] == 'success' else None
+            if best is None:
+                window['status'] = 'error'
+                window['message'] = '样本内没有成功的参数组合'
+                out_of_sample_futures.append(None)
+                continue
+
+            window['best_params'] = best['params']
+            window['in_sample_metrics'] = best['metrics']
+
+            window_config = dict(backtest_config)
+            window_config['start_date'] = window['out_of_sample_start']
+            window_config['end_date'] = window['out_of_sample_end']
+            run_backtest_config, run_strategy_config = build_run_configs(best['params'], window_config, strategy_config)
+            out_of_sample_futures.append(executor.submit(
+                _run_single, best['params'], run_backtest_config, run_strategy_config, mode, True))
+
+        collect_results([future for future in out_of_sample_futures if future is not None],
+                        progress_callback, (80, 95), "样本外回测进度")
+        out_of_sample_returns = []
+        for window, future in zip(windows, out_of_sample_futures):
+            if future is None:
+                continue
+            result = future.result()
+            if result['status'] != 'success':
+                window['status'] = 'error'
+                window['message'] = result['message']
+                continue
+
+            window['status'] = 'success'
+            window['out_of_sample_metrics'] = result['metrics']
+            out_of_sample_returns.extend(result['returns'])
+
+    succeeded = [w for w in windows if w['status'] == 'success']
+
+    # 样本外与样本内指标之比（walk-forward效率）
+    efficiency = None
+    if succeeded:
+        in_sample_mean = np.mean([w['in_sample_metrics'].get(rank_by, 0) for w in succeeded])
+        out_of_sample_mean = np.mean([w['out_of_sample_metrics'].get(rank_by, 0) for w in succeeded])
+        if in_sample_mean != 0:
+            efficiency = float(out_of_sample_mean / in_sample_mean)
+
+    elapsed = time.time() - start_time
+    print(f"滚动优化完成，共 {len(windows)} 个窗口，耗时 {elapsed:.2f} 秒")
+
+    return {
+        'status': 'success',
+        'rank_by': rank_by,
+        'total_windows': len(windows),
+        'failed_windows': len(windows) - len(succeeded),
+        'runs_per_window': len(grid),
+        'elapsed': elapsed,
+        'windows': windows,
+        'out_of_sample': summarize_returns(out_of_sample_returns, backtest_config['initial_capital']),
+        'efficiency': efficiency,
+        'param_stability': summarize_param_stability(succeeded, param_ranges.keys())
+    }